@@ -18,6 +18,8 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
+import contextlib
+
 from collections import namedtuple
 from enum import IntEnum
 
@@ -38,12 +40,16 @@ class _AchievementsManager(GObject.Object):
         'achievement-achieved': (
             GObject.SignalFlags.RUN_FIRST, None, (object, )
         ),
+        'points-restored': (
+            GObject.SignalFlags.RUN_FIRST, None, ()
+        ),
     }
 
     def __init__(self):
         self._achievements = {}
         self._empty_state_achievement = None
         self._points_per_skillset = {}
+        self._restoring_points = False
         super().__init__()
 
     def achieved(self, achievement, points_per_skillset=None):
@@ -92,6 +98,33 @@ class _AchievementsManager(GObject.Object):
     def get_achievements_achieved(self):
         return [a for a in self._achievements.values() if self.achieved(a)]
 
+    def get_points(self):
+        return self._points_per_skillset.copy()
+
+    @contextlib.contextmanager
+    def restoring_points(self):
+        '''Reset the points of the skillsets, to add them again in the block.
+
+        No achievement is given for the points added in the block, "points-restored" is
+        emitted at its end instead.
+        '''
+        for skillset in self._points_per_skillset:
+            self._points_per_skillset[skillset] = 0
+
+        self._restoring_points = True
+        try:
+            yield
+        finally:
+            self._restoring_points = False
+            self.emit('points-restored')
+
+    def restore_points(self, points_per_skillset):
+        '''Set the points of the skillsets saved before, without giving any achievement.'''
+        with self.restoring_points():
+            for skillset, points in points_per_skillset.items():
+                if skillset in self._points_per_skillset:
+                    self._points_per_skillset[skillset] = points
+
     def add_points(self, skillset, points, record_points=False):
         skillset = skillset.upper()
 
@@ -108,6 +141,9 @@ class _AchievementsManager(GObject.Object):
         logger.info('Skillset %s incremented by %r, now at %r', skillset, points,
                     self._points_per_skillset[skillset])
 
+        if self._restoring_points:
+            return
+
         for achievement in self._achievements.values():
             if skillset not in achievement.points_needed_per_skillset:
                 # Filter the achievements that won't get achieved by
@@ -139,6 +175,7 @@ class AchievementsDB(DictFromCSV):
 
     EMPTY_STATE_ID = 'empty-state'
     _manager = None
+    _content_table = 'achievements'
 
     def __init__(self):
         if self._manager:
@@ -0,0 +1,342 @@
+#
+# Copyright © 2020 Endless OS Foundation LLC.
+#
+# This file is part of clubhouse
+# (see https://github.com/endlessm/clubhouse).
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+'''Content pack with all the data of the CSV files, compiled at build time and read with mmap.
+
+This module must not depend on GObject introspection or on the generated config, since it
+is also used by the build tools.
+
+The file layout is:
+
+- A header: magic, format version, number of tables, offset of the blob and a SHA-256 hash
+  of everything that follows the header.
+- A directory with, for every table, its name, number of fields per entry, flags, number of
+  entries and the offset of its index.
+- The index of every table with, for every entry and field, the offset and length of the
+  field in the blob. The entries of sorted tables are sorted by their first field (the key),
+  so lookups are a binary search. Other tables keep the order of their CSV file.
+- A blob with all the fields encoded as UTF-8.
+'''
+
+import csv
+import datetime
+import hashlib
+import mmap
+import struct
+
+
+MAGIC = b'CHCP'
+FORMAT_VERSION = 2
+
+_HEADER = struct.Struct('<4sHHI32s')
+_TABLE = struct.Struct('<16sHHII')
+_FIELD = struct.Struct('<II')
+
+_TABLE_SORTED = 1 << 0
+
+STRINGS_FIELDS = ('key', 'txt', 'character_id', 'mood', 'sfx_sound', 'bg_sound')
+ITEMS_FIELDS = ('id', 'icon', 'icon_used', 'name', 'description')
+EPISODES_FIELDS = ('id', 'season', 'name', 'badge_x', 'badge_y', 'description')
+NEWS_FIELDS = ('date', 'character', 'image', 'image_href', 'text')
+ACHIEVEMENTS_FIELDS = ('id', 'name', 'description', 'skillset', 'points_needed')
+
+# The tables every content pack has: their fields and whether they're sorted by key.
+TABLES = {
+    'strings': (STRINGS_FIELDS, True),
+    'items': (ITEMS_FIELDS, False),
+    'episodes': (EPISODES_FIELDS, False),
+    'news': (NEWS_FIELDS, False),
+    'achievements': (ACHIEVEMENTS_FIELDS, False),
+}
+
+
+def normalize_string_row(csv_row):
+    '''Return a row of the quests strings CSV with all its fields normalized.'''
+    if len(csv_row) == 6:
+        key, txt, character_id, mood, sfx_sound, bg_sound = csv_row
+    else:
+        # TODO: Remove this when all the CSV files have 6 columns.
+        key, txt, character_id, mood, sfx_sound, bg_sound = (*csv_row, '')
+
+    return (key, txt.strip(), character_id.lower().strip(), mood.lower().strip(),
+            sfx_sound.lower().strip(), bg_sound.lower().strip())
+
+
+def read_strings_csv(csv_paths):
+    '''Read the quests strings CSV files in order, later files overriding earlier ones.'''
+    rows = {}
+    for csv_path in csv_paths:
+        with open(csv_path, 'r') as csv_file:
+            for row in csv.reader(csv_file):
+                row = normalize_string_row(row)
+                rows[row[0]] = row
+    return list(rows.values())
+
+
+def read_table_csv(csv_path, n_fields):
+    '''Read a CSV file with a header row, checking that all its rows have n_fields.'''
+    with open(csv_path, 'r') as csv_file:
+        reader = csv.reader(csv_file)
+        next(reader, [])
+        rows = []
+        for row in reader:
+            if len(row) != n_fields:
+                raise ValueError('{}:{}: row has {} fields, expected {}'.format(
+                    csv_path, reader.line_num, len(row), n_fields))
+            rows.append(tuple(row))
+        return rows
+
+
+def write_content_pack(path, tables):
+    '''Write a content pack with the given tables.
+
+    The tables are given as a dictionary of table names and lists of rows (tuples of
+    strings, the key first), and must be the ones in TABLES.
+    '''
+    directory = bytearray()
+    indexes = bytearray()
+    blob = bytearray()
+
+    indexes_offset = _HEADER.size + len(tables) * _TABLE.size
+    for name, rows in tables.items():
+        fields, is_sorted = TABLES[name]
+
+        if is_sorted:
+            rows = sorted(rows, key=lambda row: row[0])
+            for previous_row, row in zip(rows, rows[1:]):
+                if previous_row[0] == row[0]:
+                    raise ValueError('Table {} has a duplicated key: {!r}'.format(name, row[0]))
+
+        directory += _TABLE.pack(name.encode('utf-8'), len(fields),
+                                 _TABLE_SORTED if is_sorted else 0, len(rows),
+                                 indexes_offset + len(indexes))
+
+        for row in rows:
+            if len(row) != len(fields):
+                raise ValueError('Row {!r} of table {} has {} fields, expected {}'.format(
+                    row[0], name, len(row), len(fields)))
+            for field in row:
+                data = field.encode('utf-8')
+                indexes += _FIELD.pack(len(blob), len(data))
+                blob += data
+
+    content = directory + indexes + blob
+    with open(path, 'wb') as pack_file:
+        pack_file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(tables),
+                                     indexes_offset + len(indexes),
+                                     hashlib.sha256(content).digest()))
+        pack_file.write(content)
+
+
+class CatalogTable:
+    '''Read-only view of a table in a content pack.'''
+
+    def __init__(self, pack_map, blob_offset, name, n_fields, flags, n_entries, index_offset):
+        self._map = pack_map
+        self._blob_offset = blob_offset
+        self.name = name
+        self._n_fields = n_fields
+        self._n_entries = n_entries
+        self._index_offset = index_offset
+        self._entry = struct.Struct('<' + 'II' * n_fields)
+        self._entry_size = self._entry.size
+        self.is_sorted = bool(flags & _TABLE_SORTED)
+
+        if index_offset + n_entries * self._entry_size > blob_offset:
+            raise ValueError('The index of table {} is truncated'.format(name))
+
+    def __len__(self):
+        return self._n_entries
+
+    @property
+    def n_fields(self):
+        return self._n_fields
+
+    def _field_bytes(self, entry, field):
+        offset, length = _FIELD.unpack_from(self._map, self._index_offset +
+                                            entry * self._entry_size + field * _FIELD.size)
+        start = self._blob_offset + offset
+        return self._map[start:start + length]
+
+    def _find(self, key):
+        key = key.encode('utf-8')
+        low, high = 0, self._n_entries
+        while low < high:
+            middle = (low + high) // 2
+            if self._field_bytes(middle, 0) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def get_key(self, entry):
+        return self._field_bytes(entry, 0).decode('utf-8')
+
+    def _decode_fields(self, offsets, lengths):
+        # The fields are read from the blob with a single slice, which is also decoded at once
+        # when it's ASCII, since then the offsets of the bytes are the ones of the characters.
+        start = min(offsets)
+        end = max(offset + length for offset, length in zip(offsets, lengths))
+        data = self._map[self._blob_offset + start:self._blob_offset + end]
+        text = data.decode('utf-8')
+        if len(text) != len(data):
+            text = data
+        fields = [text[offset - start:offset - start + length]
+                  for offset, length in zip(offsets, lengths)]
+        if text is data:
+            fields = [field.decode('utf-8') for field in fields]
+        return fields
+
+    def get_row(self, entry):
+        index = self._entry.unpack_from(self._map, self._index_offset + entry * self._entry_size)
+        return tuple(self._decode_fields(index[0::2], index[1::2]))
+
+    def rows(self):
+        '''Return all the rows of the table, in order.'''
+        if self._n_entries == 0:
+            return []
+
+        n_values = self._n_entries * self._n_fields * 2
+        index = struct.unpack_from('<{}I'.format(n_values), self._map, self._index_offset)
+        fields = self._decode_fields(index[0::2], index[1::2])
+        return [tuple(fields[start:start + self._n_fields])
+                for start in range(0, len(fields), self._n_fields)]
+
+    def get(self, key):
+        '''Return the row for the given key, or None if it's not in the (sorted) table.'''
+        entry = self._find(key)
+        if entry < self._n_entries and self.get_key(entry) == key:
+            return self.get_row(entry)
+        return None
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get_keys_with_prefix(self, prefix):
+        '''Return the keys of the (sorted) table that start with the given prefix, in order.'''
+        encoded_prefix = prefix.encode('utf-8')
+        keys = []
+        entry = self._find(prefix)
+        while entry < self._n_entries:
+            key = self._field_bytes(entry, 0)
+            if not key.startswith(encoded_prefix):
+                break
+            keys.append(key.decode('utf-8'))
+            entry += 1
+        return keys
+
+    def keys(self):
+        for entry in range(self._n_entries):
+            yield self.get_key(entry)
+
+
+def _check_news_row(row):
+    datetime.date.fromisoformat(row[0].strip())
+
+
+def _check_achievements_row(row):
+    int(row[4])
+
+
+_ROW_CHECKS = {
+    'news': _check_news_row,
+    'achievements': _check_achievements_row,
+}
+
+
+class ContentPack:
+    '''Read-only view of a content pack.
+
+    The file is memory-mapped once and shared by all its tables, so only the pages actually
+    used are read.
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as pack_file:
+            self._map = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._map) < _HEADER.size:
+            raise ValueError('{} is not a content pack'.format(path))
+
+        magic, version, n_tables, blob_offset, self._hash = _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError('{} is not a content pack'.format(path))
+        if version != FORMAT_VERSION:
+            raise ValueError('{} has an unsupported content pack version: {}'.format(path,
+                                                                                  version))
+        if len(self._map) < blob_offset or \
+           blob_offset < _HEADER.size + n_tables * _TABLE.size:
+            raise ValueError('{} is truncated'.format(path))
+
+        self._tables = {}
+        for index in range(n_tables):
+            name, n_fields, flags, n_entries, index_offset = \
+                _TABLE.unpack_from(self._map, _HEADER.size + index * _TABLE.size)
+            name = name.rstrip(b'\0').decode('utf-8')
+            self._tables[name] = CatalogTable(self._map, blob_offset, name, n_fields, flags,
+                                              n_entries, index_offset)
+
+    @property
+    def content_hash(self):
+        return self._hash.hex()
+
+    def __contains__(self, name):
+        return name in self._tables
+
+    def get_table(self, name):
+        return self._tables[name]
+
+    def validate(self):
+        '''Check the whole content pack, returning a list with the problems found.'''
+        errors = []
+
+        if hashlib.sha256(self._map[_HEADER.size:]).digest() != self._hash:
+            errors.append('The content hash does not match')
+
+        for name, (fields, is_sorted) in TABLES.items():
+            table = self._tables.get(name)
+            if table is None:
+                errors.append('Table {} is missing'.format(name))
+                continue
+            if table.n_fields != len(fields) or table.is_sorted != is_sorted:
+                errors.append('Table {} has an unexpected format'.format(name))
+                continue
+
+            previous_key = None
+            check_row = _ROW_CHECKS.get(name)
+            for entry in range(len(table)):
+                try:
+                    row = table.get_row(entry)
+                    if check_row is not None:
+                        check_row(row)
+                except ValueError as e:
+                    errors.append('Entry {} of table {} is invalid: {}'.format(entry, name, e))
+                    continue
+
+                if is_sorted:
+                    if previous_key is not None and row[0] <= previous_key:
+                        errors.append('Table {} is not sorted at {!r}'.format(name, row[0]))
+                    previous_key = row[0]
+
+        return errors
+
+    def close(self):
+        self._map.close()
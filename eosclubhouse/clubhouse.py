@@ -1496,8 +1496,16 @@ class ClubhouseView(FixedLayerGroup):
         self._add_main_layer()
         self._add_info_tip_layer()
 
+        # The quest sets shown, so they are not added again when their episode becomes the
+        # current one after being loaded progressively.
+        self._shown_quest_sets = []
+
         self._app.quest_runner.connect('notify::current-episode',
                                        self._current_episode_changed_cb)
+        registry = libquest.Registry.get_or_create()
+        registry.connect('quest-sets-changed', self._quest_sets_changed_cb)
+        # The quest sets are added as they are loaded, see Registry.load_current_episode_async().
+        registry.connect('quest-set-added', self._quest_set_added_cb)
 
         self._setup_questsets()
         self.get_main_layer().bringup_fg()
@@ -1505,16 +1513,35 @@ class ClubhouseView(FixedLayerGroup):
         self.show_all()
 
     def _setup_questsets(self):
+        self._shown_quest_sets = []
         for quest_set in libquest.Registry.get_quest_sets():
-            button = self.get_main_layer().add_quest_set(quest_set)
-            self.get_layer(self.INFO_TIP_LAYER).add_info_tip(button)
+            self._add_quest_set(quest_set)
 
-    def _current_episode_changed_cb(self, _quest_runner, _value):
-        for child in self.get_children():
+    def _add_quest_set(self, quest_set):
+        self._shown_quest_sets.append(quest_set)
+        button = self.get_main_layer().add_quest_set(quest_set)
+        self.get_layer(self.INFO_TIP_LAYER).add_info_tip(button)
+
+    def _quest_set_added_cb(self, _registry, quest_set):
+        self._add_quest_set(quest_set)
+        self.get_main_layer().bringup_fg()
+
+    def _quest_sets_changed_cb(self, _registry):
+        for child in self.get_main_layer().get_children():
             if isinstance(child, CharacterButton):
                 child.destroy()
 
+        for child in self.get_layer(self.INFO_TIP_LAYER).get_children():
+            if isinstance(child, QuestSetInfoTip):
+                child.destroy()
+
         self._setup_questsets()
+        self.get_main_layer().bringup_fg()
+
+    def _current_episode_changed_cb(self, _quest_runner, _value):
+        if self._shown_quest_sets == libquest.Registry.get_quest_sets():
+            return
+        self._quest_sets_changed_cb(None)
 
     def get_main_layer(self):
         return self.get_layer(self.MAIN_LAYER_NAME)
@@ -1831,8 +1858,13 @@ class NewsView(Gtk.Box):
 
     __gtype_name__ = 'NewsView'
 
+    # The news items are only created when they're about to be scrolled into view, this
+    # many at a time.
+    NEWS_PAGE_SIZE = 10
+
     _news = Gtk.Template.Child()
     _news_box = Gtk.Template.Child()
+    _news_scrolled_window = Gtk.Template.Child()
     _left_spacing_box = Gtk.Template.Child()
 
     def __init__(self):
@@ -1841,6 +1873,12 @@ class NewsView(Gtk.Box):
         self._app_window = self._app.get_active_window()
         self._news_db = utils.NewsFeedDB()
         self._last_seen = None
+        self._news_until = None
+        self._news_shown = 0
+
+        adjustment = self._news_scrolled_window.get_vadjustment()
+        adjustment.connect('value-changed', self._news_adjustment_changed_cb)
+        adjustment.connect('changed', self._news_adjustment_changed_cb)
 
         self._populate()
         # The previous behaviour was intended to synchronize the user profile animation slider
@@ -1867,29 +1905,43 @@ class NewsView(Gtk.Box):
             self._app.quest_runner.try_running_quest(quest)
 
     def _populate_news(self):
-        for data in self._news_db.get_list():
+        for child in self._news_box.get_children():
+            child.destroy()
+
+        # Only the items already published are shown, unless debugging the news feed.
+        self._news_until = None if self._app.has_debug('newsfeed') else datetime.date.today()
+        self._news_shown = 0
+        self._add_news_page()
+
+    def _add_news_page(self):
+        items = self._news_db.get_latest_items(self._news_until, self._news_shown,
+                                               self.NEWS_PAGE_SIZE)
+        for data in items:
             item = NewsItem(data)
             item.connect('run-quest', self._on_news_item_run_quest)
             self._news_box.pack_start(item, True, False, 0)
+            item.show()
 
-    def _update_news_visivility(self):
-        today = datetime.date.today()
+        self._news_shown += len(items)
 
-        for child in self._news_box.get_children():
-            if (child.date <= today) or self._app.has_debug('newsfeed'):
-                child.show()
-            else:
-                child.hide()
+    def _news_adjustment_changed_cb(self, adjustment):
+        # Add the next page when getting close to the end, or if the items don't fill the view.
+        remaining = adjustment.get_upper() - adjustment.get_value() - adjustment.get_page_size()
+        if remaining < adjustment.get_page_size():
+            self._add_news_page()
 
-        now = datetime.datetime.now()
-        tomorrow = now + datetime.timedelta(days=1)
-        timeout = datetime.datetime.combine(tomorrow, datetime.time.min) - now
+    def _update_news_visivility(self):
+        today = datetime.date.today()
 
-        # Update news visibility one minute after midnight
-        GLib.timeout_add_seconds(timeout.total_seconds() + 60,
-                                 self._update_news_visivility)
+        # New items may have been published since the view was populated.
+        if self._news_until is not None and \
+           self._news_db.count_published(since=self._news_until, until=today) > 0:
+            self._populate_news()
 
-        return GLib.SOURCE_REMOVE
+        # Update the news visibility when the next items are published.
+        next_date = None if self._news_until is None else self._news_db.get_next_date(today)
+        boundaries = [] if next_date is None else [utils.get_day_start(next_date)]
+        utils.DateBoundaryScheduler.watch(self, boundaries, NewsView._update_news_visivility)
 
     def _user_box_size_allocate_cb(self, _user_box, allocation):
         self._sync_left_spacing_box_size()
@@ -1911,13 +1963,7 @@ class NewsView(Gtk.Box):
     def last_seen(self, value):
         self._last_seen = value
 
-        today = datetime.date.today()
-        count = 0
-
-        for child in self._news_box.get_children():
-            if value is None or (child.date <= today and child.date > value):
-                count = count + 1
-
+        count = self._news_db.count_published(since=value, until=datetime.date.today())
         if self.news_count != count:
             self.news_count = count
 
@@ -2028,6 +2074,7 @@ class AchievementsView(Gtk.Box):
         self._populate()
         self._manager.connect('achievement-achieved',
                               lambda _manager, achievement: self._give_achievement(achievement))
+        self._manager.connect('points-restored', self._points_restored_cb)
 
         self._event_box.connect('motion-notify-event', self._motion_notify_event_cb)
         self._event_box.connect('leave-notify-event', self._leave_notify_event_cb)
@@ -2066,7 +2113,19 @@ class AchievementsView(Gtk.Box):
         for achievement in self._manager.get_achievements_achieved():
             self._add_achievement(achievement)
 
+    def _points_restored_cb(self, _manager):
+        for item in self._achievements_flow_box.get_children():
+            if item.achievement is not self._manager.empty_state_achievement:
+                item.destroy()
+        self._populate()
+
     def _give_achievement(self, achievement):
+        # The achievements of the complete quests are given again while the episode is
+        # loaded, which can happen with the window shown, so only add them.
+        if not self._app.registry_loaded:
+            self._add_achievement(achievement)
+            return
+
         if self._app.use_inapp_notifications:
             self._inapp_popup_achievement_badge(achievement)
         else:
@@ -2626,12 +2685,16 @@ class QuestRunner(GObject.GObject):
         self._current_quest_notification = None
 
         self._gss = GameStateService()
-        self._gss_hander_id = self._gss.connect('changed',
-                                                lambda _gss: self.update_episode_if_needed())
+        self._episode_watch_blocks = 0
+        self._gss.watch('clubhouse.CurrentEpisode', self._current_episode_changed_cb)
 
         registry = libquest.Registry.get_or_create()
         registry.connect('schedule-quest', self._quest_scheduled_cb)
 
+    def _current_episode_changed_cb(self, _key):
+        if self._episode_watch_blocks == 0:
+            self.update_episode_if_needed()
+
     def stop_quest(self):
         self._cancel_ongoing_task()
         self._reset_scheduled_quest()
@@ -2669,14 +2732,14 @@ class QuestRunner(GObject.GObject):
     def connect_quest(self, quest):
         # Don't update the episode if we're running a quest; this is so we avoid reloading the
         # Clubhouse while running a quest if it changes the episode.
-        self._gss.handler_block(self._gss_hander_id)
+        self._episode_watch_blocks += 1
 
         quest.connect('message', self._quest_message_cb)
         quest.connect('dismiss-message', self._quest_dismiss_message_cb)
         quest.connect('item-given', self._quest_item_given_cb)
 
     def disconnect_quest(self, quest):
-        self._gss.handler_unblock(self._gss_hander_id)
+        self._episode_watch_blocks -= 1
         quest.disconnect_by_func(self._quest_message_cb)
         quest.disconnect_by_func(self._quest_dismiss_message_cb)
         quest.disconnect_by_func(self._quest_item_given_cb)
@@ -2805,6 +2868,7 @@ class QuestRunner(GObject.GObject):
         self.disconnect_quest(quest)
         self._reset_delayed_message()
         quest.save_conf()
+        libquest.Registry.save_snapshot()
 
         # Ensure we reset the running quest (only if we haven't started a different quest in the
         # meanwhile) quest and close any eventual message popups
@@ -3098,6 +3162,9 @@ class ClubhouseApplication(Gtk.Application):
         self._window = None
         self._debug = {}
         self._registry_loaded = False
+        self._registry_loading = False
+        self._registry_loaded_callbacks = []
+        self._alternative_quests_monitor = None
         self._suggesting_open = False
         self._session_mode = None
         self._cards_path = None
@@ -3123,6 +3190,8 @@ class ClubhouseApplication(Gtk.Application):
                              'Turn on debug in newsfeed, displaying all items.', None)
         self.add_main_option('quit', ord('x'), GLib.OptionFlags.NONE, GLib.OptionArg.NONE,
                              'Fully close the application', None)
+        self.add_main_option('validate-content', 0, GLib.OptionFlags.NONE, GLib.OptionArg.NONE,
+                             'Check that the content pack is valid and exit', None)
 
         self._init_style()
         InAppNotify.init_message()
@@ -3184,6 +3253,10 @@ class ClubhouseApplication(Gtk.Application):
     def extension_installed(self):
         return Desktop.is_hack_extension_installed(isEnabled=True)
 
+    @GObject.Property(type=bool, default=False)
+    def registry_loaded(self):
+        return self._registry_loaded
+
     def _init_style(self):
         css_file = Gio.File.new_for_uri('resource:///com/hack_computer/Clubhouse/gtk-style.css')
         css_provider = Gtk.CssProvider()
@@ -3195,14 +3268,17 @@ class ClubhouseApplication(Gtk.Application):
 
     @Performance.timeit
     def do_activate(self):
-        self._ensure_registry_loaded()
-        self._ensure_suggesting_open()
-
-        if not self._quest_runner_handler:
-            self._quest_runner_handler = self.quest_runner.connect('notify::running-quest',
-                                                                   self._running_quest_notify_cb)
+        # The window is shown right away and filled in as the episode is loaded, unless its
+        # autorun quest has to be run instead.
+        if not self._registry_loaded and (self._registry_loading or self.installing_extension or
+                                          not libquest.Registry.has_pending_autorun_quest()):
+            self._ensure_window()
+            self._show_and_focus_window()
+            self._ensure_registry_loaded_async(self._registry_loaded_on_activate_cb)
+            return
 
-        self.quest_runner.update_episode_if_needed()
+        self._ensure_registry_loaded()
+        self._setup_loaded_registry()
 
         # If the extension is not installed, we don't run the autorun quests
         if not self.extension_installed:
@@ -3216,6 +3292,19 @@ class ClubhouseApplication(Gtk.Application):
             self.show(Gdk.CURRENT_TIME)
             self._show_and_focus_window()
 
+    def _registry_loaded_on_activate_cb(self):
+        self._setup_loaded_registry()
+        self.show(Gdk.CURRENT_TIME)
+
+    def _setup_loaded_registry(self):
+        self._ensure_suggesting_open()
+
+        if not self._quest_runner_handler:
+            self._quest_runner_handler = self.quest_runner.connect('notify::running-quest',
+                                                                   self._running_quest_notify_cb)
+
+        self.quest_runner.update_episode_if_needed()
+
     def _run_episode_autorun_quest_if_needed(self):
         if self.installing_extension:
             return False
@@ -3231,10 +3320,16 @@ class ClubhouseApplication(Gtk.Application):
         return False
 
     def do_handle_local_options(self, options):
+        # This doesn't need a running instance, so check it before registering.
+        if options.contains('validate-content'):
+            errors = utils.ContentPackDB.validate()
+            for error in errors:
+                logger.error('Invalid content pack %s: %s', config.CONTENT_PACK, error)
+            return 1 if errors else 0
+
         self.register(None)
 
         if options.contains('list-quests'):
-            self._ensure_registry_loaded()
             self._list_quests()
             return 0
 
@@ -3259,6 +3354,7 @@ class ClubhouseApplication(Gtk.Application):
                 return 1
 
             GameStateService().reset()
+            libquest.Registry.reload_quests_conf()
             libquest.Registry.set_current_episode(episode_name)
             return 0
 
@@ -3332,6 +3428,20 @@ class ClubhouseApplication(Gtk.Application):
             action.connect('activate', callback, *callback_args)
             self.add_action(action)
 
+        # Parse the quests strings while the window and the animations are set up. Anything
+        # needing them before that waits for the parsing to finish.
+        utils.QuestStringCatalog.load_csv_async(config.QUESTS_STRINGS_DIR,
+                                                callback=self._quest_strings_loaded_cb)
+
+    def do_shutdown(self):
+        libquest.Registry.save_snapshot()
+        logger.debug('Game state reads: %(hits)d from the cache, %(misses)d from the service',
+                     GameStateService.get_cache_stats())
+        Gtk.Application.do_shutdown(self)
+
+    def _quest_strings_loaded_cb(self):
+        logger.debug('Quests strings loaded')
+
     def _badge_notification_action_cb(self, action, arg_variant):
         achievement_id, show = arg_variant.unpack()
 
@@ -3355,10 +3465,49 @@ class ClubhouseApplication(Gtk.Application):
 
     def _ensure_registry_loaded(self):
         if not self._registry_loaded:
-            Desktop.reload_dbus_config()
+            if not self._registry_loading:
+                Desktop.reload_dbus_config()
+            # This finishes the asynchronous load if there is one.
             libquest.Registry.load_current_episode()
             self._registry_loaded = True
 
+        self._ensure_alternative_quests_monitor()
+
+    def _ensure_registry_loaded_async(self, callback):
+        if self._registry_loaded:
+            callback()
+            return
+
+        self._registry_loaded_callbacks.append(callback)
+        if self._registry_loading:
+            return
+
+        self._registry_loading = True
+        Desktop.reload_dbus_config()
+        libquest.Registry.load_current_episode_async(self._registry_loaded_async_cb)
+
+    def _registry_loaded_async_cb(self, error):
+        self._registry_loading = False
+        callbacks = self._registry_loaded_callbacks
+        self._registry_loaded_callbacks = []
+
+        # The callbacks are not called for a registry half loaded, the next activation will
+        # try to load it again.
+        if error is not None:
+            return
+
+        self._registry_loaded = True
+        self._ensure_alternative_quests_monitor()
+
+        for callback in callbacks:
+            callback()
+
+    def _ensure_alternative_quests_monitor(self):
+        # Only quest designers have an alternative quests dir, so don't monitor it otherwise.
+        if (self._alternative_quests_monitor is None and
+                os.path.isdir(get_alternative_quests_dir())):
+            self._alternative_quests_monitor = libquest.AlternativeQuestsMonitor()
+
     def _ensure_suggesting_open(self):
         quest_sets = libquest.Registry.get_quest_sets()
         for quest_set in quest_sets:
@@ -3532,6 +3681,15 @@ class ClubhouseApplication(Gtk.Application):
 
     # D-Bus implementation
     def show(self, timestamp):
+        # The quests can't be run or offered with the episode half loaded, they are once it's
+        # loaded, see do_activate().
+        if not self._registry_loaded:
+            if self._registry_loading:
+                self._show_and_focus_window(int(timestamp))
+            else:
+                self.do_activate()
+            return None
+
         if not self._run_episode_autorun_quest_if_needed():
             self._show_and_focus_window(int(timestamp))
 
@@ -3604,18 +3762,26 @@ class ClubhouseApplication(Gtk.Application):
             'lock.OperatingSystemApp.2',
             'lock.OperatingSystemApp.3'
         ]
-        for key in keys:
-            gss.set_async(key, {'locked': False})
+        with gss.batch():
+            for key in keys:
+                gss.set_async(key, {'locked': False})
 
         # Launch the clubhouse window and the migration quest!
         # This quest can make the hack icon bounce
         self.quest_runner.run_quest_by_name(MIGRATION_QUEST)
 
     def _list_quests(self):
-        for quest_set in libquest.Registry.get_quest_sets():
-            print(quest_set.get_id())
-            for quest in quest_set.get_quests():
-                print('\t{}'.format(quest.get_id()))
+        quest_ids = libquest.Registry.get_quest_ids_from_manifest()
+        if quest_ids is None:
+            self._ensure_registry_loaded()
+            quest_ids = OrderedDict(
+                (quest_set.get_id(), [quest.get_id() for quest in quest_set.get_quests()])
+                for quest_set in libquest.Registry.get_quest_sets())
+
+        for quest_set_id, quest_set_quest_ids in quest_ids.items():
+            print(quest_set_id)
+            for quest_id in quest_set_quest_ids:
+                print('\t{}'.format(quest_id))
 
     def _setup_quest(self, episode_name, quest_id):
         # Only load the episode if it's not already loaded.
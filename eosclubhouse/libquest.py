@@ -22,23 +22,32 @@
 import asyncio
 import functools
 import glibcoro
+import heapq
+import importlib
+import importlib.util
+import itertools
 import os
 import pkgutil
 import shutil
 import subprocess
 import sys
+import weakref
 
 from collections import OrderedDict
-from datetime import date, datetime
+from datetime import date, timedelta
 from enum import Enum, IntEnum
+from types import MappingProxyType
 from eosclubhouse import config, logger
 from eosclubhouse.achievements import AchievementsDB
 from eosclubhouse.network import NetworkManager
+from eosclubhouse.questmanifest import QuestManifest
+from eosclubhouse.registrysnapshot import RegistrySnapshot, get_content_version
 from eosclubhouse.system import App, Desktop, GameStateService, Sound, ToolBoxCodeView, \
     UserAccount, Tour
-from eosclubhouse.utils import (get_alternative_quests_dir, get_flatpak_sandbox,
-                                ClubhouseState, MessageTemplate, Performance,
-                                QuestStringCatalog, convert_variant_arg, Version)
+from eosclubhouse.utils import (get_alternative_quests_dir, get_day_start, get_flatpak_sandbox,
+                                parse_date, ClubhouseState, CompiledMessageTemplate,
+                                DateBoundaryScheduler, Performance, QuestStringCatalog,
+                                convert_variant_arg, Version)
 from eosclubhouse import metrics
 from gi.repository import Gdk, Gio, Gtk, GObject, GLib
 
@@ -60,10 +69,86 @@ class Registry(GObject.GObject):
     _autorun_quest = None
     _singleton = None
 
+    # Quest classes replaced by reloading their modules, see reload_module().
+    _stale_quest_classes = weakref.WeakSet()
+
+    # The state of the episodes loaded before, so switching back to one of them doesn't
+    # import and construct its quests again, see _deactivate_episode(). At most
+    # _max_resident_episodes are kept besides the loaded one, evicting the least recently
+    # used ones.
+    _max_resident_episodes = int(os.environ.get('CLUBHOUSE_RESIDENT_EPISODES', 2))
+    _resident_episodes = OrderedDict()
+    _EPISODE_STATE = ['_loaded_episode', '_autorun_quest', '_quest_sets', '_quests_by_id',
+                      '_quest_set_by_quest', '_quest_set_by_character', '_quest_set_by_id',
+                      '_quest_set_by_pathway_name', '_quest_instances', '_loaded_modules',
+                      '_stale_quest_classes', '_constructed_quests', '_quest_dependents',
+                      '_offer_priorities', '_offer_candidates', '_offer_candidate_entries']
+
+    # Indexes of the registered quest sets and their quests, kept by _add_quest_set().
+    _quests_by_id = OrderedDict()
+    _quest_set_by_quest = {}
+    _quest_set_by_character = {}
+    _quest_set_by_id = {}
+    _quest_set_by_pathway_name = {}
+
+    # The constructed quests by id, and the quests depending on the completion of each quest
+    # (the reverse edges of the dependency graph) by its id, kept by _add_quest(). The
+    # dependents are dictionaries used as ordered sets.
+    _constructed_quests = {}
+    _quest_dependents = {}
+
+    # The game state of the dependencies of the loaded episode, watched by their id to follow
+    # the changes made by other processes or by resetting it, see _watch_dependency().
+    _dependency_watches = {}
+
+    # The quests that can be auto-offered (auto_offer, available and not complete), in a heap
+    # of [priority, count, quest] entries, ordered by their position in the quest sets, see
+    # _update_offer_candidate(). Removed entries have None as their quest, and the count
+    # keeps them from being compared with the entry that replaces them.
+    _offer_priorities = {}
+    _offer_candidates = []
+    _offer_candidate_entries = {}
+    _offer_counter = itertools.count()
+    _offer_source = 0
+
+    # The queued offers are held while quest sets are being loaded, until all of them are.
+    _loading_quest_sets = False
+    _offer_held = False
+
+    # All the quest classes defined, in definition order, and indexes of them by tag and by
+    # tag prefix, kept by _register_quest_class(). Dictionaries are used as ordered sets.
+    _quest_classes = {}
+    _quest_classes_by_tag = {}
+    _quest_classes_by_tag_prefix = {}
+
+    # The configuration of the quests being loaded, see _fetch_quests_conf().
+    _fetched_conf = {}
+
+    # The steps left of the episode being loaded, see load_current_episode_async().
+    _pending_episode_load = None
+
+    # The quest manifest generated at build time, see get_manifest().
+    _manifest = None
+    _manifest_opened = False
+
+    # The snapshot of the episode saved by the last run, used instead of the game state
+    # service when loading the episode until it's reconciled with it, see _open_snapshot().
+    _snapshot = None
+    _snapshot_opened = False
+
     __gsignals__ = {
         'schedule-quest': (
             GObject.SignalFlags.RUN_FIRST, None, (str, bool, int)
         ),
+        'quest-sets-changed': (
+            GObject.SignalFlags.RUN_FIRST, None, ()
+        ),
+        'quest-sets-loaded': (
+            GObject.SignalFlags.RUN_FIRST, None, ()
+        ),
+        'quest-set-added': (
+            GObject.SignalFlags.RUN_FIRST, None, (object,)
+        ),
     }
 
     def __init__(self):
@@ -99,47 +184,456 @@ class Registry(GObject.GObject):
     @classmethod
     @Performance.timeit
     def load(class_, quest_folder):
+        '''Load the quests and quest sets of a quest folder.
+
+        The loading is done in phases: importing the quest modules, fetching the
+        configuration of their quests, instantiating the quest sets registered by them (which
+        instantiate their quests), syncing the achievements of the complete quests and
+        finally emitting "quest-sets-loaded".
+        '''
+        for _step in class_._load_steps(quest_folder):
+            pass
+
+    @classmethod
+    def _load_steps(class_, quest_folder):
+        # A generator doing the work of load(), which yields after importing every quest
+        # module and after instantiating every quest set, see load_current_episode_async().
+        class_._loading_quest_sets = True
+        try:
+            yield from class_._load_quest_sets_steps(quest_folder)
+        finally:
+            class_._loading_quest_sets = False
+            if class_._offer_held:
+                class_._offer_held = False
+                class_.queue_offer_quest()
+        class_.get_or_create().emit('quest-sets-loaded')
+
+    @classmethod
+    def _load_quest_sets_steps(class_, quest_folder):
+        for modname in class_._get_quest_modules(quest_folder):
+            class_._import_quest_module(quest_folder, modname)
+            yield
+
+        quest_set_classes = class_._quest_sets_to_register
+        class_._quest_sets_to_register = []
+
+        class_._fetch_quests_conf([quest_class for quest_class
+                                   in class_._get_episode_quests_classes()
+                                   if quest_class not in class_._quest_instances])
+        quest_sets = []
+        try:
+            for quest_set_class in quest_set_classes:
+                quest_sets.append(class_._instantiate_quest_set(quest_set_class))
+                yield
+        finally:
+            class_._fetched_conf = {}
+        class_._sync_quests_from_conf(class_._get_quests_of_quest_sets(quest_sets))
+
+    @classmethod
+    def _get_quest_modules(class_, quest_folder):
+        manifest = class_._get_manifest_for_folder(quest_folder)
+        if manifest is not None:
+            return manifest.get_modules(os.path.basename(quest_folder))
+        return [modname for _unused, modname, _unused in pkgutil.walk_packages([quest_folder])]
+
+    @classmethod
+    @Performance.timeit
+    def _import_quest_module(class_, quest_folder, modname):
         parent_dir = os.path.dirname(quest_folder)
         if parent_dir in sys.path:
             parent_dir = None
         else:
             sys.path.append(parent_dir)
 
-        for _unused, modname, _unused in pkgutil.walk_packages([quest_folder]):
-            # Import the module with the episode name as its prefix to make sure we use the right
-            # quests when included them by name (without the episode prefix, we could end up
-            # including a quest that is not the right one if there are two quests with the same
-            # name across episodes that have been loaded).
+        try:
+            # Import the module with the episode name as its prefix to make sure we use the
+            # right quests when included them by name (without the episode prefix, we could
+            # end up including a quest that is not the right one if there are two quests with
+            # the same name across episodes that have been loaded).
             module_with_episode = os.path.basename(quest_folder) + '.' + modname
             __import__(module_with_episode)
             class_._loaded_modules.add(module_with_episode)
+        finally:
+            if parent_dir is not None:
+                del sys.path[sys.path.index(parent_dir)]
+
+    @classmethod
+    @Performance.timeit
+    def _fetch_quests_conf(class_, quest_classes):
+        # The quests take their configuration from here when they are instantiated, instead
+        # of getting it from the game state service each.
+        class_._fetched_conf = {}
+        keys_to_read = []
+        for quest_class in quest_classes:
+            key = quest_class._get_conf_key()
+            conf = class_.get_snapshot_quest_conf(quest_class.get_id())
+            if conf is None:
+                keys_to_read.append(key)
+            else:
+                class_._fetched_conf[key] = conf
 
-        for quest_set_class in class_._quest_sets_to_register:
-            quest_set = quest_set_class()
-            class_._quest_sets.append(quest_set)
-            logger.debug('QuestSet registered: %s', quest_set_class)
+        # The game state is read all at once, also the keys that will be read soon after:
+        # the items checked when a quest is completed and the news the clubhouse shows.
+        if keys_to_read:
+            keys_to_read.append('clubhouse.News')
+            for quest_class in quest_classes:
+                keys_to_read += quest_class.__items_on_completion__
 
-        # @todo: Prevent iterating twice.
-        for quest_set_class in class_._quest_sets_to_register:
-            quest_set = quest_set_class()
+        values = GameStateService().get_many(keys_to_read)
+        for quest_class in quest_classes:
+            key = quest_class._get_conf_key()
+            if key not in class_._fetched_conf:
+                class_._fetched_conf[key] = values[key] or {}
+
+    @classmethod
+    def pop_fetched_conf(class_, key):
+        '''Return the configuration fetched for a quest while loading, if any, only once.'''
+        return class_._fetched_conf.pop(key, None)
+
+    @classmethod
+    @Performance.timeit
+    def _instantiate_quest_set(class_, quest_set_class):
+        quest_set = quest_set_class()
+        class_._add_quest_set(quest_set)
+        logger.debug('QuestSet registered: %s', quest_set_class)
+        class_.get_or_create().emit('quest-set-added', quest_set)
+        return quest_set
+
+    @staticmethod
+    def _get_quests_of_quest_sets(quest_sets):
+        # A quest can be in more than one quest set, but it only has to be synced once.
+        quests = OrderedDict()
+        for quest_set in quest_sets:
             for quest in quest_set.get_quests():
-                quest.sync_from_conf()
+                quests[quest] = None
+        return list(quests)
 
-        if parent_dir is not None:
-            del sys.path[sys.path.index(parent_dir)]
-        class_._quest_sets_to_register = []
+    @classmethod
+    @Performance.timeit
+    def _sync_quests_from_conf(class_, quests):
+        if class_._snapshot is not None:
+            # The points given by the complete quests were saved with the snapshot.
+            AchievementsDB().manager.restore_points(class_._snapshot.achievement_points)
+            return
+
+        for quest in quests:
+            quest.sync_from_conf()
 
     @classmethod
-    def _reset(class_):
+    def get_manifest(class_):
+        '''Return the quest manifest of the shipped episodes, or None if it's not available.'''
+        if not class_._manifest_opened:
+            class_._manifest_opened = True
+            class_._manifest = class_._open_manifest()
+        return class_._manifest
+
+    @classmethod
+    def _open_manifest(class_):
+        if not os.path.exists(config.QUEST_MANIFEST):
+            return None
+
+        try:
+            return QuestManifest(config.QUEST_MANIFEST)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning('Could not open the quest manifest: %s', e)
+
+        return None
+
+    @classmethod
+    def _get_manifest_for_folder(class_, quest_folder):
+        # Only the shipped episodes are in the manifest, and only if their modules have not
+        # changed since it was generated.
+        episode_name = os.path.basename(quest_folder)
+        manifest = class_.get_manifest()
+        if (manifest is None or quest_folder != class_._get_episode_folder(episode_name) or
+                not manifest.is_up_to_date(episode_name, quest_folder)):
+            return None
+        return manifest
+
+    @classmethod
+    def get_quest_ids_from_manifest(class_):
+        '''Return the ids of the quests of every quest set of the current episode.
+
+        This reads the manifest instead of loading the episode, so it doesn't import any
+        quest module. None is returned if the manifest can't be used, e.g. when there are
+        quests in the alternative quests dir, since they are not in the manifest.
+        '''
+        episode_name = class_.get_current_episode()['name']
+        manifest = class_._get_manifest_for_folder(class_._get_episode_folder(episode_name))
+        if manifest is None or os.path.isdir(get_alternative_quests_dir()):
+            return None
+
+        return OrderedDict(
+            (quest_set['id'], [quest['id'] for quest in
+                               manifest.get_pathway_quests(episode_name, quest_set)])
+            for quest_set in manifest.get_quest_sets(episode_name))
+
+    @staticmethod
+    def _get_snapshot_path():
+        return os.path.join(GLib.get_user_cache_dir(), 'registry-snapshot.json')
+
+    @staticmethod
+    def _can_use_snapshot():
+        # The quests of the alternative quests dir are changed while they are written.
+        return not os.path.isdir(get_alternative_quests_dir())
+
+    @classmethod
+    def _open_snapshot(class_, episode_name):
+        '''Return the snapshot saved for the episode, if it's still valid.
+
+        It's only used for the first load of the process, which is the one the snapshot
+        makes faster, and the one that starts with no achievement points.
+        '''
+        if class_._snapshot_opened or not class_._can_use_snapshot():
+            return None
+        class_._snapshot_opened = True
+
+        snapshot = RegistrySnapshot.read(class_._get_snapshot_path())
+        content_version = get_content_version(class_._get_episode_folder(episode_name))
+        if (snapshot is None or
+                not snapshot.is_valid_for(config.PROJECT_VERSION, content_version, episode_name)):
+            return None
+
+        logger.debug('Using the snapshot of episode %s', episode_name)
+        return snapshot
+
+    @classmethod
+    def get_snapshot_quest_conf(class_, quest_id):
+        '''Return the configuration of a quest from the snapshot being used, if any.'''
+        if class_._snapshot is None:
+            return None
+        return class_._snapshot.get_quest_conf(quest_id)
+
+    @classmethod
+    def save_snapshot(class_):
+        '''Save the state of the loaded episode, to load it faster in the next run.'''
+        if class_._loaded_episode is None or not class_._can_use_snapshot():
+            return
+
+        episode_folder = class_._get_episode_folder(class_._loaded_episode)
+        snapshot = RegistrySnapshot(config.PROJECT_VERSION, get_content_version(episode_folder),
+                                    class_._loaded_episode,
+                                    achievement_points=AchievementsDB().manager.get_points())
+        for quest in class_._constructed_quests.values():
+            snapshot.add_quest(quest.get_id(), quest.conf)
+
+        try:
+            snapshot.write(class_._get_snapshot_path())
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning('Could not save the registry snapshot: %s', e)
+
+    @classmethod
+    @Performance.timeit
+    def _reconcile_snapshot(class_):
+        '''Update the quests whose configuration has changed since the snapshot was saved.'''
+        snapshot = class_._snapshot
+        class_._snapshot = None
+        if snapshot is None:
+            return GLib.SOURCE_REMOVE
+
+        quests = list(class_._constructed_quests.values())
+        confs = GameStateService().get_many([quest._get_conf_key() for quest in quests])
+        changed = False
+        for quest in quests:
+            key = quest._get_conf_key()
+            conf = confs[key] or {}
+            if conf == snapshot.get_quest_conf(quest.get_id()):
+                continue
+
+            logger.debug('Quest %s changed since the snapshot', quest)
+            changed = True
+            class_._fetched_conf = {key: conf}
+            try:
+                quest.load_conf()
+            finally:
+                class_._fetched_conf = {}
+            quest._update_is_new()
+
+        # The points restored from the snapshot are given again by the quests complete now,
+        # also if some of them are not complete anymore.
+        if changed:
+            manager = AchievementsDB().manager
+            with manager.restoring_points():
+                for quest in class_._get_quests_of_quest_sets(class_._quest_sets):
+                    quest.sync_from_conf()
+
+        # Changing the completion of a quest updates its dependents, but the completion of
+        # the dependencies that are not constructed was also taken from the snapshot.
+        for quest in quests:
+            if any(dependency not in class_._constructed_quests
+                   for dependency in quest.get_dependency_quests()):
+                quest._update_availability()
+
+        return GLib.SOURCE_REMOVE
+
+    @classmethod
+    def _clear_loaded_episode(class_):
         class_._loaded_episode = None
+        class_._snapshot = None
         class_._autorun_quest = None
         class_._quest_sets_to_register = []
-        class_._quest_sets = []
+        class_._set_quest_sets([])
         class_._quest_instances = {}
-        for module in class_._loaded_modules:
-            del sys.modules[module]
+        class_._constructed_quests = {}
+        class_._quest_dependents = {}
+        class_._dependency_watches = {}
+        class_._stale_quest_classes = weakref.WeakSet()
         class_._loaded_modules = set()
 
+    @classmethod
+    def _unload_modules(class_, modules):
+        class_._unregister_quest_classes([quest_class for quest_class in class_._quest_classes
+                                          if quest_class.__module__ in modules])
+        for module in modules:
+            sys.modules.pop(module, None)
+
+    @classmethod
+    def _reset(class_):
+        class_._drop_resident_episodes()
+        class_._unload_modules(class_._loaded_modules)
+        class_._unwatch_dependencies(class_._dependency_watches)
+        class_._clear_loaded_episode()
+
+    @classmethod
+    def _can_keep_episodes_resident(class_):
+        # The quests of the alternative quests dir are loaded with every episode, so their
+        # modules can't be kept for a single one.
+        return (class_._max_resident_episodes > 0 and
+                not os.path.isdir(get_alternative_quests_dir()))
+
+    @classmethod
+    def _drop_resident_episodes(class_):
+        for state in class_._resident_episodes.values():
+            class_._unload_modules(state['_loaded_modules'])
+        class_._resident_episodes = OrderedDict()
+
+    @classmethod
+    def _deactivate_episode(class_, next_episode=None):
+        '''Stop using the loaded episode, keeping it resident if possible.
+
+        The next episode to be loaded is not evicted, so it can be activated if it's resident.
+        '''
+        if class_._loaded_episode is None or not class_._can_keep_episodes_resident():
+            class_._reset()
+            return
+
+        # The resident episodes don't follow the game state, they are reloaded from it.
+        class_._unwatch_dependencies(class_._dependency_watches)
+
+        state = {name: getattr(class_, name) for name in class_._EPISODE_STATE}
+        class_._resident_episodes[class_._loaded_episode] = state
+        evictable = [name for name in class_._resident_episodes if name != next_episode]
+        while len(evictable) > class_._max_resident_episodes:
+            evicted_episode = evictable.pop(0)
+            evicted_state = class_._resident_episodes.pop(evicted_episode)
+            class_._unload_modules(evicted_state['_loaded_modules'])
+            logger.debug('Evicted episode %s', evicted_episode)
+
+        class_._clear_loaded_episode()
+
+    @classmethod
+    @Performance.timeit
+    def _activate_resident_episode(class_, episode_name):
+        '''Use a resident episode again, returning whether it was resident.'''
+        state = class_._resident_episodes.pop(episode_name, None)
+        if state is None:
+            return False
+
+        for name, value in state.items():
+            setattr(class_, name, value)
+        for quest_id in class_._quest_dependents:
+            class_._watch_dependency(quest_id)
+
+        # The game state may have changed while the episode was not loaded.
+        quests = class_._get_quests_of_quest_sets(class_._quest_sets)
+        class_._reload_quests_conf(quests)
+        class_._sync_quests_from_conf(quests)
+        class_.get_or_create().emit('quest-sets-loaded')
+        return True
+
+    @classmethod
+    def reload_module(class_, quest_folder, modname):
+        '''Reimport a quest module and re-register its quest sets and quests.
+
+        This applies the changes made to a module in the given quest folder without reloading
+        the whole episode. If the module's file has been removed, its quests are forgotten.
+        '''
+        if class_._loaded_episode is None:
+            return
+
+        module_with_episode = os.path.basename(quest_folder) + '.' + modname
+        module_path = os.path.join(quest_folder, modname + '.py')
+        stale_classes = [subclass for subclass in class_._get_episode_quests_classes()
+                         if subclass.__module__ == module_with_episode]
+
+        parent_dir = os.path.dirname(quest_folder)
+        sys.path.append(parent_dir)
+        class_._quest_sets_to_register = []
+        quest_classes_before = set(class_._quest_classes)
+
+        try:
+            if os.path.exists(module_path):
+                # The module may have been saved more than once in the same second, in which
+                # case its bytecode cache would not look outdated.
+                cached_path = importlib.util.cache_from_source(module_path)
+                if os.path.exists(cached_path):
+                    os.remove(cached_path)
+                importlib.invalidate_caches()
+
+                module = sys.modules.get(module_with_episode)
+                if module is None:
+                    __import__(module_with_episode)
+                else:
+                    importlib.reload(module)
+                class_._loaded_modules.add(module_with_episode)
+            else:
+                sys.modules.pop(module_with_episode, None)
+                class_._loaded_modules.discard(module_with_episode)
+        except Exception as e:
+            # The module is being edited, so it may have any error. Keep the old quests.
+            logger.warning('Could not reload the quest module %s: %s', module_with_episode, e)
+            class_._quest_sets_to_register = []
+            class_._unregister_quest_classes([quest_class for quest_class in class_._quest_classes
+                                              if quest_class not in quest_classes_before])
+            return
+        finally:
+            del sys.path[sys.path.index(parent_dir)]
+
+        class_._remove_quests([quest for quest in class_._constructed_quests.values()
+                               if type(quest) in stale_classes])
+        for quest_class in stale_classes:
+            class_._stale_quest_classes.add(quest_class)
+            class_._quest_instances.pop(quest_class, None)
+        class_._unregister_quest_classes(stale_classes)
+
+        # Keep the order of the quest sets, replacing the ones defined in the module.
+        new_quest_set_classes = class_._quest_sets_to_register
+        class_._quest_sets_to_register = []
+        quest_set_classes = []
+        for quest_set in class_._quest_sets:
+            quest_set_class = type(quest_set)
+            if quest_set_class.__module__ == module_with_episode:
+                quest_set_class = next((new_class for new_class in new_quest_set_classes
+                                        if new_class.get_id() == quest_set.get_id()), None)
+                if quest_set_class is None:
+                    continue
+                new_quest_set_classes.remove(quest_set_class)
+            quest_set_classes.append(quest_set_class)
+        quest_set_classes += new_quest_set_classes
+
+        # Recreate all the quest sets, since any of them can have quests from the module.
+        # The quests that have not been reloaded are kept.
+        for quest_set in class_._quest_sets:
+            quest_set.disconnect_quests()
+        class_._set_quest_sets([quest_set_class() for quest_set_class in quest_set_classes])
+
+        for quest in class_.get_current_quests().values():
+            if type(quest).__module__ == module_with_episode:
+                quest.sync_from_conf()
+
+        logger.info('Reloaded quest module %s', module_with_episode)
+        class_.get_or_create().emit('quest-sets-changed')
+
     @classmethod
     @Performance.timeit
     def register_quest_set(class_, quest_set):
@@ -147,33 +641,163 @@ class Registry(GObject.GObject):
             raise TypeError('{} is not a of type {}'.format(quest_set, QuestSet))
         class_._quest_sets_to_register.append(quest_set)
 
+    @classmethod
+    def _add_quest_set(class_, quest_set):
+        class_._quest_sets.append(quest_set)
+
+        # The first quest set found wins, except for the quests: a quest id in more than one
+        # quest set gets the quest of the last one.
+        class_._quest_set_by_id.setdefault(quest_set.get_id(), quest_set)
+        class_._quest_set_by_character.setdefault(quest_set.get_character(), quest_set)
+        if quest_set.get_name() is not None:
+            class_._quest_set_by_pathway_name.setdefault(quest_set.get_name().upper(), quest_set)
+        quest_set_index = len(class_._quest_sets) - 1
+        for quest_index, quest in enumerate(quest_set.get_quests()):
+            class_._quests_by_id[quest.get_id()] = quest
+            class_._quest_set_by_quest.setdefault(quest, quest_set)
+            class_._add_quest(quest)
+            class_._offer_priorities.setdefault(quest, (quest_set_index, quest_index))
+            class_._update_offer_candidate(quest)
+
+    @classmethod
+    def _add_quest(class_, quest):
+        class_._constructed_quests[quest.get_id()] = quest
+        for dependency in quest.get_dependency_quests():
+            class_._quest_dependents.setdefault(dependency, {})[quest] = None
+            class_._watch_dependency(dependency)
+
+    @classmethod
+    def _remove_quests(class_, quests):
+        for quest in quests:
+            if class_._constructed_quests.get(quest.get_id()) is quest:
+                del class_._constructed_quests[quest.get_id()]
+            for dependency in quest.get_dependency_quests():
+                dependents = class_._quest_dependents.get(dependency, {})
+                dependents.pop(quest, None)
+                if not dependents and dependency in class_._dependency_watches:
+                    GameStateService.unwatch(class_._dependency_watches.pop(dependency))
+
+    @classmethod
+    def _watch_dependency(class_, quest_id):
+        if quest_id in class_._dependency_watches or not class_._quest_dependents.get(quest_id):
+            return
+
+        if quest_id not in class_._constructed_quests:
+            logger.debug('Quest %s is a dependency but is not constructed', quest_id)
+        class_._dependency_watches[quest_id] = GameStateService.watch(
+            _Quest._get_quest_conf_prefix() + quest_id, class_._dependency_changed, quest_id)
+
+    @classmethod
+    def _dependency_changed(class_, key, quest_id):
+        quest = class_._constructed_quests.get(quest_id)
+        if quest is None:
+            for dependent in class_.get_dependent_quests(quest_id):
+                dependent._update_availability()
+            return
+
+        # A constructed quest keeps its completion, which may not have been saved yet, so it's
+        # only taken from the game state when the service tells that its key changed. Its
+        # dependents are updated when its completion changes. The game state being reset
+        # doesn't tell the keys, see reload_quests_conf().
+        if key is None:
+            return
+        conf = GameStateService().get(key, value_if_missing={}) or {}
+        complete = conf.get('complete', False)
+        if complete != quest.complete:
+            logger.debug('Quest %s completion changed in the game state', quest)
+            quest.complete = complete
+
+    @classmethod
+    def _unwatch_dependencies(class_, dependency_watches):
+        for watch_id in dependency_watches.values():
+            GameStateService.unwatch(watch_id)
+        dependency_watches.clear()
+
+    @classmethod
+    def _reload_quests_conf(class_, quests):
+        class_._fetch_quests_conf([type(quest) for quest in quests])
+        try:
+            for quest in quests:
+                quest.load_conf()
+        finally:
+            class_._fetched_conf = {}
+
+    @classmethod
+    def reload_quests_conf(class_):
+        '''Reload the configuration of the loaded quests from the game state.
+
+        This is needed when the game state is reset, since the quests don't follow the changes
+        of their configuration.
+        '''
+        class_._reload_quests_conf(list(class_._constructed_quests.values()))
+
+    @classmethod
+    def get_dependent_quests(class_, quest_id):
+        '''Return the quests that depend on the completion of the given one.'''
+        return list(class_._quest_dependents.get(quest_id, {}))
+
+    @classmethod
+    def is_quest_complete(class_, quest_id):
+        '''Return whether a quest is complete if it's known without a round-trip, or None.
+
+        The quest is known if it's been constructed, or if its configuration has been fetched
+        for the quests being constructed or is in the snapshot being used.
+        '''
+        quest = class_._constructed_quests.get(quest_id)
+        if quest is not None:
+            return quest.complete
+
+        conf = class_._fetched_conf.get(_Quest._get_quest_conf_prefix() + quest_id)
+        if conf is None:
+            conf = class_.get_snapshot_quest_conf(quest_id)
+        if conf is None:
+            return None
+        return conf.get('complete', False)
+
+    @classmethod
+    def _quest_complete_changed(class_, quest):
+        # The availability of a quest only depends on the completion of the quests it depends
+        # on, so only its direct dependents have to be updated: their availability changing
+        # doesn't change anything else.
+        for dependent in class_.get_dependent_quests(quest.get_id()):
+            dependent._update_availability()
+
+    @classmethod
+    def _set_quest_sets(class_, quest_sets):
+        class_._quest_sets = []
+        class_._quests_by_id = OrderedDict()
+        class_._quest_set_by_quest = {}
+        class_._quest_set_by_character = {}
+        class_._quest_set_by_id = {}
+        class_._quest_set_by_pathway_name = {}
+        class_._offer_priorities = {}
+        class_._offer_candidates = []
+        class_._offer_candidate_entries = {}
+
+        for quest_set in quest_sets:
+            class_._add_quest_set(quest_set)
+
     @classmethod
     def get_quest_sets(class_):
         return class_._quest_sets
 
     @classmethod
     def get_questset_for_character(class_, character_id):
-        for qs in class_.get_quest_sets():
-            if qs.get_character() == character_id:
-                return qs
-        return None
+        return class_._quest_set_by_character.get(character_id)
 
     @classmethod
     def get_questset_for_quest(class_, quest):
         # Note: this assumes that the questsets don't share quests. If
         # not, it will return the first questset matching.
-        for qs in class_.get_quest_sets():
-            if quest in qs.get_quests():
-                return qs
-        return None
+        return class_._quest_set_by_quest.get(quest)
 
     @classmethod
     def get_quest_set_by_name(class_, name):
-        for quest_set in class_.get_quest_sets():
-            if quest_set.get_id() == name:
-                return quest_set
+        return class_._quest_set_by_id.get(name)
 
-        return None
+    @classmethod
+    def get_quest_set_by_pathway_name(class_, pathway_name):
+        return class_._quest_set_by_pathway_name.get(pathway_name.upper())
 
     @classmethod
     def has_quest_sets_highlighted(class_):
@@ -189,7 +813,7 @@ class Registry(GObject.GObject):
         else:
             quest_name = name
 
-        return class_.get_current_quests().get(quest_name)
+        return class_._quests_by_id.get(quest_name)
 
     @classmethod
     def _get_episode_folder(class_, episode_name):
@@ -215,6 +839,50 @@ class Registry(GObject.GObject):
 
     @classmethod
     def load_current_episode(class_):
+        '''Load the current episode, finishing the asynchronous load of it if there is one.'''
+        steps = class_._pending_episode_load or class_._load_current_episode_steps()
+        class_._pending_episode_load = steps
+        try:
+            for _step in steps:
+                pass
+        finally:
+            class_._pending_episode_load = None
+
+    @classmethod
+    def load_current_episode_async(class_, callback=None):
+        '''Load the current episode in the main loop, giving control back to it in between.
+
+        This yields to the main loop after importing every quest module and instantiating
+        every quest set, emitting "quest-set-added" for each of them, so the UI can be
+        updated while the episode is loaded. The callback is called when it's been loaded,
+        also if load_current_episode() has been called meanwhile and finished the load, with
+        None, or with the exception that made the load fail.
+        '''
+        if class_._pending_episode_load is None:
+            class_._pending_episode_load = class_._load_current_episode_steps()
+        steps = class_._pending_episode_load
+
+        def _load_step():
+            error = None
+            if class_._pending_episode_load is steps:
+                try:
+                    next(steps)
+                    return GLib.SOURCE_CONTINUE
+                except StopIteration:
+                    class_._pending_episode_load = None
+                except Exception as e:
+                    class_._pending_episode_load = None
+                    logger.exception('Could not load the current episode')
+                    error = e
+
+            if callback is not None:
+                callback(error)
+            return GLib.SOURCE_REMOVE
+
+        GLib.idle_add(_load_step)
+
+    @classmethod
+    def _load_current_episode_steps(class_):
         loaded_episodes = {}
         episode_name = class_.get_current_episode()['name']
 
@@ -222,16 +890,20 @@ class Registry(GObject.GObject):
         # This avoids having a quest set a new episode when it's loaded but we'd thus end up
         # with an old episode loaded.
         while class_._loaded_episode != episode_name:
-            logger.info('Loading episode %s', episode_name)
+            class_._deactivate_episode(episode_name)
 
-            class_._reset()
+            if class_._activate_resident_episode(episode_name):
+                logger.info('Switched to the resident episode %s', episode_name)
+                break
 
+            logger.info('Loading episode %s', episode_name)
             class_._loaded_episode = episode_name
+            class_._snapshot = class_._open_snapshot(episode_name)
 
             # loading custom quests on HOME folder. This should be done before
             # the episode loading because in other case the quest is not added
             # to the pathway
-            class_.load(get_alternative_quests_dir())
+            yield from class_._load_steps(get_alternative_quests_dir())
 
             episode_folder = class_._get_episode_folder(episode_name)
 
@@ -239,7 +911,10 @@ class Registry(GObject.GObject):
             if module:
                 class_._autorun_quest = getattr(module, 'AUTORUN_QUEST', None)
 
-            class_.load(episode_folder)
+            yield from class_._load_steps(episode_folder)
+
+            if class_._snapshot is not None:
+                GLib.idle_add(class_._reconcile_snapshot)
 
             # Avoid circular episode setting (a quest setting an episode that when loaded
             # sets a previously loaded episode)
@@ -258,12 +933,7 @@ class Registry(GObject.GObject):
 
     @classmethod
     def get_current_quests(class_):
-        quest_sets = class_.get_quest_sets()
-        quests_dict = OrderedDict()
-        for quest_set in quest_sets:
-            for quest in quest_set.get_quests():
-                quests_dict[quest.get_id()] = quest
-        return quests_dict
+        return class_._quests_by_id.copy()
 
     @classmethod
     def get_current_episode_progress(class_):
@@ -280,19 +950,93 @@ class Registry(GObject.GObject):
 
         return None
 
+    @classmethod
+    def has_pending_autorun_quest(class_):
+        '''Whether the current episode has an autorun quest that is not complete.
+
+        Unlike get_autorun_quest(), this works before the episode is loaded, since it only
+        imports the episode package and reads the quest's configuration.
+        '''
+        if class_._loaded_episode is not None:
+            return class_.get_autorun_quest() is not None
+
+        episode_folder = class_._get_episode_folder(class_.get_current_episode()['name'])
+        module = class_._get_episode_module(episode_folder)
+        autorun_quest = getattr(module, 'AUTORUN_QUEST', None) if module else None
+        if autorun_quest is None:
+            return False
+
+        conf = GameStateService().get(_Quest._get_quest_conf_prefix() + autorun_quest)
+        return not (conf or {}).get('complete', False)
+
+    @staticmethod
+    def _is_offer_candidate(quest):
+        return quest.auto_offer and quest.available and not quest.conf['complete']
+
+    @classmethod
+    def _update_offer_candidate(class_, quest):
+        '''Add or remove a quest of the quest sets from the auto-offer candidates.'''
+        priority = class_._offer_priorities.get(quest)
+        if priority is None:
+            return
+
+        entry = class_._offer_candidate_entries.get(quest)
+        if class_._is_offer_candidate(quest):
+            if entry is None:
+                entry = [priority, next(class_._offer_counter), quest]
+                class_._offer_candidate_entries[quest] = entry
+                heapq.heappush(class_._offer_candidates, entry)
+        elif entry is not None:
+            entry[2] = None
+            del class_._offer_candidate_entries[quest]
+
     @classmethod
     def get_next_auto_offer_quest(class_, current_quest=None):
-        for quest_set in class_.get_quest_sets():
-            for quest in quest_set.get_quests():
-                if quest == current_quest:
-                    continue
-                if quest.auto_offer and quest.available and not quest.conf['complete']:
-                    return quest
+        candidates = class_._offer_candidates
+        skipped_entries = []
+        next_quest = None
+
+        while candidates:
+            quest = candidates[0][2]
+            if quest is None:
+                heapq.heappop(candidates)
+            elif not class_._is_offer_candidate(quest):
+                # Its configuration was changed without notifying it.
+                heapq.heappop(candidates)
+                del class_._offer_candidate_entries[quest]
+            elif quest == current_quest:
+                skipped_entries.append(heapq.heappop(candidates))
+            else:
+                next_quest = quest
+                break
 
-        return None
+        for entry in skipped_entries:
+            heapq.heappush(candidates, entry)
+
+        return next_quest
+
+    @classmethod
+    def queue_offer_quest(class_):
+        '''Offer the next quest from the main loop, once for all the calls until then.'''
+        if class_._offer_source == 0:
+            class_._offer_source = GLib.idle_add(class_._offer_quest_cb)
+
+    @classmethod
+    def _offer_quest_cb(class_):
+        class_._offer_source = 0
+        if class_._loading_quest_sets:
+            class_._offer_held = True
+        else:
+            class_.try_offer_quest()
+        return GLib.SOURCE_REMOVE
 
     @classmethod
     def try_offer_quest(class_, current_quest=None):
+        # Any queued offer would be the same one.
+        if class_._offer_source != 0:
+            GLib.source_remove(class_._offer_source)
+            class_._offer_source = 0
+
         next_quest = class_.get_next_auto_offer_quest(current_quest)
         if next_quest:
             logger.debug('Proposing next quest: %s', next_quest)
@@ -347,27 +1091,60 @@ class Registry(GObject.GObject):
         GameStateService().set('clubhouse.CurrentEpisode', current_episode_info)
 
     @classmethod
-    def _get_episode_quests_classes(class_):
-        current_episode = class_.get_loaded_episode_name()
-        for subclass in Quest.__subclasses__():
-            # Avoid matching subclasses with the same name but in different episodes
-            episode = subclass.__module__.split('.', 1)[0]
+    def _register_quest_class(class_, quest_class):
+        class_._quest_classes[quest_class] = None
+        for tag in quest_class.get_tags():
+            class_._quest_classes_by_tag.setdefault(tag, {})[quest_class] = None
+        for prefix in quest_class.get_tag_prefixes():
+            class_._quest_classes_by_tag_prefix.setdefault(prefix, {})[quest_class] = None
 
-            # custom quest in the HOME folder doesn't have a real episode name
-            # and the module is quests
-            is_alternative_quests = 'quests' == episode
-            if not is_alternative_quests and episode != current_episode:
-                continue
+    @classmethod
+    def _unregister_quest_classes(class_, quest_classes):
+        for quest_class in quest_classes:
+            class_._quest_classes.pop(quest_class, None)
+            for index in (class_._quest_classes_by_tag, class_._quest_classes_by_tag_prefix):
+                for key in [key for key, classes in index.items() if quest_class in classes]:
+                    del index[key][quest_class]
+                    if not index[key]:
+                        del index[key]
+
+    @classmethod
+    def _is_episode_quest_class(class_, quest_class):
+        if quest_class in class_._stale_quest_classes:
+            return False
+
+        # Avoid matching subclasses with the same name but in different episodes
+        episode = quest_class.__module__.split('.', 1)[0]
+
+        # custom quest in the HOME folder doesn't have a real episode name
+        # and the module is quests
+        is_alternative_quests = 'quests' == episode
+        return is_alternative_quests or episode == class_.get_loaded_episode_name()
+
+    @classmethod
+    def _get_episode_quests_classes(class_, quest_classes=None):
+        if quest_classes is None:
+            quest_classes = class_._quest_classes
+        return [quest_class for quest_class in quest_classes
+                if class_._is_episode_quest_class(quest_class)]
 
-            yield subclass
+    @classmethod
+    def get_quest_classes_by_tag(class_, tag):
+        '''Return the quest classes of the loaded episode with the given tag.'''
+        return class_._get_episode_quests_classes(class_._quest_classes_by_tag.get(tag, {}))
+
+    @classmethod
+    def get_quest_classes_by_tag_prefix(class_, prefix):
+        '''Return the quest classes of the loaded episode with tags with the given prefix.'''
+        return class_._get_episode_quests_classes(
+            class_._quest_classes_by_tag_prefix.get(prefix, {}))
 
     @classmethod
     def get_matching_quests(class_, tag):
-        for subclass in class_._get_episode_quests_classes():
-            if tag in subclass.get_tags():
-                if subclass not in class_._quest_instances:
-                    class_._quest_instances[subclass] = subclass()
-                yield class_._quest_instances[subclass]
+        for subclass in class_.get_quest_classes_by_tag(tag):
+            if subclass not in class_._quest_instances:
+                class_._quest_instances[subclass] = subclass()
+            yield class_._quest_instances[subclass]
 
     @classmethod
     def get_quest_class_by_name(class_, name):
@@ -378,6 +1155,81 @@ class Registry(GObject.GObject):
         raise TypeError('Quest {} not found'.format(name))
 
 
+class AlternativeQuestsMonitor:
+    '''Apply the changes made to the alternative quests dir while the app is running.
+
+    The strings CSV files that change are reparsed into the strings catalog, and the quest
+    modules that change are reimported, so quest designers don't need to restart the app
+    after every edit.
+    '''
+
+    # Editors usually produce several events for a single save, so wait a bit to handle them
+    # at once.
+    _CHANGES_DELAY_MS = 100
+
+    _CHANGE_EVENTS = (
+        Gio.FileMonitorEvent.CHANGES_DONE_HINT,
+        Gio.FileMonitorEvent.CREATED,
+        Gio.FileMonitorEvent.DELETED,
+        Gio.FileMonitorEvent.MOVED_IN,
+        Gio.FileMonitorEvent.MOVED_OUT,
+        Gio.FileMonitorEvent.RENAMED,
+    )
+
+    def __init__(self, quests_dir=None):
+        self._quests_dir = quests_dir or get_alternative_quests_dir()
+        self._strings_dir = os.path.join(self._quests_dir,
+                                         os.path.basename(config.QUESTS_STRINGS_DIR))
+        self._changed_paths = set()
+        self._changes_timeout_id = 0
+
+        self._monitors = []
+        for path in (self._quests_dir, self._strings_dir):
+            monitor = Gio.File.new_for_path(path).monitor_directory(
+                Gio.FileMonitorFlags.WATCH_MOVES, None)
+            monitor.connect('changed', self._file_changed_cb)
+            self._monitors.append(monitor)
+
+    def _file_changed_cb(self, _monitor, file_, other_file, event_type):
+        if event_type not in self._CHANGE_EVENTS:
+            return
+
+        for changed_file in (file_, other_file):
+            if changed_file is not None and changed_file.get_path() is not None:
+                self._changed_paths.add(changed_file.get_path())
+
+        if self._changes_timeout_id == 0:
+            self._changes_timeout_id = GLib.timeout_add(self._CHANGES_DELAY_MS,
+                                                        self._apply_changes)
+
+    def _apply_changes(self):
+        self._changes_timeout_id = 0
+        changed_paths = sorted(self._changed_paths)
+        self._changed_paths = set()
+
+        # Update the strings first, so the reloaded quests get the new ones.
+        for path in changed_paths:
+            if os.path.dirname(path) == self._strings_dir and path.endswith('.csv'):
+                QuestStringCatalog.reload_csv_file(path)
+
+        for path in changed_paths:
+            modname, extension = os.path.splitext(os.path.basename(path))
+            if (os.path.dirname(path) == self._quests_dir and extension == '.py' and
+                    modname != '__init__'):
+                Registry.reload_module(self._quests_dir, modname)
+
+        return GLib.SOURCE_REMOVE
+
+    def cancel(self):
+        for monitor in self._monitors:
+            monitor.cancel()
+        self._monitors = []
+
+        if self._changes_timeout_id != 0:
+            GLib.source_remove(self._changes_timeout_id)
+            self._changes_timeout_id = 0
+
+
 class _QuestRunContext:
 
     def __init__(self, cancellable):
@@ -635,6 +1487,44 @@ class NoMessageIdError(Exception):
     pass
 
 
+class _QuestTags:
+    '''The tags of a quest class, parsed once.
+
+    A tag has a prefix and one or more values separated by colons, like "skillset:web:2".
+    The values are given uppercase, or as integers if they are numbers.
+    '''
+
+    def __init__(self, tags):
+        self.source = tags
+        self._values_by_prefix = OrderedDict()
+        self._raw_values_by_prefix = OrderedDict()
+
+        for tag in tags:
+            prefix, separator, raw_values = tag.partition(':')
+            if not separator:
+                continue
+
+            self._raw_values_by_prefix.setdefault(prefix, []).append(raw_values)
+            self._values_by_prefix.setdefault(prefix, []).append(
+                [self._sanitize(value) for value in raw_values.split(':')])
+
+    @staticmethod
+    def _sanitize(tag_element):
+        try:
+            return int(tag_element)
+        except ValueError:
+            return tag_element.upper()
+
+    def get_prefixes(self):
+        return list(self._values_by_prefix)
+
+    def get_values(self, prefix):
+        return self._values_by_prefix.get(prefix, [])
+
+    def get_raw_values(self, prefix):
+        return self._raw_values_by_prefix.get(prefix, [])
+
+
 class _Quest(GObject.GObject):
 
     Difficulty = IntEnum('Difficulty', ['EASY', 'NORMAL', 'HARD'])
@@ -661,6 +1551,8 @@ class _Quest(GObject.GObject):
     }
 
     _SOUND_ON_RUN_BEGIN = 'quests/quest-given'
+
+    _tags = _QuestTags([])
     _OPEN_DIALOG_SOUND = 'clubhouse/dialog/open'
     _ABORT_SOUND = 'quests/quest-aborted'
     _PROPOSAL_SOUND = 'quests/quest-proposed'
@@ -721,11 +1613,12 @@ class _Quest(GObject.GObject):
         self.conf = {}
         self.load_conf()
 
+        self._available_since_date = None
+        self._available_until_date = None
+
         self._highlighted = False
         self._available = self._get_availability()
-        if self.get_dependency_quests() != []:
-            self.gss.connect('changed', lambda _gss: self._update_availability())
-            self._update_availability()
+        Registry._add_quest(self)
 
         self._cancellable = None
 
@@ -749,6 +1642,7 @@ class _Quest(GObject.GObject):
         # update availability again here because available_since and
         # available_until are usually updated in the setup method and the
         # 'notify::available-since' signal could cause race conditions
+        self._update_available_dates()
         self._available = self._get_availability()
 
     def _get_message_info(self, message_id):
@@ -757,22 +1651,20 @@ class _Quest(GObject.GObject):
         if message_info is None:
             return None
 
-        if MessageTemplate.delimiter in message_info['txt']:
+        message_template = CompiledMessageTemplate.from_text(message_info['txt'])
+        message_variables = {}
+        if message_template.has_variables():
             message_variables = self._get_message_variables()
-            message_template = MessageTemplate(message_info['txt'])
-            parsed_text = message_template.substitute(message_variables)
-            message_info['parsed_text'] = parsed_text
-        else:
-            message_info['parsed_text'] = message_info['txt']
+        parsed_text = message_template.render(message_variables)
 
         # @todo: Remove this when updating to a runtime using Pango >= 1.44, because
         # insert_hyphens is not supported in the current version of our runtime.
         if self.is_narrative():
-            parsed_text = message_info['parsed_text']
-            message_info['parsed_text'] = parsed_text.replace('insert_hyphens="true"', '')
-            message_info['parsed_text'] = parsed_text.replace('insert_hyphens="false"', '')
+            parsed_text = parsed_text.replace('insert_hyphens="true"', '')
+            parsed_text = parsed_text.replace('insert_hyphens="false"', '')
 
-        return message_info
+        # The catalog's info is shared, so return a new read-only copy instead of modifying it.
+        return MappingProxyType({**message_info, 'parsed_text': parsed_text})
 
     def _setup_labels(self):
         for message_id in self._labels:
@@ -789,17 +1681,31 @@ class _Quest(GObject.GObject):
     def get_dependency_quests(self):
         return self.__available_after_completing_quests__
 
-    def _is_contemporary_available(self):
-        if self.available_since or self.available_until:
-            # Remove minutes and seconds from time
-            today = datetime(*datetime.now().timetuple()[:3])
-            start = today
-            end = today
+    def _update_available_dates(self):
+        # The dates are parsed only when they change, and the availability is updated when
+        # the days they define start and end.
+        self._available_since_date = None
+        self._available_until_date = None
+        boundaries = []
+
+        if self.available_since:
+            self._available_since_date = parse_date(self.available_since)
+            boundaries.append(get_day_start(self._available_since_date))
+        if self.available_until:
+            self._available_until_date = parse_date(self.available_until)
+            boundaries.append(get_day_start(self._available_until_date + timedelta(days=1)))
+
+        DateBoundaryScheduler.watch(self, boundaries, _Quest._update_availability)
 
-            if self.available_since:
-                start = datetime.strptime(self.available_since, '%Y-%m-%d')
-            if self.available_until:
-                end = datetime.strptime(self.available_until, '%Y-%m-%d')
+    def _available_dates_changed(self):
+        self._update_available_dates()
+        self._update_availability()
+
+    def _is_contemporary_available(self):
+        if self._available_since_date or self._available_until_date:
+            today = date.today()
+            start = self._available_since_date or today
+            end = self._available_until_date or today
 
             return start <= today <= end
 
@@ -961,22 +1867,31 @@ class _Quest(GObject.GObject):
 
         return async_action
 
-    def connect_gss_changes(self):
+    def connect_gss_changes(self, keys_list=None):
+        '''Resolve when the given game state keys change, or any key if keys_list is None.
+
+        If the game state service doesn't signal which key changed, any change resolves it.
+        '''
         assert self._run_context is not None
 
         async_action = self._run_context.new_async_action()
 
-        gss_changes_handler_id = 0
+        gss_watch_ids = []
 
         def _disconnect_gss(_future):
-            self.gss.disconnect(gss_changes_handler_id)
+            for watch_id in gss_watch_ids:
+                self.gss.unwatch(watch_id)
 
         if async_action.is_cancelled():
             return async_action
 
         async_action.future.add_done_callback(_disconnect_gss)
 
-        gss_changes_handler_id = self.gss.connect('changed', lambda _gss: async_action.resolve())
+        if keys_list is None:
+            gss_watch_ids.append(self.gss.watch_prefix('', lambda _key: async_action.resolve()))
+        else:
+            for key in keys_list:
+                gss_watch_ids.append(self.gss.watch(key, lambda _key: async_action.resolve()))
 
         return async_action
 
@@ -1188,28 +2103,37 @@ class _Quest(GObject.GObject):
     @classmethod
     def get_pathways(class_):
         quest_pathways = []
-        registered_questsets = Registry.get_quest_sets()
         for tag_info in class_.get_tag_info_by_prefix('pathway'):
-            pathway_name = tag_info[0]
-            try:
-                pathway = \
-                    next(p for p in registered_questsets if p.get_name().upper() == pathway_name)
+            pathway = Registry.get_quest_set_by_pathway_name(tag_info[0])
+            if pathway is not None:
                 quest_pathways.append(pathway)
-            except StopIteration:
-                continue
         return quest_pathways
 
     def get_name(self):
         return self.get_label('QUEST_NAME')
 
+    def __init_subclass__(class_, **kwargs):
+        super().__init_subclass__(**kwargs)
+        class_._tags = _QuestTags(class_.get_tags())
+
     @classmethod
     def get_tags(class_):
         return class_.__tags__
 
+    @classmethod
+    def _get_parsed_tags(class_):
+        # The tags are parsed again if they have been replaced since the class was defined.
+        if class_._tags.source is not class_.get_tags():
+            class_._tags = _QuestTags(class_.get_tags())
+        return class_._tags
+
+    @classmethod
+    def get_tag_prefixes(class_):
+        return class_._get_parsed_tags().get_prefixes()
+
     @classmethod
     def get_requires(class_, flag='require'):
-        requires = [tag[len(flag) + 1:] for tag in class_.get_tags() if tag.startswith(flag)]
-        return requires
+        return list(class_._get_parsed_tags().get_raw_values(flag))
 
     @classmethod
     def requires_network(class_):
@@ -1221,18 +2145,8 @@ class _Quest(GObject.GObject):
 
     @classmethod
     def get_tag_info_by_prefix(class_, prefix):
-
-        def sanitize(tag_element):
-            try:
-                return int(tag_element)
-            except ValueError:
-                return tag_element.upper()
-
-        for tag in class_.get_tags():
-            if not tag.startswith(prefix + ':'):
-                continue
-
-            yield [sanitize(t) for t in tag.split(':')[1:]]
+        for tag_info in class_._get_parsed_tags().get_values(prefix):
+            yield list(tag_info)
 
     @classmethod
     def get_difficulty(class_):
@@ -1272,7 +2186,9 @@ class _Quest(GObject.GObject):
 
     def load_conf(self):
         key = self._get_conf_key()
-        self.conf = self.gss.get(key, value_if_missing={})
+        self.conf = Registry.pop_fetched_conf(key)
+        if self.conf is None:
+            self.conf = self.gss.get(key, value_if_missing={})
         self.complete = self.conf.get('complete', False)
 
     def sync_from_conf(self):
@@ -1340,15 +2256,19 @@ class _Quest(GObject.GObject):
         self.notify('highlighted')
 
     def get_named_quest_conf(self, class_name, key):
-        gss_key = self._get_quest_conf_prefix() + class_name
-        data = self.gss.get(gss_key)
+        data = Registry.get_snapshot_quest_conf(class_name)
+        if data is None:
+            gss_key = self._get_quest_conf_prefix() + class_name
+            data = self.gss.get(gss_key)
 
         if data is None:
             return None
         return data.get(key)
 
     def is_named_quest_complete(self, class_name):
-        data = self.get_named_quest_conf(class_name, 'complete')
+        data = Registry.is_quest_complete(class_name)
+        if data is None:
+            data = self.get_named_quest_conf(class_name, 'complete')
         return data is not None and data
 
     def with_app_launched(app_name=None, otherwise='step_abort'):
@@ -1579,6 +2499,13 @@ class Quest(_Quest):
     Define this in the :meth:`setup()` method.
     '''
 
+    def __init_subclass__(class_, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # Only the direct subclasses are quests, others are base classes for quests.
+        if Quest in class_.__bases__:
+            Registry._register_quest_class(class_)
+
     def _get_available(self):
         return self._available
 
@@ -1602,8 +2529,11 @@ class Quest(_Quest):
         return self.get_complete()
 
     def _set_complete(self, is_complete):
-        self.set_complete(is_complete)
-        self.notify('complete')
+        # The handlers of the completion, like the ones giving achievement points or
+        # highlighting the quest sets, write to the game state with it in one batch.
+        with self.gss.batch():
+            self.set_complete(is_complete)
+            self.notify('complete')
 
     complete = GObject.Property(_get_complete, _set_complete, type=bool, default=False,
                                 flags=GObject.ParamFlags.READWRITE |
@@ -1635,8 +2565,10 @@ class Quest(_Quest):
 
     def __init__(self):
         super().__init__()
-        self.connect('notify::available-since', lambda _a, _b: self._update_availability())
-        self.connect('notify::available-until', lambda _a, _b: self._update_availability())
+        self.connect('notify::available-since', lambda _a, _b: self._available_dates_changed())
+        self.connect('notify::available-until', lambda _a, _b: self._available_dates_changed())
+        self.connect('notify::complete', lambda quest, _param:
+                     Registry._quest_complete_changed(quest))
 
     # ** Setup and steps **
 
@@ -2475,14 +3407,16 @@ class Quest(_Quest):
         '''
         conf_key = self._get_conf_key()
         variant = convert_variant_arg(self.conf)
-        self.gss.set_async(conf_key, variant)
 
-        if self.complete:
-            for item_id, extra_info in self.__items_on_completion__.items():
-                self._set_item(item_id, extra_info, skip_if_exists=True)
+        with self.gss.batch():
+            self.gss.set_async(conf_key, variant)
 
-            for item_id, info in self.__conf_on_completion__.items():
-                self.gss.set(item_id, info)
+            if self.complete:
+                for item_id, extra_info in self.__items_on_completion__.items():
+                    self._set_item(item_id, extra_info, skip_if_exists=True)
+
+                for item_id, info in self.__conf_on_completion__.items():
+                    self.gss.set(item_id, info)
 
     # ** Highlighting elements of the UI **
 
@@ -2723,9 +3657,17 @@ class QuestSet(GObject.GObject):
 
         self._highlighted = False
 
+        self._quest_handlers = []
         for quest in self.get_quests():
-            quest.connect('notify',
-                          lambda quest, param: self.on_quest_properties_changed(quest, param.name))
+            handler = quest.connect('notify', lambda quest, param:
+                                    self.on_quest_properties_changed(quest, param.name))
+            self._quest_handlers.append((quest, handler))
+
+    def disconnect_quests(self):
+        '''Stop following the changes of the quests, e.g. when the quest set is replaced.'''
+        for quest, handler in self._quest_handlers:
+            quest.disconnect(handler)
+        self._quest_handlers = []
 
     @classmethod
     def get_tag(class_):
@@ -2778,8 +3720,10 @@ class QuestSet(GObject.GObject):
     def on_quest_properties_changed(self, quest, prop_name):
         logger.debug('Quest "%s" property changed: %s to %r', quest, prop_name,
                      quest.get_property(prop_name))
+        if prop_name in ('available', 'auto-offer', 'complete'):
+            Registry._update_offer_candidate(quest)
         if prop_name == 'available':
-            Registry.try_offer_quest()
+            Registry.queue_offer_quest()
 
     def is_active(self):
         return self.visible and self.get_next_quest() is not None
@@ -0,0 +1,283 @@
+#
+# Copyright © 2020 Endless OS Foundation LLC.
+#
+# This file is part of clubhouse
+# (see https://github.com/endlessm/clubhouse).
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+'''Manifest of the quests of every episode, generated at build time from their modules.
+
+The quest modules are not imported: their source is parsed and only the class attributes
+that are literals are read, so this module must not depend on GObject introspection or on
+the generated config either.
+
+For every episode, the manifest has the names of its modules, in the order the Registry
+imports them, with a hash of their source, the quest sets registered by them with the quests
+they list, and the quests they define, in definition order, with their tags, pathway, pathway
+order, dependencies and app id.
+'''
+
+import ast
+import hashlib
+import json
+import os
+import pkgutil
+
+
+MANIFEST_VERSION = 2
+
+# The class attributes of the quests in the manifest, and their values if not set.
+QUEST_ATTRIBUTES = {
+    '__tags__': [],
+    '__pathway_order__': 0,
+    '__available_after_completing_quests__': [],
+    '__app_id__': None,
+}
+
+QUEST_SET_ATTRIBUTES = {
+    '__pathway_name__': None,
+    '__character_id__': None,
+}
+
+
+def get_quest_modules(quest_folder):
+    '''Return the names of the modules in a quest folder, in the order they are imported.'''
+    return [modname for _unused, modname, _unused in pkgutil.iter_modules([quest_folder])]
+
+
+def get_module_hash(quest_folder, modname):
+    '''Return the hash of the source of a quest module, to know if it changed.'''
+    with open(os.path.join(quest_folder, modname + '.py'), 'rb') as module_file:
+        return hashlib.sha256(module_file.read()).hexdigest()
+
+
+def _get_base_names(class_def):
+    names = []
+    for base in class_def.bases:
+        if isinstance(base, ast.Name):
+            names.append(base.id)
+        elif isinstance(base, ast.Attribute):
+            names.append(base.attr)
+    return names
+
+
+def _get_class_attributes(class_def, defaults, path):
+    attributes = dict(defaults)
+    for node in class_def.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        for target in node.targets:
+            if not isinstance(target, ast.Name) or target.id not in defaults:
+                continue
+            try:
+                attributes[target.id] = ast.literal_eval(node.value)
+            except ValueError:
+                raise ValueError('{}:{}: {}.{} is not a literal'.format(
+                    path, node.lineno, class_def.name, target.id))
+    return attributes
+
+
+def _get_listed_quests(class_def, path):
+    # The quests of "__quests__ = ['FirstQuest', SecondQuest]", by name or by class.
+    names = []
+    for node in class_def.body:
+        if (not isinstance(node, ast.Assign) or
+                not any(isinstance(target, ast.Name) and target.id == '__quests__'
+                        for target in node.targets)):
+            continue
+        if not isinstance(node.value, (ast.List, ast.Tuple)):
+            raise ValueError('{}:{}: {}.__quests__ is not a list'.format(
+                path, node.lineno, class_def.name))
+
+        names = []
+        for element in node.value.elts:
+            if isinstance(element, ast.Name):
+                names.append(element.id)
+            elif isinstance(element, ast.Attribute):
+                names.append(element.attr)
+            else:
+                try:
+                    name = ast.literal_eval(element)
+                except ValueError:
+                    name = None
+                if not isinstance(name, str):
+                    raise ValueError('{}:{}: {}.__quests__ has an element that is not a quest '
+                                     'name or class'.format(path, node.lineno, class_def.name))
+                names.append(name)
+    return names
+
+
+def _get_registered_quest_sets(module_ast):
+    # Calls like "Registry.register_quest_set(ArtPathWay)" at module level.
+    names = []
+    for node in module_ast.body:
+        if not isinstance(node, ast.Expr) or not isinstance(node.value, ast.Call):
+            continue
+        func = node.value.func
+        if (isinstance(func, ast.Attribute) and func.attr == 'register_quest_set' and
+                len(node.value.args) == 1 and isinstance(node.value.args[0], ast.Name)):
+            names.append(node.value.args[0].id)
+    return names
+
+
+def read_quest_module(path, modname):
+    '''Return the quest sets registered and the quests defined by a quest module.'''
+    with open(path, 'r') as module_file:
+        module_ast = ast.parse(module_file.read(), path)
+
+    quests = []
+    quest_sets = {}
+    for node in module_ast.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+
+        base_names = _get_base_names(node)
+        if 'Quest' in base_names:
+            attributes = _get_class_attributes(node, QUEST_ATTRIBUTES, path)
+            tags = list(attributes['__tags__'])
+            pathway = next((tag.split(':', 1)[1] for tag in tags
+                            if tag.startswith('pathway:')), None)
+            quests.append({
+                'id': node.name,
+                'module': modname,
+                'tags': tags,
+                'pathway': pathway,
+                'pathway_order': attributes['__pathway_order__'],
+                'dependencies': list(attributes['__available_after_completing_quests__']),
+                'app_id': attributes['__app_id__'],
+            })
+        elif 'QuestSet' in base_names:
+            attributes = _get_class_attributes(node, QUEST_SET_ATTRIBUTES, path)
+            quest_sets[node.name] = {
+                'id': node.name,
+                'module': modname,
+                'pathway_name': attributes['__pathway_name__'],
+                'character_id': attributes['__character_id__'],
+                'quests': _get_listed_quests(node, path),
+            }
+
+    registered_quest_sets = []
+    for name in _get_registered_quest_sets(module_ast):
+        if name not in quest_sets:
+            raise ValueError('{}: registers {}, which is not a quest set defined in '
+                             'it'.format(path, name))
+        registered_quest_sets.append(quest_sets[name])
+
+    return registered_quest_sets, quests
+
+
+def build_episode_manifest(quest_folder):
+    modules = get_quest_modules(quest_folder)
+    quest_sets = []
+    quests = []
+    for modname in modules:
+        module_quest_sets, module_quests = read_quest_module(
+            os.path.join(quest_folder, modname + '.py'), modname)
+        quest_sets += module_quest_sets
+        quests += module_quests
+
+    quest_ids = set(quest['id'] for quest in quests)
+    for quest_set in quest_sets:
+        for quest_id in quest_set['quests']:
+            if quest_id not in quest_ids:
+                raise ValueError('{}: {} lists {}, which is not a quest of the '
+                                 'episode'.format(quest_folder, quest_set['id'], quest_id))
+
+    return {
+        'modules': modules,
+        'module_hashes': {modname: get_module_hash(quest_folder, modname)
+                          for modname in modules},
+        'quest_sets': quest_sets,
+        'quests': quests,
+    }
+
+
+def build_manifest(quest_folders):
+    '''Build the manifest of the given episode folders, named after the episodes.'''
+    return {
+        'version': MANIFEST_VERSION,
+        'episodes': {os.path.basename(os.path.normpath(quest_folder)):
+                     build_episode_manifest(quest_folder)
+                     for quest_folder in quest_folders},
+    }
+
+
+def write_manifest(path, manifest):
+    with open(path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+
+
+class QuestManifest:
+    '''Read-only view of a quest manifest.'''
+
+    def __init__(self, path):
+        with open(path, 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+
+        if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+            raise ValueError('{} is not a quest manifest with version {}'.format(
+                path, MANIFEST_VERSION))
+
+        self._episodes = manifest['episodes']
+
+    def has_episode(self, episode_name):
+        return episode_name in self._episodes
+
+    def is_up_to_date(self, episode_name, quest_folder):
+        '''Whether the modules of the episode and their source are still the ones in the folder.'''
+        if (not self.has_episode(episode_name) or
+                self.get_modules(episode_name) != get_quest_modules(quest_folder)):
+            return False
+
+        module_hashes = self._episodes[episode_name]['module_hashes']
+        try:
+            return all(get_module_hash(quest_folder, modname) == module_hashes.get(modname)
+                       for modname in self.get_modules(episode_name))
+        except OSError:
+            return False
+
+    def get_modules(self, episode_name):
+        return self._episodes[episode_name]['modules']
+
+    def get_quest_sets(self, episode_name):
+        return self._episodes[episode_name]['quest_sets']
+
+    def get_quests(self, episode_name):
+        return self._episodes[episode_name]['quests']
+
+    def get_quest(self, episode_name, quest_id):
+        for quest in self.get_quests(episode_name):
+            if quest['id'] == quest_id:
+                return quest
+        return None
+
+    def get_matching_quests(self, episode_name, tag):
+        '''Return the quests of the episode with the given tag, in definition order.'''
+        return [quest for quest in self.get_quests(episode_name) if tag in quest['tags']]
+
+    def get_pathway_quests(self, episode_name, quest_set):
+        '''Return the quests of a quest set, in the same order as QuestSet.get_quests().
+
+        These are the quests tagged with its pathway, if it has one, followed by the ones it
+        lists, sorted by their pathway order.
+        '''
+        quests = []
+        if quest_set['pathway_name'] is not None:
+            tag = 'pathway:' + quest_set['pathway_name'].lower()
+            quests += self.get_matching_quests(episode_name, tag)
+        quests += [self.get_quest(episode_name, quest_id) for quest_id in quest_set['quests']]
+        return sorted(quests, key=lambda quest: quest['pathway_order'])
@@ -126,7 +126,7 @@ class Sidetrack2(Quest):
         self.show_message('UNLOCK4')
 
         while not self.is_panel_unlocked('lock.sidetrack.1') and not self.is_cancelled():
-            self.connect_gss_changes().wait()
+            self.connect_gss_changes(['lock.sidetrack.1']).wait()
         self.pause(6)
 
         return self.step_play_level, False
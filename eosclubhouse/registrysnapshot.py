@@ -0,0 +1,115 @@
+#
+# Copyright © 2020 Endless OS Foundation LLC.
+#
+# This file is part of clubhouse
+# (see https://github.com/endlessm/clubhouse).
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+'''Snapshot of the state of the loaded episode, saved to start faster the next time.
+
+The snapshot has the configuration of every quest as it was in the game state service and
+the achievement points given by the complete ones. Everything else, like the availability
+of the quests, is computed from them as when loading from the game state service. It's only
+valid for the same app version and the same episode content, so any update makes it be
+ignored.
+'''
+
+import hashlib
+import json
+import os
+
+
+SNAPSHOT_VERSION = 2
+
+
+def get_content_version(quest_folder):
+    '''Return a version identifying the current content of the modules in a quest folder.'''
+    content_hash = hashlib.sha1()
+    try:
+        entries = sorted(os.scandir(quest_folder), key=lambda entry: entry.name)
+    except OSError:
+        return None
+
+    for entry in entries:
+        if not entry.name.endswith('.py') or not entry.is_file():
+            continue
+        stat = entry.stat()
+        content_hash.update('{}:{}:{}\n'.format(entry.name, stat.st_mtime_ns,
+                                                stat.st_size).encode('utf-8'))
+    return content_hash.hexdigest()
+
+
+class RegistrySnapshot:
+
+    def __init__(self, app_version, content_version, episode, quests=None,
+                 achievement_points=None):
+        self.app_version = app_version
+        self.content_version = content_version
+        self.episode = episode
+        # The quests by id, with their "conf".
+        self.quests = quests or {}
+        self.achievement_points = achievement_points or {}
+
+    def add_quest(self, quest_id, conf):
+        self.quests[quest_id] = {'conf': conf}
+
+    def get_quest_conf(self, quest_id):
+        '''Return a copy of the configuration of a quest, or None if it's not in the snapshot.'''
+        quest = self.quests.get(quest_id)
+        if quest is None:
+            return None
+        return json.loads(json.dumps(quest['conf']))
+
+    def is_valid_for(self, app_version, content_version, episode):
+        return (self.app_version == app_version and content_version is not None and
+                self.content_version == content_version and self.episode == episode)
+
+    @classmethod
+    def read(class_, path):
+        '''Read a snapshot, returning None if there is none or it can't be read.'''
+        try:
+            with open(path, 'r') as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+            return None
+
+        try:
+            return class_(snapshot['app_version'], snapshot['content_version'],
+                          snapshot['episode'], snapshot['quests'],
+                          snapshot['achievement_points'])
+        except KeyError:
+            return None
+
+    def write(self, path):
+        '''Write the snapshot, replacing the previous one only when it's been written.'''
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'app_version': self.app_version,
+            'content_version': self.content_version,
+            'episode': self.episode,
+            'quests': self.quests,
+            'achievement_points': self.achievement_points,
+        }
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as snapshot_file:
+            json.dump(snapshot, snapshot_file, separators=(',', ':'), sort_keys=True)
+        os.replace(tmp_path, path)
@@ -19,6 +19,9 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
 
+import contextlib
+import copy
+import itertools
 import os
 import json
 import subprocess
@@ -940,7 +943,84 @@ class App:
                 logger.warning(f'Can not remove the override file {self.dbus_name}')
 
 
-class GameStateService(GObject.GObject):
+class _KeyWatchTrie:
+    '''Trie of the keys and prefixes watched, to find the watches matching a changed key.
+
+    This only narrows the watches down if the service's "changed" signal has the key that
+    changed. When it doesn't, the key is None and all the watches match.
+    '''
+
+    class _Node:
+        __slots__ = ('children', 'key_watches', 'prefix_watches')
+
+        def __init__(self):
+            self.children = {}
+            # The callbacks and their arguments, by watch id.
+            self.key_watches = {}
+            self.prefix_watches = {}
+
+    def __init__(self):
+        self._root = self._Node()
+        # The key or prefix of every watch, and whether it's a prefix, by watch id.
+        self._watches = {}
+
+    def __len__(self):
+        return len(self._watches)
+
+    def add(self, watch_id, key, is_prefix, callback, args):
+        node = self._root
+        for char in key:
+            node = node.children.setdefault(char, self._Node())
+        watches = node.prefix_watches if is_prefix else node.key_watches
+        watches[watch_id] = (callback, args)
+        self._watches[watch_id] = (key, is_prefix)
+
+    def remove(self, watch_id):
+        key, is_prefix = self._watches.pop(watch_id)
+        path = [self._root]
+        for char in key:
+            path.append(path[-1].children[char])
+
+        node = path[-1]
+        watches = node.prefix_watches if is_prefix else node.key_watches
+        del watches[watch_id]
+
+        # Prune the nodes left without watches or children.
+        for char, parent in zip(reversed(key), reversed(path[:-1])):
+            if node.children or node.key_watches or node.prefix_watches:
+                break
+            del parent.children[char]
+            node = parent
+
+    def __contains__(self, watch_id):
+        return watch_id in self._watches
+
+    def get_matches(self, key):
+        '''Return the watch ids, callbacks and arguments of the watches matching a key.
+
+        If key is None, all of them are returned.
+        '''
+        if key is None:
+            nodes = [self._root]
+            matches = []
+            while nodes:
+                node = nodes.pop()
+                matches += node.key_watches.items()
+                matches += node.prefix_watches.items()
+                nodes += node.children.values()
+            return matches
+
+        node = self._root
+        matches = list(node.prefix_watches.items())
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return matches
+            matches += node.prefix_watches.items()
+        return matches + list(node.key_watches.items())
+
+
+class _GameStateServiceImpl(GObject.GObject):
 
     __gsignals__ = {
         'changed': (
@@ -948,10 +1028,49 @@ class GameStateService(GObject.GObject):
         ),
     }
 
+
+class GameStateService:
+    '''Handle of the game state service.
+
+    The handles are cheap to create: they share the connection to the service, its only
+    signal handler, the cache and the watches. The "changed" signal of any of them is emitted
+    on the same object, so connecting to it doesn't add handlers to the service's signal.
+    '''
+
+    _impl = None
     _proxy = None
+    # The handlers connected to the signal of the proxy the cache is kept for.
+    _proxy_handler_ids = []
     _DBUS_PATH = '/com/hack_computer/GameStateService'
     _DBUS_ID = 'com.hack_computer.GameStateService'
 
+    # Process-wide cache of the values read from the service or written to it, by key, with
+    # the missing keys as _MISSING. It's kept for the proxy in _cache_proxy, and patched from
+    # its "changed" signal, except for the keys in _pending_writes: those have a local write
+    # the service hasn't replied to yet, so the cache already has the newest value. Every key
+    # is mapped to the id of its last write, which ends when that write is replied to or
+    # fails, whether or not the service signals the change.
+    _MISSING = object()
+    _NOT_CACHED = object()
+    _cache = {}
+    _cache_proxy = None
+    _pending_writes = {}
+    _write_counter = itertools.count(1)
+    _cache_hits = 0
+    _cache_misses = 0
+
+    # The writes collected by every batch() block being run, from the outermost one, with
+    # the last value written to every key, in the order of those last writes.
+    _batch_writes = []
+    # The keys sent by a batch, whose watches have been notified already, so the change
+    # signalled back by the service is not dispatched again. They are kept until then, or
+    # until the write is replied to or fails, since the service signals it before replying.
+    _batch_changes = set()
+
+    # The callbacks watching the changes of keys or of keys with a prefix.
+    _watch_trie = _KeyWatchTrie()
+    _watch_counter = itertools.count(1)
+
     @classmethod
     def _get_gss_proxy(klass):
         if klass._proxy is None:
@@ -963,39 +1082,315 @@ class GameStateService(GObject.GObject):
                                                           klass._DBUS_ID,
                                                           None)
 
+        if klass._cache_proxy is not klass._proxy:
+            for handler_id in klass._proxy_handler_ids:
+                klass._cache_proxy.disconnect(handler_id)
+            klass._proxy_handler_ids = []
+
+            klass._cache_proxy = klass._proxy
+            klass._clear_cache()
+            klass._proxy_handler_ids.append(klass._proxy.connect('g-signal',
+                                                                 klass._g_signal_cb))
+
         return klass._proxy
 
-    # @todo: This is becoming a proxy of a proxy, so we should try to use a
-    # more direct later
-    def __init__(self):
-        super().__init__()
+    @classmethod
+    def _get_impl(klass):
+        # The "changed" signal is emitted from the service's one.
+        klass._get_gss_proxy()
+        if klass._impl is None:
+            klass._impl = _GameStateServiceImpl()
+        return klass._impl
 
-        self._get_gss_proxy().connect('g-signal', self._g_signal_cb)
+    @classmethod
+    def get_handler_count(klass):
+        '''Return the number of handlers connected to the signal of the service's proxy.
 
-    def _g_signal_cb(self, proxy, sender_name, signal_name, params):
-        if signal_name == 'changed':
-            self.emit('changed')
+        It's one at most: the watches are dispatched from that handler, by the key in the
+        service's "changed" signal. If the signal has no key, every watch is called.
+        '''
+        if klass._proxy is not klass._cache_proxy:
+            return 0
+        return len(klass._proxy_handler_ids)
+
+    def __getattr__(self, name):
+        # The GObject API, like connect() or emit(), is the one of the shared object.
+        return getattr(self._get_impl(), name)
+
+    @classmethod
+    def _clear_cache(klass):
+        klass._cache.clear()
+        klass._pending_writes.clear()
+        klass._batch_changes.clear()
+
+    @classmethod
+    def _g_signal_cb(klass, proxy, sender_name, signal_name, params):
+        if signal_name != 'changed' or proxy is not klass._cache_proxy:
+            return
+
+        key, value = klass._unpack_changed_params(params)
+        if key is None:
+            # Without knowing what changed, nothing cached can be trusted.
+            klass._clear_cache()
+        else:
+            klass._cache_change(key, value)
+
+        if key in klass._batch_changes:
+            klass._batch_changes.discard(key)
+        else:
+            klass._dispatch_change(key)
+        klass._get_impl().emit('changed')
+
+    @classmethod
+    def _cache_change(klass, key, value):
+        if key in klass._pending_writes:
+            return
+
+        if value is klass._NOT_CACHED:
+            klass._cache.pop(key, None)
+        else:
+            klass._cache[key] = value
+
+    @classmethod
+    def _dispatch_change(klass, key):
+        for watch_id, (callback, args) in klass._watch_trie.get_matches(key):
+            # A callback may have removed the watches after it.
+            if watch_id in klass._watch_trie:
+                callback(key, *args)
+
+    @classmethod
+    def watch(klass, key, callback, *args):
+        '''Call callback(key, *args) when the given key changes.
+
+        The key passed is None when the service doesn't tell which key changed, in which case
+        every watch is called, whatever its key. Return an id to remove the watch with
+        unwatch().
+        '''
+        return klass._add_watch(key, False, callback, args)
+
+    @classmethod
+    def watch_prefix(klass, prefix, callback, *args):
+        '''Call callback(key, *args) when a key starting with the given prefix changes.
+
+        The key passed is None when the service doesn't tell which key changed, in which case
+        every watch is called, whatever its prefix. Return an id to remove the watch with
+        unwatch().
+        '''
+        return klass._add_watch(prefix, True, callback, args)
+
+    @classmethod
+    def _add_watch(klass, key, is_prefix, callback, args):
+        klass._get_gss_proxy()
+        watch_id = next(klass._watch_counter)
+        klass._watch_trie.add(watch_id, key, is_prefix, callback, args)
+        return watch_id
+
+    @classmethod
+    def unwatch(klass, watch_id):
+        if watch_id not in klass._watch_trie:
+            logger.warning('Cannot remove the game state watch %r, it doesn\'t exist', watch_id)
+            return
+        klass._watch_trie.remove(watch_id)
+
+    @classmethod
+    def _unpack_changed_params(klass, params):
+        # The key and the new value, if the signal has them.
+        values = params.unpack() if params is not None else ()
+        if len(values) == 0 or not isinstance(values[0], str):
+            return None, klass._NOT_CACHED
+        return values[0], values[1] if len(values) > 1 else klass._NOT_CACHED
+
+    @classmethod
+    def _cache_write(klass, key, variant):
+        write_id = next(klass._write_counter)
+        klass._cache[key] = variant.unpack()
+        klass._pending_writes[key] = write_id
+        return write_id
+
+    @classmethod
+    def _cache_write_done(klass, key, write_id):
+        klass._batch_changes.discard(key)
+        if klass._pending_writes.get(key) == write_id:
+            del klass._pending_writes[key]
+
+    @classmethod
+    def _cache_write_failed(klass, key, write_id):
+        klass._batch_changes.discard(key)
+        # A newer write has put its value in the cache already.
+        if klass._pending_writes.get(key) == write_id:
+            del klass._pending_writes[key]
+            klass._cache.pop(key, None)
+
+    @classmethod
+    def _add_to_batch(klass, key, variant):
+        if not klass._batch_writes:
+            return False
+
+        klass._get_gss_proxy()
+        # It's pending until it's sent at the end of the batch and replied to.
+        klass._cache_write(key, variant)
+        writes = klass._batch_writes[-1]
+        writes.pop(key, None)
+        writes[key] = variant
+        return True
+
+    @classmethod
+    def _discard_batch_writes(klass, writes):
+        # The values written by the outer blocks are the ones to read again.
+        for key in writes:
+            variant = next((outer_writes[key] for outer_writes in reversed(klass._batch_writes)
+                            if key in outer_writes), None)
+            if variant is None:
+                klass._cache.pop(key, None)
+                klass._pending_writes.pop(key, None)
+            else:
+                klass._cache[key] = variant.unpack()
+
+    @contextlib.contextmanager
+    def batch(self):
+        '''Collect the writes done in the block, by any instance, and send them at its end.
+
+        Only the last value written to every key is sent, asynchronously, so the block doesn't
+        wait for the service. The values written can be read back inside the block. If the
+        block raises, its writes are discarded, but not the ones of the blocks it's nested in.
+        The writes of a nested block are sent with the outermost one, and then the watches
+        of the keys written are called, once per key.
+        '''
+        klass = type(self)
+        klass._batch_writes.append({})
+        try:
+            yield self
+        except BaseException:
+            klass._discard_batch_writes(klass._batch_writes.pop())
+            raise
+
+        writes = klass._batch_writes.pop()
+        if klass._batch_writes:
+            outer_writes = klass._batch_writes[-1]
+            for key, variant in writes.items():
+                outer_writes.pop(key, None)
+                outer_writes[key] = variant
+            return
+
+        klass._batch_changes.update(writes)
+        for key, variant in writes.items():
+            self.set_async(key, variant)
+
+        for key in writes:
+            klass._dispatch_change(key)
+
+    @classmethod
+    def get_cache_stats(klass):
+        '''Return the number of reads answered by the cache, and of the ones that weren't.'''
+        return {'hits': klass._cache_hits, 'misses': klass._cache_misses}
 
     def set(self, key, variant):
         variant = convert_variant_arg(variant)
-        self._get_gss_proxy().Set('(sv)', key, variant)
+        if self._add_to_batch(key, variant):
+            return
+
+        proxy = self._get_gss_proxy()
+
+        # The cache is written first, so the service's change signal finds it written.
+        write_id = self._cache_write(key, variant)
+        try:
+            proxy.Set('(sv)', key, variant)
+        except GLib.Error:
+            self._cache_write_failed(key, write_id)
+            raise
+        self._cache_write_done(key, write_id)
 
     def set_async(self, key, variant):
         variant = convert_variant_arg(variant)
+        if self._add_to_batch(key, variant):
+            return
+
+        proxy = self._get_gss_proxy()
+
+        def on_set_done(proxy, result, data=None):
+            self._cache_write_done(key, write_id)
 
         def on_set_error(proxy, error, data=None):
             logger.error('Error calling set_async on GSS: %s', error.message)
+            self._cache_write_failed(key, write_id)
 
-        self._get_gss_proxy().Set('(sv)', key, variant, error_handler=on_set_error)
+        write_id = self._cache_write(key, variant)
+        proxy.Set('(sv)', key, variant, result_handler=on_set_done, error_handler=on_set_error)
 
     def get(self, key, value_if_missing=None):
+        klass = type(self)
+        proxy = self._get_gss_proxy()
+
+        # Copies are returned, since the callers often modify the values they get.
+        value = klass._cache.get(key, klass._NOT_CACHED)
+        if value is not klass._NOT_CACHED:
+            klass._cache_hits += 1
+            return value_if_missing if value is klass._MISSING else copy.deepcopy(value)
+
+        klass._cache_misses += 1
         try:
-            return self._get_gss_proxy().Get('(s)', key)
+            value = proxy.Get('(s)', key)
         except GLib.Error as e:
             # Raise errors unless they are the expected (key missing)
             if not self._is_key_error(e):
                 raise
-        return value_if_missing
+            klass._cache[key] = klass._MISSING
+            return value_if_missing
+
+        klass._cache[key] = value
+        return copy.deepcopy(value)
+
+    def get_many(self, keys, value_if_missing=None):
+        '''Return a dict with the value of every key, reading all the ones not cached at once.
+
+        The service can only get one key per call, so instead of waiting for the reply of
+        every call before making the next one, all of them are sent first and their replies
+        are collected in a main context of their own.
+        '''
+        klass = type(self)
+        proxy = self._get_gss_proxy()
+
+        keys = list(dict.fromkeys(keys))
+        keys_to_read = [key for key in keys if key not in klass._cache]
+        klass._cache_hits += len(keys) - len(keys_to_read)
+        klass._cache_misses += len(keys_to_read)
+        if keys_to_read:
+            klass._cache.update(klass._read_keys(proxy, keys_to_read))
+
+        values = {}
+        for key in keys:
+            value = klass._cache[key]
+            values[key] = value_if_missing if value is klass._MISSING else copy.deepcopy(value)
+        return values
+
+    @classmethod
+    def _read_keys(klass, proxy, keys):
+        values = {}
+        errors = []
+
+        def _on_get_done(proxy, result, key):
+            try:
+                values[key] = proxy.call_finish(result).unpack()[0]
+            except GLib.Error as e:
+                if not klass._is_key_error(e):
+                    errors.append(e)
+                values[key] = klass._MISSING
+
+        context = GLib.MainContext()
+        context.push_thread_default()
+        try:
+            for key in keys:
+                proxy.call('Get', GLib.Variant('(s)', (key,)), Gio.DBusCallFlags.NONE, -1, None,
+                           _on_get_done, key)
+            while len(values) < len(keys):
+                context.iteration(True)
+        finally:
+            context.pop_thread_default()
+
+        # Raise errors unless they are the expected (key missing)
+        if errors:
+            raise errors[0]
+        return values
 
     def update(self, key, new_value, value_if_missing=None):
         state = self.get(key, value_if_missing)
@@ -1006,7 +1401,12 @@ class GameStateService(GObject.GObject):
         self.set(key, state)
 
     def reset(self):
-        return self._get_gss_proxy().Reset()
+        proxy = self._get_gss_proxy()
+        # The writes batched so far would be reset anyway.
+        for writes in type(self)._batch_writes:
+            writes.clear()
+        self._clear_cache()
+        return proxy.Reset()
 
     @staticmethod
     def _is_key_error(error):
@@ -1015,7 +1415,15 @@ class GameStateService(GObject.GObject):
 
 
 class OldGameStateService(GameStateService):
+    _impl = None
     _proxy = None
+    _proxy_handler_ids = []
+    _cache = {}
+    _cache_proxy = None
+    _pending_writes = {}
+    _batch_writes = []
+    _batch_changes = set()
+    _watch_trie = _KeyWatchTrie()
     _DBUS_PATH = '/com/endlessm/GameStateService'
     _DBUS_ID = 'com.endlessm.GameStateService'
 
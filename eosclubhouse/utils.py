@@ -19,23 +19,31 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
 
+import bisect
 import configparser
 import csv
+import functools
 import gi
 import glob
+import heapq
 import itertools
 import json
 gi.require_version('Json', '1.0')
+import math
 import os
+import threading
 import time
 import datetime
+import weakref
 
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from gi.repository import GLib, GObject, Json
 from string import Template
 
 from eosclubhouse import config, logger
+from eosclubhouse.catalog import ContentPack, normalize_string_row
 
 
 def get_alternative_quests_dir():
@@ -48,12 +56,105 @@ class _CircleList(list):
         return super().__getitem__(key)
 
 
+class ContentPackDB:
+    '''The content pack compiled at build time from the CSV files.
+
+    The content pack is opened only once, and all the DB classes load their data from it. If
+    it can't be used, they parse the CSV files instead.
+    '''
+
+    _pack = None
+    _opened = False
+
+    @classmethod
+    def get_pack(class_):
+        if not class_._opened:
+            class_._opened = True
+            class_._pack = class_._open_pack()
+        return class_._pack
+
+    @classmethod
+    def _open_pack(class_):
+        if not os.path.exists(config.CONTENT_PACK):
+            return None
+
+        try:
+            return ContentPack(config.CONTENT_PACK)
+        except (OSError, ValueError) as e:
+            logger.warning('Could not open the content pack, falling back to CSV: %s', e)
+
+        return None
+
+    @classmethod
+    def get_table(class_, name):
+        '''Return the table with the given name, or None if it's not available.'''
+        pack = class_.get_pack()
+        if pack is None or name not in pack:
+            return None
+        return pack.get_table(name)
+
+    @classmethod
+    def validate(class_):
+        '''Check the whole content pack, returning a list with the problems found.'''
+        try:
+            pack = ContentPack(config.CONTENT_PACK)
+        except (OSError, ValueError) as e:
+            return [str(e)]
+
+        errors = pack.validate()
+        pack.close()
+        return errors
+
+
+class _CSVLoadInBackground:
+    '''Parse a list of CSV files in a pool of worker threads, see DictFromCSV.load_csv_async().
+
+    The files are parsed in a thread of its own, so the main loop is not blocked waiting for
+    the pool, and done_cb is called in the main loop when all of them have been parsed.
+    '''
+
+    _MAX_WORKERS = 4
+
+    def __init__(self, parse_func, csv_paths, done_cb):
+        self.csv_paths = csv_paths
+        self._parse_func = parse_func
+        self._done_cb = done_cb
+        self._files_contents = None
+        self._error = None
+        self._thread = threading.Thread(target=self._parse_files, daemon=True)
+        self._thread.start()
+
+    def _parse_files(self):
+        try:
+            with ThreadPoolExecutor(max_workers=self._MAX_WORKERS) as executor:
+                # map() returns the results in the order of the paths, whatever the order in
+                # which they are parsed.
+                self._files_contents = list(executor.map(self._parse_func, self.csv_paths))
+        except Exception as e:
+            self._error = e
+
+        GLib.idle_add(self._done_cb)
+
+    def wait(self):
+        '''Wait for all the files to be parsed, returning a dictionary per file.'''
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._files_contents
+
+
 class DictFromCSV:
 
     _csv_dict = {}
 
+    # The content pack table with the rows of the CSV file, if it's compiled in it.
+    _content_table = None
+
+    # The load started by load_csv_async(), while it's not finished.
+    _pending_load = None
+
     def __init__(self, csv_path, ignore_header=False):
-        if self._csv_dict:
+        if self.get_dict():
             return
         self.load_csv(csv_path, ignore_header)
 
@@ -67,27 +168,99 @@ class DictFromCSV:
                 class_.set_key_value_from_csv_row(row, contents)
 
     @classmethod
-    def load_csv(class_, csv_original_path, ignore_header):
+    def _parse_csv_file(class_, csv_path, ignore_header):
         contents = {}
+        class_._do_load_csv(csv_path, contents, ignore_header)
+        return contents
 
+    @classmethod
+    def _get_csv_paths(class_, csv_original_path):
         file_name = os.path.basename(csv_original_path)
         dirs = [csv_original_path, os.path.join(get_alternative_quests_dir(), file_name)]
 
+        # The shipped rows come from the content pack if it has them, so only the files in
+        # the alternative quests dir need to be parsed.
+        if ContentPackDB.get_table(class_._content_table) is not None:
+            dirs.remove(csv_original_path)
+
         for csv_or_dir_path in dirs:
             if not os.path.exists(csv_or_dir_path):
                 continue
 
             if not os.path.isdir(csv_or_dir_path):
-                class_._do_load_csv(csv_or_dir_path, contents, ignore_header)
+                yield csv_or_dir_path
                 continue
 
-            for csv_path in glob.glob(os.path.join(csv_or_dir_path, '*csv')):
-                class_._do_load_csv(csv_path, contents, ignore_header)
+            yield from glob.glob(os.path.join(csv_or_dir_path, '*csv'))
+
+    @classmethod
+    def _get_initial_contents(class_):
+        contents = {}
+        table = ContentPackDB.get_table(class_._content_table)
+        if table is not None:
+            for row in table.rows():
+                class_.set_key_value_from_csv_row(row, contents)
+        return contents
+
+    @classmethod
+    def load_csv(class_, csv_original_path, ignore_header):
+        contents = class_._get_initial_contents()
+        for csv_path in class_._get_csv_paths(csv_original_path):
+            class_._do_load_csv(csv_path, contents, ignore_header)
 
         class_._csv_dict = contents
 
+    @classmethod
+    def _prepare_load(class_, csv_original_path):
+        '''Return the CSV files that load_csv_async() has to parse, in loading order.'''
+        return list(class_._get_csv_paths(csv_original_path))
+
+    @classmethod
+    def _merge_loaded_contents(class_, csv_paths, files_contents):
+        '''Set the data from the dictionaries parsed from each of the CSV files.'''
+        contents = class_._get_initial_contents()
+        for file_contents in files_contents:
+            contents.update(file_contents)
+
+        class_._csv_dict = contents
+
+    @classmethod
+    def load_csv_async(class_, csv_original_path, ignore_header=False, callback=None):
+        '''Load the CSV files like load_csv(), parsing them in a pool of worker threads.
+
+        Each file is parsed into a dictionary of its own, so this can only be used by the
+        classes whose set_key_value_from_csv_row() doesn't depend on the rows already loaded
+        or modify anything but the given dictionary. The dictionaries are merged in the same
+        order load_csv() loads the files, so the result is the same.
+
+        The callback is called in the main loop once the data is ready. Until then, getting
+        the data waits for the files to be parsed.
+        '''
+        if class_._pending_load is not None:
+            return
+
+        def _done_cb():
+            class_._finish_pending_load()
+            if callback is not None:
+                callback()
+            return GLib.SOURCE_REMOVE
+
+        csv_paths = class_._prepare_load(csv_original_path)
+        parse_func = functools.partial(class_._parse_csv_file, ignore_header=ignore_header)
+        class_._pending_load = _CSVLoadInBackground(parse_func, csv_paths, _done_cb)
+
+    @classmethod
+    def _finish_pending_load(class_):
+        load = class_._pending_load
+        if load is None:
+            return
+
+        class_._pending_load = None
+        class_._merge_loaded_contents(load.csv_paths, load.wait())
+
     @classmethod
     def get_dict(class_):
+        class_._finish_pending_load()
         return class_._csv_dict
 
     @classmethod
@@ -99,6 +272,9 @@ class _ListFromCSV:
 
     _csv_list = []
 
+    # The content pack table with the rows of the CSV file, if it's compiled in it.
+    _content_table = None
+
     def __init__(self, csv_path):
         if self._csv_list:
             return
@@ -110,6 +286,12 @@ class _ListFromCSV:
 
     @classmethod
     def _load_csv(class_, csv_path):
+        table = ContentPackDB.get_table(class_._content_table)
+        if table is not None:
+            for row in table.rows():
+                class_.append_value_from_csv_row(row, class_._csv_list)
+            return
+
         first = True
         with open(csv_path, 'r') as csv_file:
             for row in csv.reader(csv_file):
@@ -123,14 +305,216 @@ class _ListFromCSV:
         raise NotImplementedError()
 
 
+class _KeyIndex:
+    '''Sorted index of keys, to find all the keys that start with a given prefix.'''
+
+    def __init__(self, keys):
+        self._keys = sorted(keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get_keys_with_prefix(self, prefix):
+        start = end = bisect.bisect_left(self._keys, prefix)
+        while end < len(self._keys) and self._keys[end].startswith(prefix):
+            end += 1
+        return self._keys[start:end]
+
+
 class QuestStringCatalog(DictFromCSV):
 
+    # The shipped strings are served from the content pack's strings table, when it's
+    # available. The CSV files are still parsed for the user overrides in the alternative
+    # quests dir, or for everything if there's no content pack.
+    _catalog = None
+    _loaded = False
+
+    # In sharded mode, each CSV file is a shard with the strings of one quest, named after
+    # the quest's strings prefix (e.g. "multiplepages.csv" has the "MULTIPLEPAGES_*" keys).
+    # Shards are only parsed when a key with their prefix is needed, and at most
+    # _max_shards of them are kept, evicting the least recently used. The shards in
+    # _PINNED_SHARDS are shared by all quests, so they are always loaded.
+    _max_shards = int(os.environ.get('CLUBHOUSE_STRINGS_SHARDS', 0))
+    _PINNED_SHARDS = ['NOQUEST']
+    _shard_paths = {}
+    _shards = OrderedDict()
+    _shard_indexes = {}
+
+    # Prefix index of the keys in _csv_dict, see get_keys_with_prefix().
+    _csv_index = None
+
+    # The strings parsed from each CSV file that is not a shard, in loading order, so a
+    # single file can be reparsed when it changes, see reload_csv_file().
+    _file_contents = OrderedDict()
+
     def __init__(self):
+        self._finish_pending_load()
+        if self._loaded:
+            return
         super().__init__(config.QUESTS_STRINGS_DIR)
 
+    @classmethod
+    def _open_catalog(class_):
+        return ContentPackDB.get_table('strings')
+
+    @classmethod
+    def _get_csv_paths(class_, csv_original_path):
+        dirs = [os.path.join(get_alternative_quests_dir(), os.path.basename(csv_original_path))]
+        if class_._catalog is None:
+            dirs.insert(0, csv_original_path)
+
+        for csv_dir in dirs:
+            yield from glob.glob(os.path.join(csv_dir, '*csv'))
+
+    @staticmethod
+    def _get_shard_prefix(csv_path):
+        return os.path.splitext(os.path.basename(csv_path))[0].upper()
+
+    @classmethod
+    def _prepare_load(class_, csv_original_path):
+        class_._catalog = class_._open_catalog()
+        class_._shard_paths = {}
+        class_._shards = OrderedDict()
+        class_._shard_indexes = {}
+
+        # Shards are not parsed until they are needed.
+        csv_paths = []
+        for csv_path in class_._get_csv_paths(csv_original_path):
+            if class_._is_shard_path(csv_path):
+                prefix = class_._get_shard_prefix(csv_path)
+                class_._shard_paths.setdefault(prefix, []).append(csv_path)
+            else:
+                csv_paths.append(csv_path)
+        return csv_paths
+
+    @classmethod
+    def _merge_loaded_contents(class_, csv_paths, files_contents):
+        class_._file_contents = OrderedDict(zip(csv_paths, files_contents))
+
+        contents = {}
+        for file_contents in files_contents:
+            contents.update(file_contents)
+
+        class_._csv_dict = contents
+        class_._csv_index = _KeyIndex(contents)
+        class_._loaded = True
+
+    @classmethod
+    def load_csv(class_, csv_original_path, ignore_header=False):
+        csv_paths = class_._prepare_load(csv_original_path)
+        class_._merge_loaded_contents(csv_paths, [class_._parse_csv_file(csv_path, ignore_header)
+                                                  for csv_path in csv_paths])
+
+    @classmethod
+    def _is_shard_path(class_, csv_path):
+        return (class_._max_shards > 0 and
+                class_._get_shard_prefix(csv_path) not in class_._PINNED_SHARDS)
+
+    @classmethod
+    def reload_csv_file(class_, csv_path):
+        '''Reparse a strings CSV file that has been created, modified or removed.
+
+        Only the strings of the given file are updated, so changes to the quests strings can
+        be applied without reloading the whole catalog.
+        '''
+        class_._finish_pending_load()
+        exists = os.path.exists(csv_path)
+
+        if class_._is_shard_path(csv_path):
+            prefix = class_._get_shard_prefix(csv_path)
+            paths = class_._shard_paths.setdefault(prefix, [])
+            if exists and csv_path not in paths:
+                paths.append(csv_path)
+            elif not exists and csv_path in paths:
+                paths.remove(csv_path)
+            if not paths:
+                del class_._shard_paths[prefix]
+
+            # The shard will be parsed again the next time one of its keys is needed.
+            class_._shards.pop(prefix, None)
+            class_._shard_indexes.pop(prefix, None)
+            logger.debug('Strings shard %s will be reloaded', prefix)
+            return
+
+        file_contents = {}
+        if exists:
+            try:
+                class_._do_load_csv(csv_path, file_contents, False)
+            except (OSError, ValueError, csv.Error) as e:
+                logger.warning('Could not reload the strings in %s: %s', csv_path, e)
+                return
+
+        old_file_contents = class_._file_contents.pop(csv_path, {})
+        if exists:
+            class_._file_contents[csv_path] = file_contents
+
+        # A key that was also in other files gets the value of the last file loaded with it.
+        csv_dict = class_.get_dict()
+        for key in old_file_contents.keys() | file_contents.keys():
+            for contents in reversed(class_._file_contents.values()):
+                if key in contents:
+                    csv_dict[key] = contents[key]
+                    break
+            else:
+                csv_dict.pop(key, None)
+
+        class_._csv_index = None
+        logger.debug('Reloaded strings from %s', csv_path)
+
+    @classmethod
+    def _get_shard_for_key(class_, key):
+        # Find the longest shard prefix for the key, e.g. "STORY_ADA1" for
+        # "STORY_ADA1_QUEST_NAME".
+        end = len(key)
+        while True:
+            end = key.rfind('_', 0, end)
+            if end <= 0:
+                return None
+
+            prefix = key[:end]
+            if prefix in class_._shard_paths:
+                return class_._load_shard(prefix)
+
+    @classmethod
+    def _load_shard(class_, prefix):
+        shard = class_._shards.get(prefix)
+        if shard is not None:
+            class_._shards.move_to_end(prefix)
+            return shard
+
+        shard = {}
+        for csv_path in class_._shard_paths[prefix]:
+            class_._do_load_csv(csv_path, shard, False)
+
+        # Keys that don't belong to the shard's prefix would not be found once the shard is
+        # evicted, so keep them with the pinned ones.
+        for key in [k for k in shard if not k.startswith(prefix + '_')]:
+            logger.debug('String %s does not belong to shard %s, pinning it.', key, prefix)
+            class_._csv_dict[key] = shard.pop(key)
+
+        class_._shards[prefix] = shard
+        class_._shard_indexes[prefix] = _KeyIndex(shard)
+        logger.debug('Loaded strings shard %s', prefix)
+
+        while len(class_._shards) > class_._max_shards:
+            evicted_prefix, _evicted = class_._shards.popitem(last=False)
+            del class_._shard_indexes[evicted_prefix]
+            logger.debug('Evicted strings shard %s', evicted_prefix)
+
+        return shard
+
     @classmethod
     def get_info(class_, key):
-        return class_.get_dict().get(key)
+        info = class_.get_dict().get(key)
+        if info is None and class_._shard_paths:
+            shard = class_._get_shard_for_key(key)
+            if shard is not None:
+                info = shard.get(key)
+        if info is None and class_._catalog is not None:
+            row = class_._catalog.get(key)
+            if row is not None:
+                info = class_._info_from_row(row)
+        return info
 
     @classmethod
     def get_string(class_, key):
@@ -139,47 +523,78 @@ class QuestStringCatalog(DictFromCSV):
             return info['txt']
 
     @classmethod
-    def get_hint_keys(class_, key):
-        hint_keys = [key]
-        for hint_index in itertools.count(start=1):
-            hint_key = '{}_HINT{}'.format(key, hint_index)
-            if class_.get_info(hint_key) is None:
-                break
-            hint_keys.append(hint_key)
+    def _get_csv_index(class_):
+        # The index is rebuilt if the strings have been changed since it was built.
+        if class_._csv_index is None or len(class_._csv_index) != len(class_.get_dict()):
+            class_._csv_index = _KeyIndex(class_.get_dict())
+        return class_._csv_index
+
+    @classmethod
+    def get_keys_with_prefix(class_, prefix):
+        '''Return all the keys in the catalog that start with the given prefix, in order.
+
+        For example, passing a quest's strings prefix like "MULTIPLEPAGES_" returns all the
+        keys of that quest.
+        '''
+        keys = set(class_._get_csv_index().get_keys_with_prefix(prefix))
+
+        # Load any shard that can have keys with this prefix.
+        for shard_prefix in list(class_._shard_paths):
+            shard_prefix_ = shard_prefix + '_'
+            if prefix.startswith(shard_prefix_) or shard_prefix_.startswith(prefix):
+                class_._load_shard(shard_prefix)
+                keys.update(class_._shard_indexes[shard_prefix].get_keys_with_prefix(prefix))
 
-        return hint_keys
+        if class_._catalog is not None:
+            keys.update(class_._catalog.get_keys_with_prefix(prefix))
+
+        return sorted(keys)
 
     @classmethod
-    def get_loop_messages(class_, key, start=1):
-        messages = _CircleList()
+    def _get_numbered_keys(class_, prefix, start):
+        # Return the keys made of the prefix and consecutive numbers from "start", up to the
+        # first number missing.
+        keys = set(class_.get_keys_with_prefix(prefix))
+        numbered_keys = []
         for index in itertools.count(start=start):
-            message_id = f'{key}_{index}'
-            if class_.get_info(message_id) is None:
+            numbered_key = f'{prefix}{index}'
+            if numbered_key not in keys:
                 break
-            messages.append(message_id)
+            numbered_keys.append(numbered_key)
 
-        return messages
+        return numbered_keys
 
     @classmethod
-    def set_key_value_from_csv_row(class_, csv_row, contents_dict):
-        if len(csv_row) == 6:
-            # TODO: Remove this when all the CSV files have 6 columns.
-            key, txt, character_id, mood, sfx_sound, bg_sound = csv_row
-        else:
-            key, txt, character_id, mood, sfx_sound, bg_sound = (*csv_row, '')
-        contents_dict[key] = {
-            'txt': txt.strip(),
-            'character_id': character_id.lower().strip(),
-            'mood': mood.lower().strip(),
-            'sfx_sound': sfx_sound.lower().strip(),
-            'bg_sound': bg_sound.lower().strip()
+    def get_hint_keys(class_, key):
+        return [key] + class_._get_numbered_keys(f'{key}_HINT', 1)
+
+    @classmethod
+    def get_loop_messages(class_, key, start=1):
+        return _CircleList(class_._get_numbered_keys(f'{key}_', start))
+
+    @staticmethod
+    def _info_from_row(row):
+        _key, txt, character_id, mood, sfx_sound, bg_sound = row
+        return {
+            'txt': txt,
+            'character_id': character_id,
+            'mood': mood,
+            'sfx_sound': sfx_sound,
+            'bg_sound': bg_sound,
         }
 
+    @classmethod
+    def set_key_value_from_csv_row(class_, csv_row, contents_dict):
+        row = normalize_string_row(csv_row)
+        contents_dict[row[0]] = class_._info_from_row(row)
+
 
 class QuestItemDB(DictFromCSV):
 
+    _content_table = 'items'
+
     def __init__(self):
-        super().__init__(config.QUESTS_ITEMS_CSV)
+        super().__init__(config.QUESTS_ITEMS_CSV, ignore_header=True)
 
     @classmethod
     def get_item(class_, key):
@@ -242,65 +657,122 @@ class Episode(GObject.Object):
 
 class EpisodesDB(DictFromCSV):
 
+    _content_table = 'episodes'
+
+    # The episodes of every season in order, and the position of each episode in its season.
+    _seasons = {}
+    _positions = {}
+
+    # The episodes returned for ids that are not in the CSV file, so they're also shared.
+    _unknown_episodes = {}
+
     def __init__(self):
-        super().__init__(config.EPISODES_CSV)
+        super().__init__(config.EPISODES_CSV, ignore_header=True)
 
     @classmethod
-    def load_csv(class_, csv_path):
-        contents = OrderedDict()
+    def load_csv(class_, csv_original_path, ignore_header):
+        super().load_csv(csv_original_path, ignore_header)
 
-        class_._do_load_csv(csv_path, contents)
-        class_._csv_dict = contents
+        class_._seasons = {}
+        class_._positions = {}
+        class_._unknown_episodes = {}
+        for episode in class_.get_dict().values():
+            season_episodes = class_._seasons.setdefault(episode.season, [])
+            class_._positions[episode.id] = len(season_episodes)
+            season_episodes.append(episode)
 
     @classmethod
     def get_episode(class_, key):
-        return class_.get_dict().get(key, Episode(key))
+        episode = class_.get_dict().get(key)
+        if episode is None:
+            episode = class_._unknown_episodes.setdefault(key, Episode(key))
+        return episode
 
     @classmethod
     def get_all_episodes(class_):
         return class_.get_dict().items()
 
     @classmethod
-    def _do_load_csv(class_, csv_path, contents):
-        with open(csv_path, 'r') as csv_file:
-            number = 0
-            prev_season = None
-            for row in csv.reader(csv_file):
-                episode_id, season, name, badge_x, badge_y, description = row
-                # using appearance order in the same session to number episodes
-                if season != prev_season:
-                    prev_season = season
-                    number = 0
-                number += 1
+    def set_key_value_from_csv_row(class_, csv_row, contents_dict):
+        episode_id, season, name, badge_x, badge_y, description = csv_row
+
+        # using appearance order in the same season to number episodes
+        previous_episode = next(reversed(contents_dict.values()), None)
+        number = 1
+        if previous_episode is not None and previous_episode.season == season:
+            number = previous_episode.number + 1
+
+        try:
+            badge_x = int(badge_x)
+        except ValueError:
+            badge_x = None
 
-                try:
-                    badge_x = int(badge_x)
-                except ValueError:
-                    badge_x = None
+        try:
+            badge_y = int(badge_y)
+        except ValueError:
+            badge_y = None
 
-                try:
-                    badge_y = int(badge_y)
-                except ValueError:
-                    badge_y = None
+        contents_dict[episode_id] = Episode(episode_id, number, season, name, description,
+                                            badge_x, badge_y)
 
-                contents[episode_id] = Episode(episode_id, number, season, name, description,
-                                               badge_x, badge_y)
+    @classmethod
+    def _get_season_and_position(class_, episode_id):
+        position = class_._positions.get(episode_id)
+        if position is None:
+            return [], None
+        return class_._seasons[class_.get_dict()[episode_id].season], position
 
     @classmethod
     def get_previous_episodes(class_, current_episode):
-        episode = class_.get_episode(current_episode)
-        return [v for k, v in class_.get_all_episodes()
-                if v.season == episode.season and v.number < episode.number]
+        season_episodes, position = class_._get_season_and_position(current_episode)
+        if position is None:
+            return []
+        return season_episodes[:position]
 
     @classmethod
     def get_next_episodes(class_, current_episode):
-        episode = class_.get_episode(current_episode)
-        return [v for k, v in class_.get_all_episodes()
-                if v.season == episode.season and v.number > episode.number]
+        season_episodes, position = class_._get_season_and_position(current_episode)
+        if position is None:
+            return []
+        return season_episodes[position + 1:]
+
+    @classmethod
+    def get_previous_episode(class_, current_episode):
+        season_episodes, position = class_._get_season_and_position(current_episode)
+        if not position:
+            return None
+        return season_episodes[position - 1]
+
+    @classmethod
+    def get_next_episode(class_, current_episode):
+        season_episodes, position = class_._get_season_and_position(current_episode)
+        if position is None or position + 1 >= len(season_episodes):
+            return None
+        return season_episodes[position + 1]
 
     @classmethod
     def get_episodes_in_season(class_, season):
-        return [episode for key, episode in class_.get_all_episodes() if episode.season == season]
+        return list(class_._seasons.get(season, []))
+
+    @classmethod
+    def set_season_progress(class_, season, percentages):
+        '''Update the percentage_complete of the episodes of a season at once.
+
+        The percentages are given as a dictionary of episode ids and percentages. Every
+        episode that changes notifies it only once, after all of them have been updated.
+        '''
+        episodes = [episode for episode in class_._seasons.get(season, [])
+                    if episode.id in percentages and
+                    episode.percentage_complete != percentages[episode.id]]
+
+        for episode in episodes:
+            episode.freeze_notify()
+        try:
+            for episode in episodes:
+                episode.percentage_complete = percentages[episode.id]
+        finally:
+            for episode in episodes:
+                episode.thaw_notify()
 
 
 class NewsFeedItem():
@@ -314,13 +786,161 @@ class NewsFeedItem():
 
 
 class NewsFeedDB(_ListFromCSV):
+
+    _csv_list = []
+    _content_table = 'news'
+
+    # The dates of the items in _csv_list, which is sorted by date, to find them with bisect.
+    _dates = []
+
     def __init__(self):
         super().__init__(config.NEWSFEED_CSV)
 
+    @classmethod
+    def _load_csv(class_, csv_path):
+        super()._load_csv(csv_path)
+
+        # The CSV file has the most recent items first. Sort them from the oldest, keeping
+        # the items of the same day in the reverse order of the file, so iterating the list
+        # backwards gives the items in the order of the file.
+        class_._csv_list.reverse()
+        class_._csv_list.sort(key=lambda item: item.date)
+        class_._dates = [item.date for item in class_._csv_list]
+
     @classmethod
     def append_value_from_csv_row(class_, csv_row, contents):
         contents.append(NewsFeedItem(*csv_row))
 
+    @classmethod
+    def count_published(class_, since=None, until=None):
+        '''Return the number of items published after the "since" date, up to "until".
+
+        The dates are optional, to not limit the items that are counted.
+        '''
+        start = 0 if since is None else bisect.bisect_right(class_._dates, since)
+        end = len(class_._dates) if until is None else bisect.bisect_right(class_._dates, until)
+        return max(end - start, 0)
+
+    @classmethod
+    def get_latest_items(class_, until=None, offset=0, count=None):
+        '''Return the items published up to "until", the most recent first.
+
+        The first "offset" items are skipped, and at most "count" items are returned, to get
+        the items a page at a time.
+        '''
+        end = len(class_._dates) if until is None else bisect.bisect_right(class_._dates, until)
+        end = max(end - offset, 0)
+        start = 0 if count is None else max(end - count, 0)
+        return class_._csv_list[start:end][::-1]
+
+    @classmethod
+    def get_next_date(class_, after):
+        '''Return the first date with items published after the given one, or None.'''
+        index = bisect.bisect_right(class_._dates, after)
+        return class_._dates[index] if index < len(class_._dates) else None
+
+
+@functools.lru_cache(maxsize=None)
+def parse_date(date_string):
+    '''Parse a date in the YYYY-MM-DD form, only once for each different string.'''
+    return datetime.datetime.strptime(date_string, '%Y-%m-%d').date()
+
+
+def get_day_start(date):
+    return datetime.datetime.combine(date, datetime.time.min)
+
+
+class DateBoundaryScheduler:
+    '''Call back the owners of dates when they are reached, using a single timeout.
+
+    Owners watch the moments when something about them changes, like the day a quest starts
+    being available. The boundaries of all of them are kept in a heap, with a timeout for
+    the soonest one. The owners are weakly referenced, so they don't have to stop watching
+    the boundaries when they are no longer used.
+    '''
+
+    # Heap of [boundary, count, owner reference, generation] entries. An entry is stale if
+    # its owner is gone or has watched other boundaries since (with a new generation).
+    _boundaries = []
+    _watchers = weakref.WeakKeyDictionary()
+    _counter = itertools.count()
+    _timeout_id = 0
+    _timeout_boundary = None
+
+    @staticmethod
+    def _now():
+        return datetime.datetime.now()
+
+    @classmethod
+    def watch(class_, owner, boundaries, callback):
+        '''Call callback(owner) when each of the boundaries (datetimes) in the future is reached.
+
+        This replaces the boundaries watched before by the owner.
+        '''
+        generation = next(class_._counter)
+        class_._watchers[owner] = (generation, callback)
+
+        now = class_._now()
+        owner_ref = weakref.ref(owner)
+        for boundary in boundaries:
+            if boundary > now:
+                heapq.heappush(class_._boundaries,
+                               [boundary, next(class_._counter), owner_ref, generation])
+
+        class_._schedule()
+
+    @classmethod
+    def unwatch(class_, owner):
+        class_._watchers.pop(owner, None)
+
+    @classmethod
+    def _get_watcher(class_, entry):
+        owner = entry[2]()
+        if owner is None:
+            return None, None
+
+        generation, callback = class_._watchers.get(owner, (None, None))
+        if generation != entry[3]:
+            return None, None
+        return owner, callback
+
+    @classmethod
+    def _schedule(class_):
+        boundaries = class_._boundaries
+        while boundaries and class_._get_watcher(boundaries[0])[0] is None:
+            heapq.heappop(boundaries)
+
+        boundary = boundaries[0][0] if boundaries else None
+        if class_._timeout_id != 0:
+            if boundary == class_._timeout_boundary:
+                return
+            GLib.source_remove(class_._timeout_id)
+            class_._timeout_id = 0
+
+        class_._timeout_boundary = boundary
+        if boundary is not None:
+            seconds = max(math.ceil((boundary - class_._now()).total_seconds()), 1)
+            class_._timeout_id = GLib.timeout_add_seconds(seconds, class_._timeout_cb)
+
+    @classmethod
+    def _timeout_cb(class_):
+        class_._timeout_id = 0
+        class_._timeout_boundary = None
+
+        # Every owner is called back once, even if it had more than one boundary due.
+        due = OrderedDict()
+        now = class_._now()
+        while class_._boundaries and class_._boundaries[0][0] <= now:
+            owner, callback = class_._get_watcher(heapq.heappop(class_._boundaries))
+            if owner is not None:
+                due[owner] = callback
+
+        for owner, callback in due.items():
+            callback(owner)
+
+        class_._schedule()
+        return GLib.SOURCE_REMOVE
+
 
 class _ClubhouseStateImpl(GObject.GObject):
 
@@ -371,6 +991,57 @@ class MessageTemplate(Template):
     '''
 
 
+class CompiledMessageTemplate:
+    """A MessageTemplate parsed once into a list of literal texts and variable names.
+
+    Rendering a compiled template just joins its segments, so messages shown many times
+    (like the ones in dialogue loops) are not parsed again. Use :meth:`from_text` to get the
+    cached compiled template for a text.
+    """
+
+    _cache = {}
+
+    def __init__(self, text):
+        self._segments = []
+        self._has_variables = False
+
+        literal = []
+        position = 0
+        for match in MessageTemplate.pattern.finditer(text):
+            literal.append(text[position:match.start()])
+            position = match.end()
+
+            if match.group('named') is not None:
+                self._segments.append((False, ''.join(literal)))
+                self._segments.append((True, match.group('named')))
+                self._has_variables = True
+                literal = []
+            elif match.group('escaped') is not None:
+                literal.append(MessageTemplate.delimiter)
+            else:
+                line = text.count('\n', 0, match.start()) + 1
+                column = match.start() - (text.rfind('\n', 0, match.start()) + 1)
+                raise ValueError('Invalid placeholder in string: line {}, col {}'.format(
+                    line, column))
+
+        literal.append(text[position:])
+        self._segments.append((False, ''.join(literal)))
+
+    @classmethod
+    def from_text(class_, text):
+        template = class_._cache.get(text)
+        if template is None:
+            template = class_._cache[text] = class_(text)
+        return template
+
+    def has_variables(self):
+        return self._has_variables
+
+    def render(self, variables):
+        return ''.join(str(variables[value]) if is_variable else value
+                       for is_variable, value in self._segments)
+
+
 def get_flatpak_sandbox():
     info_filename = '/.flatpak-info'
     if not os.path.exists(info_filename):
@@ -0,0 +1,296 @@
+#
+# Copyright © 2020 Endless OS Foundation LLC.
+#
+# This file is part of clubhouse
+# (see https://github.com/endlessm/clubhouse).
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+'''Benchmark the loading of the data catalogs.
+
+The shipped CSV data is scaled up by replicating its rows with new ids, and every DB class is
+loaded from the CSV files and from a content pack compiled from them. For each of them, this
+measures:
+
+- The cold load time: the minimum of loading it opening the content pack every time.
+- The warm load time: the minimum of reloading it with the content pack already open and the
+  files in the OS cache.
+- The peak memory allocated by Python during a cold load.
+
+The results are written as JSON. If a baseline with the results of a previous run is given,
+the run fails when a load time regresses more than the threshold. Regressions smaller than
+a minimum difference are ignored, since many loads take less than a millisecond and their
+times are mostly noise.
+'''
+
+import argparse
+import csv
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from unittest import mock
+
+from eosclubhouse import config, utils
+from eosclubhouse.achievements import AchievementsDB
+from eosclubhouse.catalog import TABLES, read_strings_csv, read_table_csv, write_content_pack
+from eosclubhouse.utils import ContentPackDB, EpisodesDB, NewsFeedDB, QuestItemDB, \
+    QuestStringCatalog
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                        'data')
+
+DEFAULT_SCALES = [10, 100]
+DEFAULT_REPEAT = 15
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_MIN_DIFFERENCE_MS = 0.5
+
+
+def _write_csv(path, rows, header=None):
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        if header is not None:
+            writer.writerow(header)
+        writer.writerows(rows)
+
+
+def _scale_table(rows, scale, copy_row):
+    scaled_rows = []
+    for copy in range(scale):
+        scaled_rows += [row if copy == 0 else copy_row(row, copy) for row in rows]
+    return scaled_rows
+
+
+def generate_data(data_dir, output_dir, scale):
+    '''Write the shipped data scaled "scale" times, returning the paths used by the config.'''
+    paths = {
+        'QUESTS_STRINGS_DIR': os.path.join(output_dir, 'quests_strings'),
+        'QUESTS_ITEMS_CSV': os.path.join(output_dir, 'quests_items.csv'),
+        'EPISODES_CSV': os.path.join(output_dir, 'episodes.csv'),
+        'NEWSFEED_CSV': os.path.join(output_dir, 'newsfeed.csv'),
+        'ACHIEVEMENTS_CSV': os.path.join(output_dir, 'achievements.csv'),
+        'CONTENT_PACK': os.path.join(output_dir, 'content.pack'),
+    }
+
+    # Every copy of a quest's strings file is a new quest, with its own strings prefix.
+    os.mkdir(paths['QUESTS_STRINGS_DIR'])
+    for csv_path in sorted(glob.glob(os.path.join(data_dir, 'quests_strings', '*.csv'))):
+        name = os.path.splitext(os.path.basename(csv_path))[0]
+        prefix = name.upper() + '_'
+        rows = read_strings_csv([csv_path])
+
+        for copy in range(scale):
+            copy_name = name if copy == 0 else '{}x{}'.format(name, copy)
+            copy_prefix = copy_name.upper() + '_'
+            copy_rows = [(copy_prefix + row[0][len(prefix):] if row[0].startswith(prefix)
+                          else '{}_X{}'.format(row[0], copy), *row[1:])
+                         for row in rows] if copy else rows
+            _write_csv(os.path.join(paths['QUESTS_STRINGS_DIR'], copy_name + '.csv'), copy_rows)
+
+    def with_id_copy(row, copy):
+        return ('{}-x{}'.format(row[0], copy), *row[1:])
+
+    def with_season_copy(row, copy):
+        return ('{}-x{}'.format(row[0], copy), '{}-x{}'.format(row[1], copy), *row[2:])
+
+    tables = {}
+    for name, csv_name, config_key, copy_row in [
+            ('items', 'quests_items.csv', 'QUESTS_ITEMS_CSV', with_id_copy),
+            ('episodes', 'episodes.csv', 'EPISODES_CSV', with_season_copy),
+            ('news', os.path.join('newsfeed', 'newsfeed.csv'), 'NEWSFEED_CSV', None),
+            ('achievements', os.path.join('achievements', 'achievements.csv'),
+             'ACHIEVEMENTS_CSV', with_id_copy)]:
+        fields, _sorted = TABLES[name]
+        rows = read_table_csv(os.path.join(data_dir, csv_name), len(fields))
+        tables[name] = _scale_table(rows, scale, copy_row or (lambda row, _copy: row))
+        _write_csv(paths[config_key], tables[name], header=fields)
+
+    strings_paths = sorted(glob.glob(os.path.join(paths['QUESTS_STRINGS_DIR'], '*.csv')))
+    tables['strings'] = read_strings_csv(strings_paths)
+    write_content_pack(paths['CONTENT_PACK'], tables)
+
+    return paths
+
+
+def _reset_patches():
+    '''Return the patches that make the DB classes forget the data they have loaded.'''
+    return [
+        mock.patch.multiple(ContentPackDB, _pack=None, _opened=False),
+        mock.patch.multiple(QuestStringCatalog, _csv_dict={}, _loaded=False, _catalog=None,
+                            _shard_paths={}, _shards={}, _shard_indexes={}, _csv_index=None,
+                            _file_contents={}),
+        mock.patch.multiple(QuestItemDB, _csv_dict={}),
+        mock.patch.multiple(EpisodesDB, _csv_dict={}, _seasons={}, _positions={},
+                            _unknown_episodes={}),
+        mock.patch.multiple(NewsFeedDB, _csv_list=[], _dates=[]),
+        mock.patch.multiple(AchievementsDB, _csv_dict={}, _manager=None),
+    ]
+
+
+def _load(db_class, keep_pack=None):
+    patches = _reset_patches()
+    for patch in patches:
+        patch.start()
+
+    # Reuse an already open content pack, for warm loads.
+    if keep_pack is not None:
+        ContentPackDB._pack = keep_pack
+        ContentPackDB._opened = True
+
+    try:
+        start_time = time.perf_counter()
+        db_class()
+        elapsed = time.perf_counter() - start_time
+        return elapsed * 1000.0, ContentPackDB._pack
+    finally:
+        for patch in reversed(patches):
+            patch.stop()
+
+
+def _close(pack):
+    if pack is not None:
+        pack.close()
+
+
+def _cold_load(db_class):
+    elapsed, pack = _load(db_class)
+    _close(pack)
+    return elapsed
+
+
+def measure(db_class, repeat):
+    # The minimum is the time least disturbed by the rest of the system.
+    cold_ms = min(_cold_load(db_class) for _i in range(repeat))
+
+    pack = _load(db_class)[1]
+    warm_ms = min(_load(db_class, pack)[0] for _i in range(repeat))
+    _close(pack)
+
+    # Tracing the allocations slows the load down, so it's done in a load of its own.
+    tracemalloc.start()
+    _close(_load(db_class)[1])
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'cold_ms': round(cold_ms, 3),
+        'warm_ms': round(warm_ms, 3),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(scales, repeat):
+    results = {}
+    db_classes = [QuestStringCatalog, QuestItemDB, EpisodesDB, NewsFeedDB, AchievementsDB]
+
+    for scale in scales:
+        scale_results = results['{}x'.format(scale)] = {}
+        with tempfile.TemporaryDirectory() as output_dir:
+            paths = generate_data(DATA_DIR, output_dir, scale)
+            missing_pack = os.path.join(output_dir, 'missing.pack')
+
+            for source, content_pack in [('csv', missing_pack),
+                                         ('pack', paths['CONTENT_PACK'])]:
+                config_patch = mock.patch.multiple(config, **dict(paths,
+                                                                  CONTENT_PACK=content_pack))
+                alternative_dir_patch = mock.patch.object(
+                    utils, 'get_alternative_quests_dir',
+                    return_value=os.path.join(output_dir, 'alternative'))
+
+                with config_patch, alternative_dir_patch:
+                    for db_class in db_classes:
+                        db_results = scale_results.setdefault(db_class.__name__, {})
+                        db_results[source] = measure(db_class, repeat)
+
+    return results
+
+
+def find_regressions(results, baseline, threshold, min_difference_ms):
+    regressions = []
+    for scale, scale_results in results.items():
+        for db_name, db_results in scale_results.items():
+            for source, measures in db_results.items():
+                baseline_measures = baseline.get(scale, {}).get(db_name, {}).get(source)
+                if baseline_measures is None:
+                    continue
+
+                for measure_name in ('cold_ms', 'warm_ms'):
+                    baseline_ms = baseline_measures[measure_name]
+                    limit = max(baseline_ms * (1 + threshold), baseline_ms + min_difference_ms)
+                    if measures[measure_name] > limit:
+                        regressions.append('{} {} ({}, {}): {:.3f}ms > {:.3f}ms'.format(
+                            db_name, measure_name, source, scale, measures[measure_name],
+                            limit))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the loading of the data catalogs.')
+    parser.add_argument('--scales', type=lambda value: [int(s) for s in value.split(',')],
+                        default=DEFAULT_SCALES,
+                        help='comma-separated scales of the shipped data to benchmark')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='number of cold and warm loads to measure')
+    parser.add_argument('--output', '-o', help='the JSON file to write the results to')
+    parser.add_argument('--baseline', default=os.environ.get('CLUBHOUSE_BENCHMARK_BASELINE'),
+                        help='the JSON results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float,
+                        default=float(os.environ.get('CLUBHOUSE_BENCHMARK_THRESHOLD',
+                                                     DEFAULT_THRESHOLD)),
+                        help='the load time increase over the baseline that fails the run, '
+                        'as a fraction (default: %(default)s)')
+    parser.add_argument('--min-difference', type=float,
+                        default=float(os.environ.get('CLUBHOUSE_BENCHMARK_MIN_DIFFERENCE',
+                                                     DEFAULT_MIN_DIFFERENCE_MS)),
+                        help='the load time increase over the baseline, in milliseconds, '
+                        'below which it is not a regression (default: %(default)s)')
+    args = parser.parse_args()
+
+    results = {
+        'python': platform.python_version(),
+        'results': run_benchmarks(args.scales, args.repeat),
+    }
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+
+        regressions = find_regressions(results['results'], baseline, args.threshold,
+                                       args.min_difference)
+        if regressions:
+            print('Load time regressions over the baseline:', file=sys.stderr)
+            for regression in regressions:
+                print('  ' + regression, file=sys.stderr)
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
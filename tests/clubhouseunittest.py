@@ -23,8 +23,8 @@ import unittest
 
 from eosclubhouse.libquest import Registry, Quest, QuestSet
 from eosclubhouse.system import GameStateService
-from eosclubhouse.utils import QuestStringCatalog
-from gi.repository import Gio, GObject
+from eosclubhouse.utils import convert_variant_arg, QuestStringCatalog
+from gi.repository import Gio, GLib, GObject
 from unittest import mock
 
 
@@ -38,12 +38,34 @@ class _GSSMockProxy(GObject.GObject):
         ),
     }
 
-    def call(self, method_name, variant, _flags, _timeout, _param, done_callback):
+    def __init__(self):
+        super().__init__()
+        self._signal_handler_ids = set()
+
+    def connect(self, signal_name, *args):
+        handler_id = super().connect(signal_name, *args)
+        if signal_name == 'g-signal':
+            self._signal_handler_ids.add(handler_id)
+        return handler_id
+
+    def disconnect(self, handler_id):
+        super().disconnect(handler_id)
+        self._signal_handler_ids.discard(handler_id)
+
+    def get_signal_handler_count(self):
+        return len(self._signal_handler_ids)
+
+    def call(self, method_name, variant, _flags, _timeout, _param, done_callback, *user_data):
         method = getattr(self, method_name)
 
-        method(variant.format_string, variant.get_child_value(0), variant.get_child_value(1))
+        args = [variant.get_child_value(i) for i in range(variant.n_children())]
+        args = [arg.unpack() if arg.get_type_string() == 's' else arg for arg in args]
+        try:
+            result = method(variant.get_type_string(), *args)
+        except GLib.Error as e:
+            result = e
 
-        done_callback(self, None)
+        done_callback(self, result, *user_data)
 
     def Get(self, _variant_format, key):
         try:
@@ -52,15 +74,22 @@ class _GSSMockProxy(GObject.GObject):
             raise Gio.DBusError.new_for_dbus_error("com.hack_computer.GameStateService.KeyError",
                                                    "Phony KeyError")
 
-    def Set(self, _variant_format, key, variant):
+    def Set(self, _variant_format, key, variant, result_handler=None, error_handler=None,
+            user_data=None):
         self.__state__[key] = variant.unpack()
         self.emit('g-signal', 'phony', 'changed', None)
+        if result_handler is not None:
+            result_handler(self, None, user_data)
 
     def Reset(self):
         self.__state__ = {}
 
-    def call_finish(self, _param):
-        pass
+    def call_finish(self, result):
+        if isinstance(result, GLib.Error):
+            raise result
+        if result is None:
+            return None
+        return GLib.Variant('(v)', (convert_variant_arg(result),))
 
 
 class ClubhouseTestCase(unittest.TestCase):
@@ -142,5 +171,5 @@ def define_questset(quest_set_id, pathway_name, character_id, quest_id_deps_list
 
 def setup_episode(quest_set_list, episode_name='tests-phony-episode'):
     Registry._reset()
-    Registry._quest_sets = quest_set_list
+    Registry._set_quest_sets(quest_set_list)
     Registry._loaded_episode = episode_name
@@ -66,3 +66,26 @@ class TestAchievementsManager(unittest.TestCase):
         self.assertNotIn('cat-herder', self._get_achieved_ids())
         self.manager.add_points('FELIX', 2)
         self.assertIn('cat-herder', self._get_achieved_ids())
+
+    def test_restoring_points(self):
+        """Tests that the points can be restored without giving the achievements again."""
+        self._load_rows()
+        self.manager.add_points('FELIX', 3)
+
+        achieved = []
+        restored = []
+        self.manager.connect('achievement-achieved',
+                             lambda _manager, achievement: achieved.append(achievement.id))
+        self.manager.connect('points-restored', lambda _manager: restored.append(None))
+
+        self.manager.restore_points({'NARRATIVE': 5})
+        self.assertEqual(self.manager.get_points(), {'FELIX': 0, 'NARRATIVE': 5})
+        self.assertEqual(self._get_achieved_ids(), ['beginner-reader'])
+
+        with self.manager.restoring_points():
+            self.manager.add_points('FELIX', 1)
+            self.manager.add_points('NARRATIVE', 1)
+        self.assertEqual(self._get_achieved_ids(), ['mixed-badge'])
+
+        self.assertEqual(achieved, [])
+        self.assertEqual(len(restored), 2)
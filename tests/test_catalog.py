@@ -0,0 +1,126 @@
+#
+# Copyright © 2020 Endless OS Foundation LLC.
+#
+# This file is part of clubhouse
+# (see https://github.com/endlessm/clubhouse).
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import os
+import tempfile
+import unittest
+
+from eosclubhouse.catalog import ContentPack, TABLES, normalize_string_row, \
+    write_content_pack
+
+
+class TestContentPack(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._tmpdir.name, 'test.pack')
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _write_pack(self, **tables):
+        all_tables = {name: [] for name in TABLES}
+        all_tables.update(tables)
+        write_content_pack(self._path, all_tables)
+
+    def test_normalize_string_row(self):
+        """Tests that rows are normalized the same way as when parsing the CSV files."""
+        self.assertEqual(normalize_string_row(['KEY', ' Hi! ', ' Ada', 'TALK ', 'a/b', 'C/d']),
+                         ('KEY', 'Hi!', 'ada', 'talk', 'a/b', 'c/d'))
+        # Rows with 5 columns have an empty background sound.
+        self.assertEqual(normalize_string_row(['KEY', 'Hi!', '', '', '']),
+                         ('KEY', 'Hi!', '', '', '', ''))
+
+    def test_lookup(self):
+        """Tests that every key written to a sorted table can be looked up."""
+        rows = [normalize_string_row([f'QUEST_{i}', f'Message {i} ✨', 'ada', '', '', ''])
+                for i in range(100)]
+        self._write_pack(strings=list(reversed(rows)))
+
+        pack = ContentPack(self._path)
+        catalog = pack.get_table('strings')
+        self.assertEqual(len(catalog), len(rows))
+        for row in rows:
+            self.assertEqual(catalog.get(row[0]), row)
+
+        self.assertIsNone(catalog.get('QUEST_100'))
+        self.assertIsNone(catalog.get('AAA'))
+        self.assertIsNone(catalog.get('ZZZ'))
+        self.assertEqual(list(catalog.keys()), sorted(row[0] for row in rows))
+        self.assertEqual(pack.validate(), [])
+        pack.close()
+
+    def test_keys_with_prefix(self):
+        """Tests that the keys starting with a prefix are found in order."""
+        keys = ['QUEST_A', 'QUEST_A_HINT1', 'QUEST_A_HINT2', 'QUEST_B', 'QUESTB_A', 'OTHER']
+        self._write_pack(strings=[(key, '', '', '', '', '') for key in keys])
+
+        pack = ContentPack(self._path)
+        catalog = pack.get_table('strings')
+        self.assertEqual(catalog.get_keys_with_prefix('QUEST_A_HINT'),
+                         ['QUEST_A_HINT1', 'QUEST_A_HINT2'])
+        self.assertEqual(catalog.get_keys_with_prefix('QUEST_'),
+                         ['QUEST_A', 'QUEST_A_HINT1', 'QUEST_A_HINT2', 'QUEST_B'])
+        self.assertEqual(catalog.get_keys_with_prefix('NOQUEST_'), [])
+        pack.close()
+
+    def test_tables_keep_order(self):
+        """Tests that the rows of tables that are not sorted keep their order."""
+        episodes = [('episode2', 'season1', 'Two', '', '', ''),
+                    ('episode1', 'season1', 'Ünø ✨', '10', '20', 'First')]
+        news = [('2020-01-02', 'ada', '', '', 'Second'),
+                ('2020-01-01', 'riley', '', '', 'First')]
+        self._write_pack(episodes=episodes, news=news)
+
+        pack = ContentPack(self._path)
+        self.assertEqual(list(pack.get_table('episodes').rows()), episodes)
+        self.assertEqual(list(pack.get_table('news').rows()), news)
+        self.assertEqual(list(pack.get_table('items').rows()), [])
+        pack.close()
+
+    def test_duplicated_keys(self):
+        """Tests that a sorted table can't have duplicated keys."""
+        with self.assertRaises(ValueError):
+            self._write_pack(strings=[('KEY', '', '', '', '', ''),
+                                      ('KEY', 'Again', '', '', '', '')])
+
+    def test_validate(self):
+        """Tests that validating a content pack finds corrupted and invalid data."""
+        self._write_pack(news=[('yesterday', 'ada', '', '', 'Hi!')])
+
+        pack = ContentPack(self._path)
+        self.assertEqual(len(pack.validate()), 1)
+        pack.close()
+
+        with open(self._path, 'r+b') as pack_file:
+            pack_file.seek(-1, os.SEEK_END)
+            pack_file.write(b'?')
+
+        pack = ContentPack(self._path)
+        self.assertIn('The content hash does not match', pack.validate())
+        pack.close()
+
+    def test_invalid_file(self):
+        """Tests that opening a file that is not a content pack fails."""
+        with open(self._path, 'wb') as pack_file:
+            pack_file.write(b'KEY,Some text,,,,\n' * 10)
+
+        with self.assertRaises(ValueError):
+            ContentPack(self._path)
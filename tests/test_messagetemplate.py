@@ -18,7 +18,7 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
-from eosclubhouse.utils import MessageTemplate
+from eosclubhouse.utils import CompiledMessageTemplate, MessageTemplate
 from clubhouseunittest import ClubhouseTestCase
 
 
@@ -55,3 +55,35 @@ class TestMessageTemplate(ClubhouseTestCase):
             template = MessageTemplate(template_message)
             with self.assertRaises(ValueError):
                 template.substitute(self._variables)
+
+    def test_compiled_renders_like_substitute(self):
+        """Tests that compiled templates render the same text as substituting the template."""
+        for template_message in [
+                'Hello {{user_name}}, nice to meet you',
+                'Please set `x = {"gravity": -9.8}` in {{app_name}}',
+                'Hello {{#user_name}}, nice to meet you',
+                '{{user_name}}{{app_name}}',
+                'No variables at all',
+                '',
+        ]:
+            compiled = CompiledMessageTemplate.from_text(template_message)
+            self.assertEqual(compiled.render(self._variables),
+                             MessageTemplate(template_message).substitute(self._variables))
+
+    def test_compiled_is_cached(self):
+        """Tests that a text is only compiled once."""
+        text = 'Hello {{user_name}}!'
+        self.assertIs(CompiledMessageTemplate.from_text(text),
+                      CompiledMessageTemplate.from_text(text))
+        self.assertTrue(CompiledMessageTemplate.from_text(text).has_variables())
+        self.assertFalse(CompiledMessageTemplate.from_text('Hello!').has_variables())
+
+    def test_compiled_fails_on_invalid_names(self):
+        """Tests that compiling templates with invalid names fails."""
+        for template_message in [
+                'Hello {{user{name}}, nice to meet you',
+                'Hello {{user}name}}, nice to meet you',
+                'Hello {{user#name}}, nice to meet you',
+        ]:
+            with self.assertRaises(ValueError):
+                CompiledMessageTemplate(template_message)
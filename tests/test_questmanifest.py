@@ -0,0 +1,190 @@
+#
+# Copyright © 2020 Endless OS Foundation LLC.
+#
+# This file is part of clubhouse
+# (see https://github.com/endlessm/clubhouse).
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#
+import os
+import tempfile
+import unittest
+
+from eosclubhouse.questmanifest import QuestManifest, build_manifest, write_manifest
+
+
+_QUESTS_MODULE = '''
+from eosclubhouse.libquest import Quest
+
+
+class SecondQuest(Quest):
+
+    __tags__ = ['pathway:phony', 'difficulty:hard']
+    __pathway_order__ = 2
+    __available_after_completing_quests__ = ['FirstQuest']
+    __app_id__ = 'com.example.Phony'
+
+
+class FirstQuest(Quest):
+
+    __tags__ = ['pathway:phony']
+    __pathway_order__ = 1
+
+
+class NotAQuest:
+
+    __tags__ = ['pathway:phony']
+'''
+
+_PATHWAY_MODULE = '''
+from eosclubhouse.libquest import QuestSet, Registry
+
+
+class PhonyPathWay(QuestSet):
+
+    __pathway_name__ = 'Phony'
+    __character_id__ = 'ada'
+
+
+Registry.register_quest_set(PhonyPathWay)
+'''
+
+_LISTED_PATHWAY_MODULE = '''
+from eosclubhouse.libquest import QuestSet, Registry
+from phony.quests import SecondQuest
+
+
+class ListedPathWay(QuestSet):
+
+    __character_id__ = 'faber'
+    __quests__ = [SecondQuest, 'FirstQuest']
+
+
+Registry.register_quest_set(ListedPathWay)
+'''
+
+
+class TestQuestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._episode_dir = os.path.join(self._tmpdir.name, 'phony')
+        os.mkdir(self._episode_dir)
+        self._write_module('quests', _QUESTS_MODULE)
+        self._write_module('pathway', _PATHWAY_MODULE)
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _write_module(self, modname, source):
+        with open(os.path.join(self._episode_dir, modname + '.py'), 'w') as module_file:
+            module_file.write(source)
+
+    def _get_manifest(self):
+        path = os.path.join(self._tmpdir.name, 'quests.manifest')
+        write_manifest(path, build_manifest([self._episode_dir]))
+        return QuestManifest(path)
+
+    def test_quests(self):
+        """Tests that the quests attributes are read without importing their modules."""
+        manifest = self._get_manifest()
+
+        self.assertTrue(manifest.has_episode('phony'))
+        self.assertEqual(manifest.get_modules('phony'), ['pathway', 'quests'])
+        self.assertEqual([quest['id'] for quest in manifest.get_quests('phony')],
+                         ['SecondQuest', 'FirstQuest'])
+        self.assertEqual(manifest.get_quest('phony', 'SecondQuest'), {
+            'id': 'SecondQuest',
+            'module': 'quests',
+            'tags': ['pathway:phony', 'difficulty:hard'],
+            'pathway': 'phony',
+            'pathway_order': 2,
+            'dependencies': ['FirstQuest'],
+            'app_id': 'com.example.Phony',
+        })
+
+        # Attributes not set get the Quest defaults.
+        first_quest = manifest.get_quest('phony', 'FirstQuest')
+        self.assertEqual(first_quest['dependencies'], [])
+        self.assertIsNone(first_quest['app_id'])
+
+    def test_quest_sets(self):
+        """Tests that the registered quest sets are listed with their quests in order."""
+        manifest = self._get_manifest()
+
+        quest_sets = manifest.get_quest_sets('phony')
+        self.assertEqual(quest_sets, [{'id': 'PhonyPathWay', 'module': 'pathway',
+                                       'pathway_name': 'Phony', 'character_id': 'ada',
+                                       'quests': []}])
+        self.assertEqual([quest['id'] for quest in
+                          manifest.get_pathway_quests('phony', quest_sets[0])],
+                         ['FirstQuest', 'SecondQuest'])
+
+    def test_listed_quests(self):
+        """Tests that the quests listed by a quest set without a pathway are in order."""
+        self._write_module('listed', _LISTED_PATHWAY_MODULE)
+        manifest = self._get_manifest()
+
+        quest_set = manifest.get_quest_sets('phony')[0]
+        self.assertEqual(quest_set['id'], 'ListedPathWay')
+        self.assertIsNone(quest_set['pathway_name'])
+        self.assertEqual(quest_set['quests'], ['SecondQuest', 'FirstQuest'])
+        self.assertEqual([quest['id'] for quest in
+                          manifest.get_pathway_quests('phony', quest_set)],
+                         ['FirstQuest', 'SecondQuest'])
+
+        # Listing a quest that is not in the episode can't be resolved without importing.
+        self._write_module('listed', _LISTED_PATHWAY_MODULE.replace("'FirstQuest'",
+                                                                    "'OtherQuest'"))
+        with self.assertRaises(ValueError):
+            build_manifest([self._episode_dir])
+
+    def test_up_to_date(self):
+        """Tests that the manifest is not used for an episode whose modules changed."""
+        manifest = self._get_manifest()
+        self.assertTrue(manifest.is_up_to_date('phony', self._episode_dir))
+
+        # Editing a module also makes it stale.
+        self._write_module('quests', _QUESTS_MODULE.replace("__pathway_order__ = 1",
+                                                            "__pathway_order__ = 3"))
+        self.assertFalse(manifest.is_up_to_date('phony', self._episode_dir))
+
+        self._write_module('quests', _QUESTS_MODULE)
+        self.assertTrue(manifest.is_up_to_date('phony', self._episode_dir))
+
+        self._write_module('newquest', _QUESTS_MODULE)
+        self.assertFalse(manifest.is_up_to_date('phony', self._episode_dir))
+        self.assertFalse(manifest.is_up_to_date('other', self._episode_dir))
+
+    def test_non_literal_attribute(self):
+        """Tests that attributes the manifest can't read without importing are rejected."""
+        self._write_module('quests', _QUESTS_MODULE.replace("__pathway_order__ = 1",
+                                                            "__pathway_order__ = ORDER"))
+        with self.assertRaises(ValueError):
+            build_manifest([self._episode_dir])
+
+    def test_shipped_episodes(self):
+        """Tests that the manifest of the shipped episodes can be generated."""
+        quests_dir = os.path.join(os.path.dirname(__file__), os.pardir, 'eosclubhouse', 'quests')
+        manifest = build_manifest([os.path.join(quests_dir, 'hack2')])
+        episode = manifest['episodes']['hack2']
+
+        self.assertGreater(len(episode['quest_sets']), 0)
+        quest_ids = [quest['id'] for quest in episode['quests']]
+        self.assertEqual(len(quest_ids), len(set(quest_ids)))
+        for quest in episode['quests']:
+            for dependency in quest['dependencies']:
+                self.assertIn(dependency, quest_ids)
@@ -20,11 +20,13 @@
 #
 import datetime
 
+from gi.repository import GLib
 from eosclubhouse.libquest import Registry, NoMessageIdError
-from eosclubhouse.utils import QuestStringCatalog
+from eosclubhouse.utils import QuestStringCatalog, convert_variant_arg
 from eosclubhouse.system import GameStateService
 from clubhouseunittest import ClubhouseTestCase, define_quest, \
     define_questset, setup_episode
+from unittest import mock
 
 
 class TestQuests(ClubhouseTestCase):
@@ -50,6 +52,43 @@ class TestQuests(ClubhouseTestCase):
         with self.assertRaises(NoMessageIdError):
             quest.show_message('INEXISTENT_MESSAGE')
 
+    def test_message_info_does_not_change_catalog(self):
+        """Tests that getting a message's info doesn't modify the strings catalog."""
+        quest_class = define_quest('PhonyQuest')
+        quest = quest_class()
+
+        string_catalog = QuestStringCatalog._csv_dict
+        QuestStringCatalog.set_key_value_from_csv_row(('PHONYQUEST_HELLO',
+                                                       'Hello {{user_name}}', '', '', '', ''),
+                                                      string_catalog)
+
+        with mock.patch.object(quest, '_get_message_variables',
+                               return_value={'user_name': 'Lisa'}):
+            info = quest._get_message_info('PHONYQUEST_HELLO')
+
+        self.assertEqual(info['parsed_text'], 'Hello Lisa')
+        self.assertNotIn('parsed_text', QuestStringCatalog.get_info('PHONYQUEST_HELLO'))
+        with self.assertRaises(TypeError):
+            info['parsed_text'] = 'Bye'
+
+    def test_tags(self):
+        """Tests that the quest tags are parsed by their prefix."""
+        quest_class = define_quest('PhonyQuest')
+        self.assertEqual(quest_class.get_tag_prefixes(), [])
+        self.assertFalse(quest_class.requires_network())
+
+        # Tags replaced after defining the class are parsed again.
+        quest_class.__tags__ = ['pathway:web', 'difficulty:hard', 'skillset:web:2',
+                                'skillset:art', 'require:network', 'untagged']
+        self.assertEqual(quest_class.get_tag_prefixes(),
+                         ['pathway', 'difficulty', 'skillset', 'require'])
+        self.assertEqual(list(quest_class.get_tag_info_by_prefix('skillset')),
+                         [['WEB', 2], ['ART']])
+        self.assertEqual(list(quest_class.get_tag_info_by_prefix('since')), [])
+        self.assertEqual(quest_class.get_difficulty(), quest_class.Difficulty.HARD)
+        self.assertEqual(quest_class.get_requires(), ['network'])
+        self.assertTrue(quest_class.requires_network())
+
     def test_default_main_character(self):
         '''Tests there is some default main character when not provided in the catalog.'''
         QuestA = define_quest('QuestA')
@@ -195,3 +234,116 @@ class TestQuests(ClubhouseTestCase):
         quest_a.available_since = tomorrow.strftime('%Y-%m-%d')
         quest_a.available_until = tomorrow1.strftime('%Y-%m-%d')
         self.assertEqual(quest_a.available, False)
+
+    def test_dependencies(self):
+        '''Tests that completing a quest updates the availability of its dependents.'''
+        PhonyAlice = define_questset('PhonyAlice', 'web', 'alice',
+                                     [('QuestDepA', []),
+                                      ('QuestDepB', ['QuestDepA']),
+                                      ('QuestDepC', ['QuestDepB'])])
+
+        setup_episode([PhonyAlice()])
+
+        quest_a = Registry.get_quest_by_name('QuestDepA')
+        quest_b = Registry.get_quest_by_name('QuestDepB')
+        quest_c = Registry.get_quest_by_name('QuestDepC')
+        self.assertEqual(Registry.get_dependent_quests('QuestDepA'), [quest_b])
+        self.assertEqual(Registry.get_dependent_quests('QuestDepB'), [quest_c])
+        self.assertFalse(quest_b.available)
+        self.assertFalse(quest_c.available)
+
+        # The completion of the constructed quests is known, so it's not read again.
+        with mock.patch.object(GameStateService, 'get', autospec=True,
+                               side_effect=GameStateService.get) as gss_get:
+            quest_a.complete = True
+        self.assertEqual([call for call in gss_get.call_args_list
+                          if call[0][1].startswith('quest.')], [])
+
+        self.assertTrue(quest_b.available)
+        self.assertFalse(quest_c.available)
+
+        quest_b.complete = True
+        self.assertTrue(quest_c.available)
+
+    def test_auto_offer(self):
+        '''Tests that the quests are auto-offered in order, once per main loop iteration.'''
+        PhonyAlice = define_questset('PhonyAlice', 'web', 'alice',
+                                     [('QuestOfferA', []),
+                                      ('QuestOfferB', ['QuestOfferA']),
+                                      ('QuestOfferC', ['QuestOfferA'])])
+        PhonyBob = define_questset('PhonyBob', 'art', 'bob', [('QuestOfferD', [])])
+
+        setup_episode([PhonyAlice(), PhonyBob()])
+
+        quest_a, quest_b, quest_c, quest_d = [
+            Registry.get_quest_by_name(name)
+            for name in ['QuestOfferA', 'QuestOfferB', 'QuestOfferC', 'QuestOfferD']]
+        for quest in [quest_d, quest_c, quest_b, quest_a]:
+            quest.auto_offer = True
+
+        self.assertIs(Registry.get_next_auto_offer_quest(), quest_a)
+        self.assertIs(Registry.get_next_auto_offer_quest(quest_a), quest_d)
+
+        schedule_cb = mock.Mock()
+        registry = Registry.get_or_create()
+        handler = registry.connect('schedule-quest', schedule_cb)
+
+        # Completing the quest makes two quests available, but only the first one is offered.
+        quest_a.complete = True
+        schedule_cb.assert_not_called()
+        context = GLib.MainContext.default()
+        while context.iteration(False):
+            pass
+        registry.disconnect(handler)
+
+        schedule_cb.assert_called_once_with(registry, 'QuestOfferB', True, 3)
+        self.assertIs(Registry.get_next_auto_offer_quest(quest_b), quest_c)
+
+        quest_b.auto_offer = False
+        self.assertIs(Registry.get_next_auto_offer_quest(), quest_c)
+        quest_b.auto_offer = True
+        self.assertIs(Registry.get_next_auto_offer_quest(), quest_b)
+
+    def test_dependencies_changed_in_game_state(self):
+        """Tests that the dependents follow the completion changed by other processes."""
+        PhonyAlice = define_questset('PhonyAlice', 'web', 'alice',
+                                     [('QuestDepA', []),
+                                      ('QuestDepB', ['QuestDepA'])])
+
+        setup_episode([PhonyAlice()])
+
+        quest_a = Registry.get_quest_by_name('QuestDepA')
+        quest_b = Registry.get_quest_by_name('QuestDepB')
+        self.assertFalse(quest_b.available)
+
+        proxy = GameStateService._proxy
+        variant = convert_variant_arg({'complete': True})
+        proxy.emit('g-signal', 'phony', 'changed',
+                   GLib.Variant('(sv)', ('quest.QuestDepA', variant)))
+        self.assertTrue(quest_a.complete)
+        self.assertTrue(quest_b.available)
+
+        # Resetting the game state doesn't tell which keys changed, so the quests are reloaded.
+        GameStateService().reset()
+        Registry.reload_quests_conf()
+        self.assertFalse(quest_a.complete)
+        self.assertFalse(quest_b.available)
+
+    def test_unconstructed_dependencies(self):
+        """Tests that the dependents of a quest not constructed are updated by its game state."""
+        PhonyAlice = define_questset('PhonyAlice', 'web', 'alice',
+                                     [('QuestDepD', ['PhonyOutsideQuest'])])
+
+        setup_episode([PhonyAlice()])
+
+        quest_d = Registry.get_quest_by_name('QuestDepD')
+        self.assertFalse(quest_d.available)
+        self.assertIn('PhonyOutsideQuest', Registry._dependency_watches)
+
+        GameStateService().set('quest.PhonyOutsideQuest', {'complete': True})
+        self.assertTrue(quest_d.available)
+
+        watch_count = len(GameStateService._watch_trie)
+        Registry._reset()
+        self.assertEqual(Registry._dependency_watches, {})
+        self.assertEqual(len(GameStateService._watch_trie), watch_count - 1)
@@ -107,7 +107,7 @@ class TestQuestSets(ClubhouseTestCase):
         self.assertEqual(alice.get_empty_message(), noquest_info['txt'])
 
         # There's an episode specific noquest message and an other quest-set active.
-        Registry._quest_sets = [alice, bob]
+        Registry._set_quest_sets([alice, bob])
         self.assertEqual(alice.get_empty_message(), ep_noquest_alice_bob_info['txt'])
 
         # There's no episode specific noquest message and an other quest-set active.
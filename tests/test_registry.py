@@ -18,13 +18,402 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
-from eosclubhouse.libquest import Registry
+import contextlib
+import os
+import sys
+import tempfile
+
+from collections import OrderedDict
+from gi.repository import GLib
+from eosclubhouse.libquest import Quest, Registry
+from eosclubhouse.questmanifest import QuestManifest, build_manifest, write_manifest
+from eosclubhouse.system import GameStateService
 from eosclubhouse import config
 from clubhouseunittest import ClubhouseTestCase
+from unittest import mock
+
+
+_PHONY_MODULE = '''
+from eosclubhouse.libquest import Quest, QuestSet, Registry
+
+
+class PhonyReloadQuest(Quest):
+
+    __tags__ = ['pathway:phony']
+    __pathway_order__ = {order}
+
+    def step_begin(self):
+        return self.step_complete_and_stop
+
+
+class PhonyReloadPathWay(QuestSet):
+
+    __pathway_name__ = 'Phony'
+    __character_id__ = 'ada'
+
+
+Registry.register_quest_set(PhonyReloadPathWay)
+'''
+
+
+_PHONY_QUEST_MODULE = '''
+from eosclubhouse.libquest import Quest
+
+
+class {name}(Quest):
+
+    __tags__ = {tags}
+
+    def step_begin(self):
+        return self.step_complete_and_stop
+'''
+
+_PHONY_QUEST_SET_MODULE = '''
+from eosclubhouse.libquest import QuestSet, Registry
+
+
+class PhonyLoadPathWay(QuestSet):
+
+    __pathway_name__ = 'Phony'
+    __character_id__ = 'ada'
+    __quests__ = ['UntaggedQuest']
+
+
+Registry.register_quest_set(PhonyLoadPathWay)
+'''
 
 
 class TestRegistry(ClubhouseTestCase):
 
+    @contextlib.contextmanager
+    def _phony_episode(self, episode_name):
+        """Yield the temporary folder and the folder of a phony episode set as the current one."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dir_name = os.path.join(tmpdir, episode_name)
+            os.mkdir(dir_name)
+
+            for modname, source in [
+                    ('taggedquest', _PHONY_QUEST_MODULE.format(name='TaggedQuest',
+                                                               tags="['pathway:phony']")),
+                    ('untaggedquest', _PHONY_QUEST_MODULE.format(name='UntaggedQuest',
+                                                                 tags='[]')),
+                    ('pathway', _PHONY_QUEST_SET_MODULE)]:
+                with open(os.path.join(dir_name, modname + '.py'), 'w') as module_file:
+                    module_file.write(source)
+
+            folder_patch = mock.patch.object(Registry, '_get_episode_folder',
+                                             return_value=dir_name)
+            episode_patch = mock.patch.object(Registry, 'get_current_episode',
+                                              return_value={'name': episode_name})
+            alternative_dir_patch = mock.patch('eosclubhouse.libquest.get_alternative_quests_dir',
+                                               return_value=os.path.join(tmpdir, 'quests'))
+
+            with folder_patch, episode_patch, alternative_dir_patch:
+                yield tmpdir, dir_name
+
     def test_default_episode(self):
         Registry.load_current_episode()
         self.assertEqual(Registry.get_loaded_episode_name(), config.DEFAULT_EPISODE_NAME)
+
+    def test_gss_handler_count(self):
+        """Tests that loading episodes doesn't add handlers to the game state service."""
+        Registry._reset()
+        Registry.load_current_episode()
+        proxy = GameStateService._proxy
+        self.assertEqual(GameStateService.get_handler_count(), 1)
+        self.assertEqual(proxy.get_signal_handler_count(), 1)
+
+        for _unused in range(3):
+            Registry._reset()
+            Registry.load_current_episode()
+            self.assertEqual(GameStateService.get_handler_count(), 1)
+            self.assertEqual(proxy.get_signal_handler_count(), 1)
+
+        Registry._reset()
+
+    def test_reload_module(self):
+        Registry.load_current_episode()
+        n_quest_sets = len(Registry.get_quest_sets())
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            quests_dir = os.path.join(tmpdir, 'quests')
+            os.mkdir(quests_dir)
+            module_path = os.path.join(quests_dir, 'phonyreload.py')
+
+            with open(module_path, 'w') as module_file:
+                module_file.write(_PHONY_MODULE.format(order=1))
+            Registry.reload_module(quests_dir, 'phonyreload')
+
+            self.assertEqual(len(Registry.get_quest_sets()), n_quest_sets + 1)
+            quest = Registry.get_quest_by_name('PhonyReloadQuest')
+            self.assertEqual(quest.get_pathway_order(), 1)
+
+            # Changing the module replaces its quests and quest sets.
+            with open(module_path, 'w') as module_file:
+                module_file.write(_PHONY_MODULE.format(order=2))
+            Registry.reload_module(quests_dir, 'phonyreload')
+
+            self.assertEqual(len(Registry.get_quest_sets()), n_quest_sets + 1)
+            quest_set = Registry.get_quest_set_by_name('PhonyReloadPathWay')
+            self.assertEqual([q.get_id() for q in quest_set.get_quests()], ['PhonyReloadQuest'])
+            self.assertEqual(quest_set.get_quests()[0].get_pathway_order(), 2)
+
+            # Removing the module forgets them.
+            os.remove(module_path)
+            Registry.reload_module(quests_dir, 'phonyreload')
+
+            self.assertEqual(len(Registry.get_quest_sets()), n_quest_sets)
+            self.assertIsNone(Registry.get_quest_by_name('PhonyReloadQuest'))
+
+        Registry._reset()
+
+    def test_manifest(self):
+        """Tests that the manifest lists the same quests as loading the episode."""
+        Registry.load_current_episode()
+        quest_ids = OrderedDict(
+            (quest_set.get_id(), [quest.get_id() for quest in quest_set.get_quests()])
+            for quest_set in Registry.get_quest_sets())
+
+        episode_folder = Registry._get_episode_folder(config.DEFAULT_EPISODE_NAME)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest_path = os.path.join(tmpdir, 'quests.manifest')
+            write_manifest(manifest_path, build_manifest([episode_folder]))
+
+            manifest_patch = mock.patch.multiple(Registry, _manifest=QuestManifest(manifest_path),
+                                                 _manifest_opened=True)
+            alternative_dir_patch = mock.patch('eosclubhouse.libquest.get_alternative_quests_dir',
+                                               return_value=os.path.join(tmpdir, 'quests'))
+            with manifest_patch, alternative_dir_patch:
+                self.assertEqual(Registry.get_quest_ids_from_manifest(), quest_ids)
+
+        Registry._reset()
+
+    def test_lookups(self):
+        """Tests that the quest and quest set lookups find what scanning the quest sets finds."""
+        Registry.load_current_episode()
+
+        for quest_set in Registry.get_quest_sets():
+            self.assertIs(Registry.get_quest_set_by_name(quest_set.get_id()), quest_set)
+            self.assertIs(Registry.get_questset_for_character(quest_set.get_character()),
+                          quest_set)
+            for quest in quest_set.get_quests():
+                self.assertIs(Registry.get_quest_by_name(quest.get_id()), quest)
+                self.assertIs(Registry.get_questset_for_quest(quest), quest_set)
+
+        self.assertIsNone(Registry.get_quest_by_name('NotAQuest'))
+        self.assertIsNone(Registry.get_quest_set_by_name('NotAQuestSet'))
+        self.assertIsNone(Registry.get_questset_for_character('nobody'))
+
+        Registry._reset()
+        self.assertEqual(Registry.get_current_quests(), {})
+        self.assertIsNone(Registry.get_questset_for_character('ada'))
+
+    def test_tag_index(self):
+        """Tests that the quests found by tag are the ones of the episode with that tag."""
+        Registry.load_current_episode()
+        # Skip the classes left by the episodes loaded by other tests.
+        episode_classes = [quest_class for quest_class in Quest.__subclasses__()
+                           if quest_class.__module__.startswith(config.DEFAULT_EPISODE_NAME + '.')
+                           and getattr(sys.modules.get(quest_class.__module__),
+                                       quest_class.__name__, None) is quest_class]
+
+        for quest_set in Registry.get_quest_sets():
+            tag = quest_set.get_tag()
+            self.assertEqual(Registry.get_quest_classes_by_tag(tag),
+                             [quest_class for quest_class in episode_classes
+                              if tag in quest_class.get_tags()])
+
+        self.assertEqual(Registry.get_quest_classes_by_tag_prefix('difficulty'),
+                         [quest_class for quest_class in episode_classes
+                          if any(tag.startswith('difficulty:')
+                                 for tag in quest_class.get_tags())])
+        self.assertEqual(Registry.get_quest_classes_by_tag('pathway:nowhere'), [])
+
+        # The classes of the unloaded modules are forgotten.
+        Registry._reset()
+        for quest_class in episode_classes:
+            self.assertNotIn(quest_class, Registry._quest_classes)
+
+    def test_load_constructs_quests_once(self):
+        """Tests that loading the quests constructs every quest only once."""
+        episode_name = 'phonyloadep'
+        with self._phony_episode(episode_name) as (_tmpdir, dir_name):
+            Registry._reset()
+            Registry._loaded_episode = episode_name
+
+            # The configuration of every quest is loaded once, when it's constructed.
+            constructed = []
+            load_conf = Quest.load_conf
+
+            def _load_conf(quest):
+                constructed.append(quest.get_id())
+                load_conf(quest)
+
+            loaded_cb = mock.Mock()
+            registry = Registry.get_or_create()
+            handler = registry.connect('quest-sets-loaded', loaded_cb)
+            with mock.patch.object(Quest, 'load_conf', _load_conf):
+                Registry.load(dir_name)
+            registry.disconnect(handler)
+
+            self.assertEqual(sorted(constructed), ['TaggedQuest', 'UntaggedQuest'])
+            self.assertEqual([quest.get_id() for quest in
+                              Registry.get_quest_set_by_name('PhonyLoadPathWay').get_quests()],
+                             ['TaggedQuest', 'UntaggedQuest'])
+            loaded_cb.assert_called_once_with(registry)
+            self.assertEqual(Registry._fetched_conf, {})
+
+        Registry._reset()
+
+    def test_resident_episodes(self):
+        """Tests that switching back to an episode loaded before doesn't load it again."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for episode_name in ['phonyresa', 'phonyresb', 'phonyresc']:
+                os.mkdir(os.path.join(tmpdir, episode_name))
+                with open(os.path.join(tmpdir, episode_name, 'phonyreload.py'),
+                          'w') as module_file:
+                    module_file.write(_PHONY_MODULE.format(order=1))
+
+            current_episode = {'name': None}
+
+            def switch_to(episode_name):
+                current_episode['name'] = episode_name
+                Registry.load_current_episode()
+                return Registry.get_quest_by_name('PhonyReloadQuest')
+
+            folder_patch = mock.patch.object(
+                Registry, '_get_episode_folder',
+                side_effect=lambda episode_name: os.path.join(tmpdir, episode_name))
+            episode_patch = mock.patch.object(Registry, 'get_current_episode',
+                                              side_effect=lambda: dict(current_episode))
+            resident_patch = mock.patch.object(Registry, '_max_resident_episodes', 1)
+            alternative_dir_patch = mock.patch('eosclubhouse.libquest.get_alternative_quests_dir',
+                                               return_value=os.path.join(tmpdir, 'quests'))
+
+            with folder_patch, episode_patch, resident_patch, alternative_dir_patch:
+                Registry._reset()
+                quest_a = switch_to('phonyresa')
+                module_a = sys.modules['phonyresa.phonyreload']
+                self.assertIsNot(switch_to('phonyresb'), quest_a)
+
+                # The resident episode is used again, with the game state changed meanwhile.
+                GameStateService().set('quest.PhonyReloadQuest', {'complete': True})
+                self.assertIs(switch_to('phonyresa'), quest_a)
+                self.assertIs(sys.modules['phonyresa.phonyreload'], module_a)
+                self.assertTrue(quest_a.complete)
+
+                # Only one episode is kept besides the loaded one.
+                switch_to('phonyresc')
+                self.assertEqual(list(Registry._resident_episodes), ['phonyresa'])
+                self.assertNotIn('phonyresb.phonyreload', sys.modules)
+
+                Registry._reset()
+                self.assertNotIn('phonyresa.phonyreload', sys.modules)
+                self.assertNotIn('phonyresc.phonyreload', sys.modules)
+
+    def test_load_current_episode_async(self):
+        """Tests that the episode can be loaded in the main loop, adding its quest sets."""
+        registry = Registry.get_or_create()
+        added_cb = mock.Mock()
+        handler = registry.connect('quest-set-added', added_cb)
+        context = GLib.MainContext.default()
+
+        with self._phony_episode('phonyasyncep'):
+            Registry._reset()
+            loaded_cb = mock.Mock()
+            Registry.load_current_episode_async(loaded_cb)
+
+            # Nothing is loaded until the main loop runs.
+            self.assertEqual(Registry.get_quest_sets(), [])
+            while not loaded_cb.called:
+                context.iteration(True)
+
+            loaded_cb.assert_called_once_with(None)
+            quest_set = Registry.get_quest_set_by_name('PhonyLoadPathWay')
+            self.assertEqual(Registry.get_quest_sets(), [quest_set])
+            added_cb.assert_called_once_with(registry, quest_set)
+            self.assertIsNone(Registry._pending_episode_load)
+
+            # Loading it synchronously finishes the asynchronous load.
+            Registry._reset()
+            loaded_cb = mock.Mock()
+            Registry.load_current_episode_async(loaded_cb)
+            Registry.load_current_episode()
+            self.assertIsNotNone(Registry.get_quest_set_by_name('PhonyLoadPathWay'))
+            while not loaded_cb.called:
+                context.iteration(True)
+            loaded_cb.assert_called_once_with(None)
+
+            # A load that fails passes its error to the callback.
+            Registry._reset()
+            loaded_cb = mock.Mock()
+            error = ValueError('Phony error')
+            with mock.patch.object(Registry, '_instantiate_quest_set', side_effect=error), \
+                    self.assertLogs('eosclubhouse', 'ERROR'):
+                Registry.load_current_episode_async(loaded_cb)
+                while not loaded_cb.called:
+                    context.iteration(True)
+            loaded_cb.assert_called_once_with(error)
+            self.assertIsNone(Registry._pending_episode_load)
+
+            # The offers are held until all the quest sets are loaded.
+            Registry._reset()
+            loaded_cb = mock.Mock()
+            with mock.patch.object(Registry, 'try_offer_quest') as try_offer_quest:
+                Registry.load_current_episode_async(loaded_cb)
+                Registry.queue_offer_quest()
+                while not loaded_cb.called:
+                    context.iteration(True)
+                try_offer_quest.assert_not_called()
+
+                while context.iteration(False):
+                    pass
+                try_offer_quest.assert_called_once_with()
+
+            Registry._reset()
+
+        registry.disconnect(handler)
+
+    def test_snapshot(self):
+        """Tests that the episode is loaded from the snapshot and reconciled afterwards."""
+        with self._phony_episode('phonysnapep') as (tmpdir, _dir_name):
+            snapshot_path_patch = mock.patch.object(
+                Registry, '_get_snapshot_path',
+                return_value=os.path.join(tmpdir, 'cache', 'snapshot.json'))
+
+            gss = GameStateService()
+            gss_get = GameStateService.get
+            read_keys = []
+
+            def _get(gss, key, *args, **kwargs):
+                read_keys.append(key)
+                return gss_get(gss, key, *args, **kwargs)
+
+            with snapshot_path_patch:
+                Registry._reset()
+                gss.set('quest.TaggedQuest', {'complete': True})
+                with mock.patch.object(Registry, '_snapshot_opened', True):
+                    Registry.load_current_episode()
+                Registry.save_snapshot()
+
+                # The game state changes while the app is not running.
+                Registry._reset()
+                gss.set('quest.UntaggedQuest', {'complete': True})
+
+                with mock.patch.object(Registry, '_snapshot_opened', False), \
+                        mock.patch.object(GameStateService, 'get', _get):
+                    Registry.load_current_episode()
+                    self.assertEqual([key for key in read_keys if key.startswith('quest.')], [])
+
+                    tagged_quest = Registry.get_quest_by_name('TaggedQuest')
+                    untagged_quest = Registry.get_quest_by_name('UntaggedQuest')
+                    self.assertTrue(tagged_quest.complete)
+                    self.assertFalse(untagged_quest.complete)
+
+                    Registry._reconcile_snapshot()
+
+                self.assertIsNone(Registry._snapshot)
+                self.assertTrue(tagged_quest.complete)
+                self.assertTrue(untagged_quest.complete)
+
+                Registry._reset()
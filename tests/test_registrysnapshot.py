@@ -0,0 +1,87 @@
+#
+# Copyright © 2020 Endless OS Foundation LLC.
+#
+# This file is part of clubhouse
+# (see https://github.com/endlessm/clubhouse).
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+#
+#
+import os
+import tempfile
+import unittest
+
+from eosclubhouse.registrysnapshot import RegistrySnapshot, get_content_version
+
+
+class TestRegistrySnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._quest_folder = os.path.join(self._tmpdir.name, 'phonyep')
+        os.mkdir(self._quest_folder)
+        self._write_module('phonyquest', 'QUEST = 1\n')
+        self._path = os.path.join(self._tmpdir.name, 'cache', 'snapshot.json')
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _write_module(self, modname, source):
+        with open(os.path.join(self._quest_folder, modname + '.py'), 'w') as module_file:
+            module_file.write(source)
+
+    def test_write_and_read(self):
+        """Tests that a snapshot is read back as it was written."""
+        snapshot = RegistrySnapshot('1.0', get_content_version(self._quest_folder), 'phonyep',
+                                    achievement_points={'PATHWAY:ART': 3})
+        snapshot.add_quest('PhonyQuest', {'complete': True})
+        snapshot.write(self._path)
+
+        read_snapshot = RegistrySnapshot.read(self._path)
+        self.assertEqual(read_snapshot.quests, snapshot.quests)
+        self.assertEqual(read_snapshot.achievement_points, {'PATHWAY:ART': 3})
+        self.assertEqual(read_snapshot.get_quest_conf('PhonyQuest'), {'complete': True})
+        self.assertIsNone(read_snapshot.get_quest_conf('OtherQuest'))
+
+        # The configuration is copied, so it can be modified by the quests.
+        read_snapshot.get_quest_conf('PhonyQuest')['complete'] = False
+        self.assertEqual(read_snapshot.get_quest_conf('PhonyQuest'), {'complete': True})
+
+    def test_invalid_snapshots(self):
+        """Tests that missing or broken snapshots are not read."""
+        self.assertIsNone(RegistrySnapshot.read(self._path))
+
+        os.makedirs(os.path.dirname(self._path))
+        for contents in ['not json', '[]', '{"version": 0}', '{"version": 1}']:
+            with open(self._path, 'w') as snapshot_file:
+                snapshot_file.write(contents)
+            self.assertIsNone(RegistrySnapshot.read(self._path))
+
+    def test_validity(self):
+        """Tests that a snapshot is only valid for the same app, content and episode."""
+        content_version = get_content_version(self._quest_folder)
+        snapshot = RegistrySnapshot('1.0', content_version, 'phonyep')
+
+        self.assertTrue(snapshot.is_valid_for('1.0', content_version, 'phonyep'))
+        self.assertFalse(snapshot.is_valid_for('1.1', content_version, 'phonyep'))
+        self.assertFalse(snapshot.is_valid_for('1.0', content_version, 'otherep'))
+
+        self._write_module('otherquest', 'QUEST = 2\n')
+        self.assertFalse(snapshot.is_valid_for('1.0', get_content_version(self._quest_folder),
+                                               'phonyep'))
+
+        self.assertIsNone(get_content_version(os.path.join(self._tmpdir.name, 'missing')))
+        self.assertFalse(snapshot.is_valid_for('1.0', None, 'phonyep'))
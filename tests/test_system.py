@@ -0,0 +1,312 @@
+#
+# Copyright © 2020 Endless OS Foundation LLC.
+#
+# This file is part of clubhouse
+# (see https://github.com/endlessm/clubhouse).
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+from gi.repository import GLib
+from eosclubhouse.system import GameStateService
+from clubhouseunittest import ClubhouseTestCase, _GSSMockProxy
+from unittest import mock
+
+
+# The test cases replace it with set(), but these tests use the real one.
+_set_async = GameStateService.set_async
+
+
+class _KeyedGSSMockProxy(_GSSMockProxy):
+
+    __state__ = {}
+
+    def __init__(self):
+        super().__init__()
+        self.keys_set = []
+
+    def Set(self, _variant_format, key, variant, result_handler=None, error_handler=None,
+            user_data=None):
+        self.keys_set.append(key)
+        self.__state__[key] = variant.unpack()
+        self.emit_changed(key, variant)
+        if result_handler is not None:
+            result_handler(self, None, user_data)
+
+    def emit_changed(self, key, variant):
+        self.emit('g-signal', 'phony', 'changed', GLib.Variant('(sv)', (key, variant)))
+
+
+class _FailingGSSMockProxy(_KeyedGSSMockProxy):
+
+    def Set(self, _variant_format, key, variant, result_handler=None, error_handler=None,
+            user_data=None):
+        error = GLib.Error('Phony error')
+        if error_handler is None:
+            raise error
+        error_handler(self, error, user_data)
+
+
+class TestGameStateServiceCache(ClubhouseTestCase):
+
+    def setUp(self):
+        self._mock_proxy = GameStateService._proxy
+        GameStateService._proxy = _KeyedGSSMockProxy()
+        self._gss = GameStateService()
+        self._set_async_patch = mock.patch.object(GameStateService, 'set_async', _set_async)
+        self._set_async_patch.start()
+
+    def tearDown(self):
+        self._set_async_patch.stop()
+        GameStateService._proxy = self._mock_proxy
+
+    def _get_misses(self, key, *args):
+        misses = GameStateService.get_cache_stats()['misses']
+        value = self._gss.get(key, *args)
+        return value, GameStateService.get_cache_stats()['misses'] - misses
+
+    def test_reads_are_cached(self):
+        """Tests that a key is read from the service only once, also if it's missing."""
+        GameStateService._proxy.__state__['phony.key'] = {'complete': True}
+
+        self.assertEqual(self._get_misses('phony.key'), ({'complete': True}, 1))
+        self.assertEqual(self._get_misses('phony.key'), ({'complete': True}, 0))
+        self.assertEqual(self._get_misses('phony.missing', 'default'), ('default', 1))
+        self.assertEqual(self._get_misses('phony.missing', 'default'), ('default', 0))
+
+        # The values read can be modified without modifying the cache.
+        self._gss.get('phony.key')['complete'] = False
+        self.assertEqual(self._get_misses('phony.key'), ({'complete': True}, 0))
+
+    def test_writes_are_cached(self):
+        """Tests that the local writes and the changes signaled by the service are cached."""
+        self._gss.set('phony.key', {'complete': True})
+        self.assertEqual(self._get_misses('phony.key'), ({'complete': True}, 0))
+
+        # Another process changes the key.
+        GameStateService._proxy.emit_changed('phony.key',
+                                              GLib.Variant('a{sv}',
+                                                           {'complete': GLib.Variant('b', False)}))
+        self.assertEqual(self._get_misses('phony.key'), ({'complete': False}, 0))
+
+        # Without knowing what changed, everything is read again.
+        GameStateService._proxy.emit('g-signal', 'phony', 'changed', None)
+        self.assertEqual(self._get_misses('phony.key'), ({'complete': True}, 1))
+
+        self._gss.reset()
+        self.assertEqual(self._get_misses('phony.key'), (None, 1))
+
+    def test_failed_writes(self):
+        """Tests that the value of a failed write is not cached, nor hides later changes."""
+        GameStateService._proxy = _FailingGSSMockProxy()
+        GameStateService._proxy.__state__['phony.key'] = {'complete': False}
+
+        with self.assertRaises(GLib.Error):
+            self._gss.set('phony.key', {'complete': True})
+        self.assertEqual(self._get_misses('phony.key'), ({'complete': False}, 1))
+
+        self._gss.set_async('phony.key', {'complete': True})
+        self.assertEqual(self._get_misses('phony.key'), ({'complete': False}, 1))
+
+        GameStateService._proxy.emit_changed('phony.key',
+                                              GLib.Variant('a{sv}',
+                                                           {'complete': GLib.Variant('b', True)}))
+        self.assertEqual(self._get_misses('phony.key'), ({'complete': True}, 0))
+
+    def test_writes_without_signal(self):
+        """Tests that the changes after a write are cached, even if it wasn't signaled."""
+        with mock.patch.object(_KeyedGSSMockProxy, 'emit_changed'):
+            self._gss.set('phony.key', {'complete': True})
+            self._gss.set_async('phony.key', {'complete': False})
+
+        GameStateService._proxy.emit_changed('phony.key',
+                                              GLib.Variant('a{sv}',
+                                                           {'complete': GLib.Variant('b', True)}))
+        self.assertEqual(self._get_misses('phony.key'), ({'complete': True}, 0))
+
+    def test_get_many(self):
+        """Tests that many keys are read at once, only the ones that are not cached."""
+        GameStateService._proxy.__state__.update({'quest.A': {'complete': True},
+                                                  'item.a': {'used': False}})
+        self.assertEqual(self._get_misses('quest.A'), ({'complete': True}, 1))
+
+        misses = GameStateService.get_cache_stats()['misses']
+        self.assertEqual(self._gss.get_many(['quest.A', 'item.a', 'quest.Missing', 'quest.A'],
+                                            value_if_missing={}),
+                         {'quest.A': {'complete': True}, 'item.a': {'used': False},
+                          'quest.Missing': {}})
+        self.assertEqual(GameStateService.get_cache_stats()['misses'] - misses, 2)
+
+        self.assertEqual(self._get_misses('item.a'), ({'used': False}, 0))
+        self.assertEqual(self._get_misses('quest.Missing', 'default'), ('default', 0))
+
+    def test_handles(self):
+        """Tests that the handles share the only handler of the service's signal."""
+        changes = []
+        handles = [GameStateService() for _unused in range(3)]
+        handles[0].connect('changed', lambda _impl: changes.append(None))
+        self.assertEqual(GameStateService.get_handler_count(), 1)
+        self.assertEqual(GameStateService._proxy.get_signal_handler_count(), 1)
+
+        handles[1].set('phony.key', {'complete': True})
+        self.assertEqual(changes, [None])
+        self.assertEqual(handles[2].get('phony.key'), {'complete': True})
+
+    def test_batch(self):
+        """Tests that the writes of a batch are sent at its end, once per key."""
+        proxy = GameStateService._proxy
+        with self._gss.batch():
+            self._gss.set('phony.key', {'complete': False})
+            with GameStateService().batch():
+                GameStateService().update('phony.key', {'complete': True, 'used': False})
+            self._gss.set_async('phony.other', {'locked': False})
+            self._gss.update('phony.key', {'used': True})
+
+            # Nothing is sent yet, but the values can be read back.
+            self.assertEqual(proxy.keys_set, [])
+            self.assertEqual(self._gss.get('phony.key'), {'complete': True, 'used': True})
+
+        self.assertEqual(proxy.keys_set, ['phony.other', 'phony.key'])
+        self.assertEqual(proxy.__state__['phony.key'], {'complete': True, 'used': True})
+        self.assertEqual(self._get_misses('phony.key'), ({'complete': True, 'used': True}, 0))
+
+        # The writes of a batch that raises are not sent.
+        with self.assertRaises(ValueError):
+            with self._gss.batch():
+                self._gss.set('phony.key', {'complete': False})
+                raise ValueError()
+
+        self.assertEqual(proxy.keys_set, ['phony.other', 'phony.key'])
+        self.assertEqual(self._gss.get('phony.key'), {'complete': True, 'used': True})
+
+        # Only the writes of a nested batch that raises are discarded.
+        proxy.keys_set = []
+        with self._gss.batch():
+            self._gss.set('phony.key', {'complete': False})
+            with self.assertRaises(ValueError):
+                with self._gss.batch():
+                    self._gss.set('phony.key', {'used': False})
+                    self._gss.set('phony.nested', {'used': False})
+                    raise ValueError()
+
+            self.assertEqual(self._gss.get('phony.key'), {'complete': False})
+            self.assertEqual(self._get_misses('phony.nested'), (None, 1))
+
+        self.assertEqual(proxy.keys_set, ['phony.key'])
+        self.assertEqual(proxy.__state__['phony.key'], {'complete': False})
+
+
+class TestGameStateServiceWatches(ClubhouseTestCase):
+
+    def setUp(self):
+        self._mock_proxy = GameStateService._proxy
+        GameStateService._proxy = _KeyedGSSMockProxy()
+        self._gss = GameStateService()
+        self._changes = []
+
+    def tearDown(self):
+        GameStateService._proxy = self._mock_proxy
+
+    def _changed_cb(self, key, name):
+        self._changes.append((name, key))
+
+    def test_watches(self):
+        """Tests that only the watches of a key or of its prefixes are called when it changes."""
+        watch_ids = [
+            self._gss.watch('quest.Foo', self._changed_cb, 'foo'),
+            self._gss.watch('quest.FooBar', self._changed_cb, 'foobar'),
+            self._gss.watch_prefix('quest.', self._changed_cb, 'quests'),
+            self._gss.watch_prefix('item.', self._changed_cb, 'items'),
+        ]
+
+        self._gss.set('quest.Foo', {'complete': True})
+        self._gss.set('quest.Other', {'complete': True})
+        self._gss.set('item.key', {'used': False})
+        self._gss.set('clubhouse.News', {'last-seen': ''})
+        self.assertEqual(sorted(self._changes), [('foo', 'quest.Foo'), ('items', 'item.key'),
+                                                 ('quests', 'quest.Foo'),
+                                                 ('quests', 'quest.Other')])
+
+        # Without knowing what changed, all the watches are called.
+        self._changes = []
+        GameStateService._proxy.emit('g-signal', 'phony', 'changed', None)
+        self.assertEqual(sorted(self._changes), [('foo', None), ('foobar', None),
+                                                 ('items', None), ('quests', None)])
+
+        for watch_id in watch_ids[1:]:
+            GameStateService.unwatch(watch_id)
+
+        self._changes = []
+        self._gss.set('quest.FooBar', {'complete': True})
+        self._gss.set('quest.Foo', {'complete': False})
+        self.assertEqual(self._changes, [('foo', 'quest.Foo')])
+
+        GameStateService.unwatch(watch_ids[0])
+        self.assertEqual(len(GameStateService._watch_trie), 0)
+
+    def test_changes_without_key(self):
+        """Tests that all the watches are called when the service doesn't signal the key."""
+        GameStateService._proxy = _GSSMockProxy()
+        watch_ids = [
+            self._gss.watch('quest.Foo', self._changed_cb, 'foo'),
+            self._gss.watch_prefix('item.', self._changed_cb, 'items'),
+        ]
+        self._gss.get('item.key')
+        misses = GameStateService.get_cache_stats()['misses']
+
+        self._gss.set('quest.Foo', {'complete': True})
+        self.assertEqual(sorted(self._changes), [('foo', None), ('items', None)])
+        self.assertEqual(GameStateService.get_handler_count(), 1)
+
+        # Nothing cached can be trusted after the change.
+        self._gss.get('item.key')
+        self.assertEqual(GameStateService.get_cache_stats()['misses'], misses + 1)
+
+        for watch_id in watch_ids:
+            GameStateService.unwatch(watch_id)
+
+    def test_batch_watches(self):
+        """Tests that the watches of the keys written in a batch are called once per key."""
+        watch_ids = [
+            self._gss.watch('quest.Foo', self._changed_cb, 'foo'),
+            self._gss.watch_prefix('quest.', self._changed_cb, 'quests'),
+        ]
+        expected_changes = [('foo', 'quest.Foo'), ('quests', 'quest.Foo'),
+                            ('quests', 'quest.Other')]
+
+        with self._gss.batch():
+            self._gss.set('quest.Foo', {'complete': False})
+            self._gss.set('quest.Other', {'complete': True})
+            self._gss.set('quest.Foo', {'complete': True})
+            self.assertEqual(self._changes, [])
+
+        self.assertEqual(sorted(self._changes), expected_changes)
+
+        # The watches are called even if the service doesn't signal the changes.
+        self._changes = []
+        with mock.patch.object(_KeyedGSSMockProxy, 'emit_changed'):
+            with self._gss.batch():
+                self._gss.set('quest.Foo', {'complete': False})
+                self._gss.set('quest.Other', {'complete': False})
+
+        self.assertEqual(sorted(self._changes), expected_changes)
+        self.assertEqual(GameStateService._batch_changes, set())
+
+        # The changes signalled by the service later on are dispatched.
+        self._changes = []
+        GameStateService._proxy.emit_changed('quest.Foo', GLib.Variant('a{sv}', {}))
+        self.assertEqual(sorted(self._changes), expected_changes[:2])
+
+        for watch_id in watch_ids:
+            GameStateService.unwatch(watch_id)
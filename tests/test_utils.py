@@ -19,9 +19,14 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
 import datetime
+import os
+import tempfile
 import unittest
 
-from eosclubhouse.utils import convert_variant_arg, Version
+from gi.repository import GLib
+from eosclubhouse.utils import convert_variant_arg, ContentPackDB, DateBoundaryScheduler, \
+    EpisodesDB, NewsFeedDB, QuestStringCatalog, Version
+from unittest import mock
 
 
 class TestVariantConversion(unittest.TestCase):
@@ -112,3 +117,350 @@ class TestVersion(unittest.TestCase):
         self.assertTrue(Version('1.2.0') != Version('1.2.1'))
         self.assertTrue(Version('1.2.0') != Version('1.1.0'))
         self.assertTrue(Version('1.2.0') != Version('2.2.0'))
+
+
+class TestQuestStringCatalogShards(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._strings_dir = os.path.join(self._tmpdir.name, 'quests_strings')
+        os.mkdir(self._strings_dir)
+
+        for name, keys in [('noquest', ['NOQUEST_ADA_NOTHING']),
+                           ('questa', ['QUESTA_HELLO', 'QUESTA_BYE', 'QUESTA_HELLO_HINT1',
+                                       'QUESTA_HELLO_HINT2', 'QUESTA_HELLO_HINT4',
+                                       'QUESTA_INFO_1', 'QUESTA_INFO_2', 'QUESTA_INFO_3']),
+                           ('questb', ['QUESTB_HELLO']),
+                           ('story_ada1', ['STORY_ADA1_HELLO'])]:
+            with open(os.path.join(self._strings_dir, name + '.csv'), 'w') as csv_file:
+                for key in keys:
+                    csv_file.write('{},{} text,,,,\n'.format(key, key))
+
+        # Isolate the catalog state and the paths used by this test.
+        mock.patch.multiple(QuestStringCatalog, _csv_dict={}, _shard_paths={}, _shards={},
+                            _file_contents={}, _catalog=None, _loaded=False,
+                            _max_shards=1).start()
+        mock.patch.object(QuestStringCatalog, '_open_catalog', return_value=None).start()
+        mock.patch('eosclubhouse.utils.get_alternative_quests_dir',
+                   return_value=os.path.join(self._tmpdir.name, 'alternative')).start()
+
+        QuestStringCatalog.load_csv(self._strings_dir)
+
+    def tearDown(self):
+        mock.patch.stopall()
+        self._tmpdir.cleanup()
+
+    def test_shards_are_loaded_lazily(self):
+        """Tests that only the pinned strings are loaded until a quest's strings are needed."""
+        self.assertEqual(list(QuestStringCatalog.get_dict()), ['NOQUEST_ADA_NOTHING'])
+        self.assertEqual(len(QuestStringCatalog._shards), 0)
+
+        self.assertEqual(QuestStringCatalog.get_string('QUESTA_BYE'), 'QUESTA_BYE text')
+        self.assertEqual(list(QuestStringCatalog._shards), ['QUESTA'])
+
+        self.assertEqual(QuestStringCatalog.get_string('STORY_ADA1_HELLO'),
+                         'STORY_ADA1_HELLO text')
+        self.assertIsNone(QuestStringCatalog.get_info('QUESTC_HELLO'))
+
+    def test_shards_are_evicted(self):
+        """Tests that the least recently used shards are evicted, but pinned ones are kept."""
+        self.assertIsNotNone(QuestStringCatalog.get_info('QUESTA_HELLO'))
+        self.assertIsNotNone(QuestStringCatalog.get_info('QUESTB_HELLO'))
+        self.assertEqual(list(QuestStringCatalog._shards), ['QUESTB'])
+
+        # Evicted shards are loaded again when needed.
+        self.assertEqual(QuestStringCatalog.get_string('QUESTA_HELLO'), 'QUESTA_HELLO text')
+        self.assertEqual(list(QuestStringCatalog._shards), ['QUESTA'])
+
+        self.assertEqual(QuestStringCatalog.get_string('NOQUEST_ADA_NOTHING'),
+                         'NOQUEST_ADA_NOTHING text')
+
+    def test_hint_and_loop_keys(self):
+        """Tests that the hints and loop messages are found in order and without gaps."""
+        self.assertEqual(QuestStringCatalog.get_hint_keys('QUESTA_HELLO'),
+                         ['QUESTA_HELLO', 'QUESTA_HELLO_HINT1', 'QUESTA_HELLO_HINT2'])
+        self.assertEqual(QuestStringCatalog.get_hint_keys('QUESTA_BYE'), ['QUESTA_BYE'])
+
+        self.assertEqual(list(QuestStringCatalog.get_loop_messages('QUESTA_INFO')),
+                         ['QUESTA_INFO_1', 'QUESTA_INFO_2', 'QUESTA_INFO_3'])
+        self.assertEqual(list(QuestStringCatalog.get_loop_messages('QUESTA_INFO', start=2)),
+                         ['QUESTA_INFO_2', 'QUESTA_INFO_3'])
+
+    def test_keys_with_prefix(self):
+        """Tests that all the keys under a prefix are enumerated, loading their shards."""
+        self.assertEqual(QuestStringCatalog.get_keys_with_prefix('QUESTA_INFO'),
+                         ['QUESTA_INFO_1', 'QUESTA_INFO_2', 'QUESTA_INFO_3'])
+        self.assertEqual(QuestStringCatalog.get_keys_with_prefix('QUEST'),
+                         ['QUESTA_BYE', 'QUESTA_HELLO', 'QUESTA_HELLO_HINT1',
+                          'QUESTA_HELLO_HINT2', 'QUESTA_HELLO_HINT4', 'QUESTA_INFO_1',
+                          'QUESTA_INFO_2', 'QUESTA_INFO_3', 'QUESTB_HELLO'])
+        self.assertEqual(QuestStringCatalog.get_keys_with_prefix('NOQUEST_'),
+                         ['NOQUEST_ADA_NOTHING'])
+
+    def _write_csv(self, csv_path, rows):
+        with open(csv_path, 'w') as csv_file:
+            for key, text in rows:
+                csv_file.write('{},{},,,,\n'.format(key, text))
+
+    def test_reload_shard_file(self):
+        """Tests that reloading a shard's file makes it be parsed again."""
+        self.assertIsNone(QuestStringCatalog.get_info('QUESTB_BYE'))
+
+        csv_path = os.path.join(self._strings_dir, 'questb.csv')
+        self._write_csv(csv_path, [('QUESTB_HELLO', 'Hi'), ('QUESTB_BYE', 'Bye')])
+        QuestStringCatalog.reload_csv_file(csv_path)
+
+        self.assertEqual(QuestStringCatalog.get_string('QUESTB_HELLO'), 'Hi')
+        self.assertEqual(QuestStringCatalog.get_string('QUESTB_BYE'), 'Bye')
+
+        os.remove(csv_path)
+        QuestStringCatalog.reload_csv_file(csv_path)
+        self.assertIsNone(QuestStringCatalog.get_info('QUESTB_HELLO'))
+
+    def test_reload_pinned_file(self):
+        """Tests that reloading an overriding file only updates its strings."""
+        alternative_dir = os.path.join(self._tmpdir.name, 'alternative', 'quests_strings')
+        os.makedirs(alternative_dir)
+        csv_path = os.path.join(alternative_dir, 'noquest.csv')
+
+        self._write_csv(csv_path, [('NOQUEST_ADA_NOTHING', 'Overridden'),
+                                   ('NOQUEST_ADA_NEW', 'New')])
+        QuestStringCatalog.reload_csv_file(csv_path)
+        self.assertEqual(QuestStringCatalog.get_string('NOQUEST_ADA_NOTHING'), 'Overridden')
+        self.assertEqual(QuestStringCatalog.get_keys_with_prefix('NOQUEST_'),
+                         ['NOQUEST_ADA_NEW', 'NOQUEST_ADA_NOTHING'])
+
+        # Removing the file brings back the strings it was overriding.
+        os.remove(csv_path)
+        QuestStringCatalog.reload_csv_file(csv_path)
+        self.assertEqual(QuestStringCatalog.get_string('NOQUEST_ADA_NOTHING'),
+                         'NOQUEST_ADA_NOTHING text')
+        self.assertIsNone(QuestStringCatalog.get_info('NOQUEST_ADA_NEW'))
+
+
+class TestQuestStringCatalogAsync(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._strings_dir = os.path.join(self._tmpdir.name, 'quests_strings')
+        alternative_dir = os.path.join(self._tmpdir.name, 'alternative')
+        alternative_strings_dir = os.path.join(alternative_dir, 'quests_strings')
+        os.mkdir(self._strings_dir)
+        os.makedirs(alternative_strings_dir)
+
+        for csv_dir, name, rows in [
+                (self._strings_dir, 'noquest', [('NOQUEST_ADA_NOTHING', 'Shipped')]),
+                (self._strings_dir, 'questa', [('QUESTA_HELLO', 'Shipped'),
+                                               ('QUESTA_BYE', 'Shipped')]),
+                (alternative_strings_dir, 'questa', [('QUESTA_HELLO', 'Overridden')])]:
+            with open(os.path.join(csv_dir, name + '.csv'), 'w') as csv_file:
+                for key, text in rows:
+                    csv_file.write('{},{},,,,\n'.format(key, text))
+
+        mock.patch.multiple(QuestStringCatalog, _csv_dict={}, _shard_paths={}, _shards={},
+                            _file_contents={}, _catalog=None, _loaded=False,
+                            _max_shards=0, _pending_load=None).start()
+        mock.patch.object(QuestStringCatalog, '_open_catalog', return_value=None).start()
+        mock.patch('eosclubhouse.utils.get_alternative_quests_dir',
+                   return_value=alternative_dir).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+        self._tmpdir.cleanup()
+
+    def test_load_in_background(self):
+        """Tests that the strings are loaded in background, calling back in the main loop."""
+        loop = GLib.MainLoop()
+        QuestStringCatalog.load_csv_async(self._strings_dir, callback=loop.quit)
+        GLib.timeout_add_seconds(5, loop.quit)
+        loop.run()
+
+        self.assertIsNone(QuestStringCatalog._pending_load)
+        self.assertTrue(QuestStringCatalog._loaded)
+
+        # The alternative quests dir overrides the shipped strings, like in a normal load.
+        self.assertEqual(QuestStringCatalog.get_string('QUESTA_HELLO'), 'Overridden')
+        self.assertEqual(QuestStringCatalog.get_string('QUESTA_BYE'), 'Shipped')
+        self.assertEqual(QuestStringCatalog.get_keys_with_prefix('QUESTA_'),
+                         ['QUESTA_BYE', 'QUESTA_HELLO'])
+
+    def test_getting_strings_waits_for_the_load(self):
+        """Tests that using the strings before the background load finishes waits for it."""
+        callback = mock.Mock()
+        QuestStringCatalog.load_csv_async(self._strings_dir, callback=callback)
+
+        self.assertEqual(QuestStringCatalog.get_string('QUESTA_HELLO'), 'Overridden')
+        self.assertEqual(QuestStringCatalog.get_string('NOQUEST_ADA_NOTHING'), 'Shipped')
+
+        # The callback is still called, from the main loop.
+        context = GLib.MainContext.default()
+        while not callback.called:
+            context.iteration(True)
+        callback.assert_called_once_with()
+
+
+class TestNewsFeedDB(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        csv_path = os.path.join(self._tmpdir.name, 'newsfeed.csv')
+        with open(csv_path, 'w') as csv_file:
+            csv_file.write('Date,Character,ImageResource,,Text\n'
+                           '2020-03-01,ada,,,Future\n'
+                           '2020-02-01,riley,,,Second today\n'
+                           '2020-02-01,riley,,,First today\n'
+                           '2020-01-15,saniel,,,Old\n'
+                           '2020-01-20,faber,,,Not in order\n')
+
+        mock.patch.multiple(NewsFeedDB, _csv_list=[], _dates=[]).start()
+        mock.patch.object(ContentPackDB, 'get_table', return_value=None).start()
+        NewsFeedDB._load_csv(csv_path)
+
+    def tearDown(self):
+        mock.patch.stopall()
+        self._tmpdir.cleanup()
+
+    def _get_texts(self, items):
+        return [item.text for item in items]
+
+    def test_latest_items(self):
+        """Tests that the items are sorted by date and paged from the most recent one."""
+        today = datetime.date(2020, 2, 1)
+        self.assertEqual(self._get_texts(NewsFeedDB.get_latest_items(today)),
+                         ['Second today', 'First today', 'Not in order', 'Old'])
+        self.assertEqual(self._get_texts(NewsFeedDB.get_latest_items(today, offset=1, count=2)),
+                         ['First today', 'Not in order'])
+        self.assertEqual(self._get_texts(NewsFeedDB.get_latest_items(today, offset=4)), [])
+        self.assertEqual(self._get_texts(NewsFeedDB.get_latest_items(count=1)), ['Future'])
+
+    def test_count_published(self):
+        """Tests that the items published between two dates are counted."""
+        today = datetime.date(2020, 2, 1)
+        self.assertEqual(NewsFeedDB.count_published(until=today), 4)
+        self.assertEqual(NewsFeedDB.count_published(since=datetime.date(2020, 1, 15),
+                                                    until=today), 3)
+        self.assertEqual(NewsFeedDB.count_published(since=today, until=today), 0)
+        self.assertEqual(NewsFeedDB.count_published(), 5)
+
+    def test_next_date(self):
+        """Tests that the next date with items published is found."""
+        self.assertEqual(NewsFeedDB.get_next_date(datetime.date(2020, 1, 20)),
+                         datetime.date(2020, 2, 1))
+        self.assertEqual(NewsFeedDB.get_next_date(datetime.date(2020, 2, 1)),
+                         datetime.date(2020, 3, 1))
+        self.assertIsNone(NewsFeedDB.get_next_date(datetime.date(2020, 3, 1)))
+
+
+class _PhonyOwner:
+    pass
+
+
+class TestDateBoundaryScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self._now = datetime.datetime(2020, 2, 1, 12)
+        mock.patch.multiple(DateBoundaryScheduler, _boundaries=[], _timeout_id=0,
+                            _timeout_boundary=None, _now=lambda: self._now).start()
+        self._timeout_add = mock.patch.object(GLib, 'timeout_add_seconds',
+                                              return_value=1).start()
+        self._source_remove = mock.patch.object(GLib, 'source_remove').start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_single_timeout(self):
+        """Tests that only the soonest boundary has a timeout, calling back every owner once."""
+        tomorrow = datetime.datetime(2020, 2, 2)
+        owner_a = _PhonyOwner()
+        owner_b = _PhonyOwner()
+        callback = mock.Mock()
+
+        DateBoundaryScheduler.watch(owner_a, [datetime.datetime(2020, 2, 3), tomorrow,
+                                              datetime.datetime(2020, 1, 1)], callback)
+        DateBoundaryScheduler.watch(owner_b, [tomorrow], callback)
+        self._timeout_add.assert_called_once_with(12 * 60 * 60, DateBoundaryScheduler._timeout_cb)
+
+        self._now = tomorrow
+        DateBoundaryScheduler._timeout_cb()
+        self.assertEqual(callback.call_args_list, [mock.call(owner_a), mock.call(owner_b)])
+        self._timeout_add.assert_called_with(24 * 60 * 60, DateBoundaryScheduler._timeout_cb)
+
+        # Watching new boundaries replaces the old ones.
+        callback.reset_mock()
+        self._timeout_add.reset_mock()
+        DateBoundaryScheduler.watch(owner_a, [], callback)
+        self._source_remove.assert_called_once_with(1)
+        self._timeout_add.assert_not_called()
+
+        # The owners that are gone are forgotten.
+        DateBoundaryScheduler.watch(owner_b, [datetime.datetime(2020, 2, 4)], callback)
+        self._timeout_add.assert_called_once_with(2 * 24 * 60 * 60,
+                                                  DateBoundaryScheduler._timeout_cb)
+        del owner_b
+        self._now = datetime.datetime(2020, 2, 4)
+        DateBoundaryScheduler._timeout_cb()
+        callback.assert_not_called()
+
+
+class TestEpisodesDB(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        csv_path = os.path.join(self._tmpdir.name, 'episodes.csv')
+        with open(csv_path, 'w') as csv_file:
+            csv_file.write('ID,Season,Name,BadgeX,BadgeY,Description\n'
+                           'demo,demoseason,Demo,0,0,\n'
+                           'episode1,season1,One,10,20,\n'
+                           'episode2,season1,Two,,,\n'
+                           'episode3,season1,Three,,,\n')
+
+        mock.patch.multiple(EpisodesDB, _csv_dict={}, _seasons={}, _positions={},
+                            _unknown_episodes={}).start()
+        mock.patch.object(ContentPackDB, 'get_table', return_value=None).start()
+        mock.patch('eosclubhouse.utils.get_alternative_quests_dir',
+                   return_value=os.path.join(self._tmpdir.name, 'alternative')).start()
+        EpisodesDB.load_csv(csv_path, ignore_header=True)
+
+    def tearDown(self):
+        mock.patch.stopall()
+        self._tmpdir.cleanup()
+
+    def _get_ids(self, episodes):
+        return [episode.id for episode in episodes]
+
+    def test_neighbours(self):
+        """Tests that the episodes before and after one in its season are found."""
+        self.assertEqual(self._get_ids(EpisodesDB.get_episodes_in_season('season1')),
+                         ['episode1', 'episode2', 'episode3'])
+        self.assertEqual(self._get_ids(EpisodesDB.get_previous_episodes('episode3')),
+                         ['episode1', 'episode2'])
+        self.assertEqual(self._get_ids(EpisodesDB.get_next_episodes('episode1')),
+                         ['episode2', 'episode3'])
+        self.assertEqual(EpisodesDB.get_previous_episode('episode2').id, 'episode1')
+        self.assertEqual(EpisodesDB.get_next_episode('episode2').id, 'episode3')
+        self.assertIsNone(EpisodesDB.get_previous_episode('episode1'))
+        self.assertIsNone(EpisodesDB.get_next_episode('episode3'))
+        self.assertEqual(EpisodesDB.get_next_episodes('demo'), [])
+        self.assertEqual(EpisodesDB.get_episode('episode2').number, 2)
+
+    def test_shared_episodes(self):
+        """Tests that the same Episode objects are returned every time, even for unknown ids."""
+        self.assertIs(EpisodesDB.get_episode('episode1'),
+                      EpisodesDB.get_episodes_in_season('season1')[0])
+        self.assertIs(EpisodesDB.get_episode('unknown'), EpisodesDB.get_episode('unknown'))
+        self.assertEqual(EpisodesDB.get_previous_episodes('unknown'), [])
+        self.assertIsNone(EpisodesDB.get_next_episode('unknown'))
+
+    def test_season_progress(self):
+        """Tests that updating the progress of a season notifies each changed episode once."""
+        notified = []
+        for episode in EpisodesDB.get_episodes_in_season('season1'):
+            episode.connect('notify::percentage-complete',
+                            lambda episode, _pspec: notified.append(episode.id))
+
+        EpisodesDB.set_season_progress('season1', {'episode1': 100, 'episode2': 50,
+                                                   'episode3': 0})
+
+        self.assertEqual(notified, ['episode1', 'episode2'])
+        self.assertTrue(EpisodesDB.get_episode('episode1').is_complete())
+        self.assertEqual(EpisodesDB.get_episode('episode2').percentage_complete, 50)